@@ -1,11 +1,122 @@
 from dataclasses import dataclass
-from typing import Callable
+from datetime import datetime
+from typing import Callable, TYPE_CHECKING
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import Session
 from config import Config
 
+if TYPE_CHECKING:
+    from shards import ShardPool
+
 
 @dataclass
 class AppRegistry:
     config: Config
     session: Session
     now: Callable[[], int]
+    # Open per-user databases when sharding is on (config.shard_dir), the
+    # session is the catalog of users then
+    shards: 'ShardPool' = None
+    # Registry of a read-only engine of the same database for APIs which
+    # only read, so long reads don't hold the writer's connection
+    reader: 'AppRegistry' = None
+
+    def for_user(self, user_id: int) -> 'AppRegistry':
+        """
+        Get the registry of the database holding the user's rows: the
+        user's shard if sharding is on, this one otherwise.
+        """
+        if self.shards is None:
+            return self
+        return self.shards.get_app(user_id)
+
+    def for_reading(self) -> 'AppRegistry':
+        """
+        Get the registry to call read-only model APIs with: the reader if
+        there is one, this one otherwise. Close the reader's session when
+        done, so its connection goes back to the pool.
+        """
+        return self.reader if self.reader is not None else self
+
+
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+
+
+def create_read_only_engine(
+    config: Config, pool_size: int = None
+) -> Engine:
+    """
+    Create an engine opening the configured SQLite database file read-only,
+    e.g. for worker processes which must not take the write lock. Its
+    connections are query_only too, so attached archives aren't written
+    either.
+    """
+    url = make_url(config.database_uri)
+    if not url.database or url.database == ':memory:':
+        raise ValueError(
+            "In-memory database can't be opened by another connection")
+    pool_options = {} if pool_size is None else {'pool_size': pool_size}
+    engine = create_engine(
+        url.set(
+            database=f"file:{url.database}",
+            query={'mode': 'ro', 'uri': 'true'},
+        ),
+        future=True,
+        query_cache_size=config.query_cache_size,
+        **pool_options,
+    )
+    event.listen(
+        engine, 'connect',
+        lambda connection, record: connection.execute(
+            "PRAGMA query_only = ON"),
+    )
+    return engine
+
+
+def create_writer_engine(config: Config) -> Engine:
+    """
+    Create the engine of the configured database writes go through,
+    switching the database to config.journal_mode on connect.
+    """
+    engine = create_engine(
+        config.database_uri,
+        future=True,
+        query_cache_size=config.query_cache_size,
+    )
+    journal_mode = config.journal_mode.lower()
+    if journal_mode:
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(
+                f"Unknown journal mode '{config.journal_mode}', "
+                f"expected one of: {', '.join(JOURNAL_MODES)}")
+        event.listen(
+            engine, 'connect',
+            lambda connection, record: connection.execute(
+                f"PRAGMA journal_mode = {journal_mode}"),
+        )
+    return engine
+
+
+def create_app(config: Config) -> AppRegistry:
+    """
+    Create the application registry for the configured database, with a
+    registry of a pooled read-only engine as its reader unless the
+    database is in memory or config.read_pool_size is 0.
+    """
+    session = Session(create_writer_engine(config))
+    now = lambda: datetime.now()
+    app = AppRegistry(config, session, now)
+    if config.read_pool_size:
+        try:
+            reader_engine = create_read_only_engine(
+                config, config.read_pool_size)
+        except ValueError:
+            # Nothing to share with another connection
+            reader_engine = None
+        if reader_engine is not None:
+            app.reader = AppRegistry(config, Session(reader_engine), now)
+    if config.shard_dir:
+        from shards import ShardPool
+        app.shards = ShardPool(app)
+    return app
@@ -0,0 +1,111 @@
+"""
+Write latency of start/stop while an online backup runs, compared with
+no backup at all.
+
+Usage:
+    python3 -m bench.backup_latency [records]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import multiprocessing
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, TimeLog
+from models.backup import backup_database
+
+
+WRITE_SECONDS = 3
+
+
+def make_app(path: str) -> AppRegistry:
+    config = Config()
+    config.database_uri = f"sqlite:///{path}"
+    config.busy_retries = 50
+    engine = create_engine(config.database_uri, future=True)
+    return AppRegistry(config, Session(engine), datetime.now)
+
+
+def populate(path: str, records: int) -> None:
+    Base.metadata.create_all(make_app(path).session.get_bind())
+    connection = sqlite3.connect(path)
+    connection.execute("INSERT INTO users VALUES (1, 'bench')")
+    connection.executemany(
+        "INSERT INTO projects (id, user_id, name, created_at) "
+        "VALUES (?, 1, ?, 0)",
+        [(i, f"project{i}") for i in range(1, 11)]
+    )
+    connection.executemany(
+        "INSERT INTO timelog "
+        "(user_id, project_id, started_at, stoped_at, duration, comment) "
+        "VALUES (1, ?, ?, ?, 50, ?)",
+        [
+            (i % 10 + 1, i * 60, i * 60 + 50, f"comment {i} " * 5)
+            for i in range(records)
+        ]
+    )
+    connection.commit()
+    connection.close()
+
+
+def writer(path: str, latencies) -> None:
+    app = make_app(path)
+    deadline = time.perf_counter() + WRITE_SECONDS
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        TimeLog.start_project(app, 1, f"project{i % 10 + 1}")
+        latencies.append(time.perf_counter() - started)
+        i += 1
+
+
+def measure(path: str, with_backup: bool) -> list[float]:
+    with multiprocessing.Manager() as manager:
+        latencies = manager.list()
+        process = multiprocessing.Process(
+            target=writer, args=(path, latencies))
+        process.start()
+        backups = 0
+        while process.is_alive():
+            if with_backup:
+                backup_database(make_app(path), path + '.backup')
+                backups += 1
+            else:
+                time.sleep(0.1)
+        process.join()
+        if with_backup:
+            print(f"  {backups} backups done")
+        return sorted(latencies)
+
+
+def report(name: str, latencies: list[float]) -> None:
+    def percentile(p: float) -> float:
+        return latencies[int(p * (len(latencies) - 1))] * 1000
+
+    print(
+        f"{name:<16}{len(latencies):>8}{percentile(0.5):>10.2f}"
+        f"{percentile(0.95):>10.2f}{latencies[-1] * 1000:>10.2f}"
+    )
+
+
+def main(records: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'db.sqlite3')
+        populate(path, records)
+        size = os.path.getsize(path) / 2**20
+        print(f"database of {records} records, {size:.1f} MiB")
+        idle = measure(path, with_backup=False)
+        busy = measure(path, with_backup=True)
+        print(f"{'':<16}{'writes':>8}{'p50 ms':>10}{'p95 ms':>10}"
+              f"{'max ms':>10}")
+        report("no backup", idle)
+        report("during backup", busy)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) >= 2 else 200_000)
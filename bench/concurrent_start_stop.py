@@ -0,0 +1,73 @@
+"""
+Throughput of start/stop commands of one user run by several processes at
+once, which contend for the write lock of the same database file.
+
+Usage:
+    python3 -m bench.concurrent_start_stop [processes] [operations]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog
+
+
+def make_app(database_uri: str) -> AppRegistry:
+    config = Config()
+    config.database_uri = database_uri
+    config.busy_retries = 20
+    engine = create_engine(config.database_uri, future=True)
+    return AppRegistry(config, Session(engine), datetime.now)
+
+
+def hammer(database_uri: str, worker: int, operations: int) -> None:
+    app = make_app(database_uri)
+    for i in range(operations):
+        if i % 5 == 4:
+            TimeLog.stop_last_record(app, 1)
+        else:
+            TimeLog.start_project(
+                app, 1, f"project{(worker + i) % 3}", restart_anyway=True)
+
+
+def main(processes: int, operations: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_uri = f"sqlite:///{os.path.join(tmp_dir, 'db.sqlite3')}"
+        app = make_app(database_uri)
+        Base.metadata.create_all(app.session.get_bind())
+        app.session.add(User(id=1, name='Bench User'))
+        app.session.commit()
+        for i in range(3):
+            Project.add_new(app, 1, f"project{i}")
+
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        workers = [
+            context.Process(
+                target=hammer, args=(database_uri, worker, operations))
+            for worker in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+    failed = sum(worker.exitcode != 0 for worker in workers)
+    print(f"{processes} processes x {operations} operations, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{processes * operations / elapsed:.1f} operations/s, "
+          f"{failed} processes failed")
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) >= 2 else 8,
+        int(sys.argv[2]) if len(sys.argv) >= 3 else 25,
+    )
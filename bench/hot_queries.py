@@ -0,0 +1,102 @@
+"""
+Per-call overhead of the hot model lookups: legacy session.query() chains
+versus the prebuilt select() statements used by the models.
+
+Usage:
+    python3 -m bench.hot_queries [iterations]
+"""
+import sys
+import timeit
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog
+
+
+def make_app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    engine = create_engine(
+        config.database_uri,
+        future=True,
+        query_cache_size=config.query_cache_size,
+    )
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    now = lambda: datetime.fromtimestamp(1_700_000_000)
+    app = AppRegistry(config, session, now)
+
+    session.add(User(id=1, name='bench'))
+    for i in range(100):
+        session.add(Project(
+            id=i + 1, user_id=1, name=f"project{i}", created_at=0))
+    for i in range(1000):
+        session.add(TimeLog(
+            user_id=1, project_id=i % 100 + 1, started_at=i * 60,
+            stoped_at=i * 60 + 50, duration=50))
+    session.commit()
+    return app
+
+
+def legacy_last_record(app: AppRegistry) -> TimeLog:
+    return (
+        app.session.query(TimeLog)
+        .filter(TimeLog.user_id == 1)
+        .order_by(TimeLog.started_at.desc(), TimeLog.id.desc())
+        .offset(0)
+        .first()
+    )
+
+
+def legacy_get_by_name(app: AppRegistry) -> Project:
+    return (
+        app.session.query(Project)
+        .filter(Project.name == "project42", Project.user_id == 1)
+        .one()
+    )
+
+
+def legacy_find_by_name(app: AppRegistry) -> list[str]:
+    projects = (
+        app.session.query(Project.name)
+        .filter(Project.name.like("project4%"), Project.user_id == 1)
+        .all()
+    )
+    return [project[0] for project in projects]
+
+
+def main(iterations: int) -> None:
+    app = make_app()
+    cases = [
+        (
+            "get_last_time_record",
+            lambda: legacy_last_record(app),
+            lambda: TimeLog.get_last_time_record(app, 1),
+        ),
+        (
+            "Project.get_by_name",
+            lambda: legacy_get_by_name(app),
+            lambda: Project.get_by_name(app, 1, "project42"),
+        ),
+        (
+            "Project.find_by_name",
+            lambda: legacy_find_by_name(app),
+            lambda: Project.find_by_name(app, 1, "project4"),
+        ),
+    ]
+    print(f"{'query':<24}{'legacy us':>12}{'prebuilt us':>14}{'speedup':>10}")
+    for name, legacy, prebuilt in cases:
+        legacy()
+        prebuilt()
+        legacy_us = timeit.timeit(legacy, number=iterations) / iterations
+        prebuilt_us = timeit.timeit(prebuilt, number=iterations) / iterations
+        print(
+            f"{name:<24}{legacy_us * 1e6:>12.1f}{prebuilt_us * 1e6:>14.1f}"
+            f"{legacy_us / prebuilt_us:>9.2f}x"
+        )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) >= 2 else 2000)
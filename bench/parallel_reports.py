@@ -0,0 +1,100 @@
+"""
+Yearly reports of many users built by Report.get_many() with a growing
+number of worker processes, compared with a single process.
+
+Usage:
+    python3 -m bench.parallel_reports [users] [records per user per day]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, Report
+
+
+YEAR = 2023
+PROJECTS_PER_USER = 20
+NOW = datetime(YEAR + 1, 1, 1)
+
+
+def make_app(path: str) -> AppRegistry:
+    config = Config()
+    config.database_uri = f"sqlite:///{path}"
+    engine = create_engine(config.database_uri, future=True)
+    return AppRegistry(config, Session(engine), lambda: NOW)
+
+
+def populate(path: str, users: int, records_per_day: int) -> None:
+    Base.metadata.create_all(make_app(path).session.get_bind())
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        "INSERT INTO users VALUES (?, ?)",
+        [(user_id, f"user{user_id}") for user_id in range(1, users + 1)]
+    )
+    connection.executemany(
+        "INSERT INTO projects (id, user_id, name, created_at) "
+        "VALUES (?, ?, ?, 0)",
+        [
+            (
+                (user_id - 1) * PROJECTS_PER_USER + i + 1, user_id,
+                f"project{i}"
+            )
+            for user_id in range(1, users + 1)
+            for i in range(PROJECTS_PER_USER)
+        ]
+    )
+    start = int(datetime(YEAR, 1, 1).timestamp())
+    step = 86400 // records_per_day
+    random.seed(1)
+    for user_id in range(1, users + 1):
+        connection.executemany(
+            "INSERT INTO timelog "
+            "(user_id, project_id, started_at, stoped_at, duration) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    user_id,
+                    (user_id - 1) * PROJECTS_PER_USER
+                    + random.randrange(PROJECTS_PER_USER) + 1,
+                    started_at, started_at + step // 2, step // 2
+                )
+                for started_at in range(start, start + 365 * 86400, step)
+            ]
+        )
+    connection.commit()
+    connection.close()
+
+
+def main(users: int, records_per_day: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'db.sqlite3')
+        populate(path, users, records_per_day)
+        app = make_app(path)
+        user_ids = list(range(1, users + 1))
+        records = users * records_per_day * 365
+        print(f"{users} users, {records} records, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8}{'seconds':>10}{'speedup':>10}")
+        baseline = None
+        workers = 1
+        while workers <= os.cpu_count():
+            started = time.perf_counter()
+            Report.get_many(
+                app, user_ids, 'year', day=date(YEAR, 6, 1), workers=workers)
+            seconds = time.perf_counter() - started
+            baseline = baseline or seconds
+            print(f"{workers:>8}{seconds:>10.2f}{baseline / seconds:>9.2f}x")
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) >= 2 else 16,
+        int(sys.argv[2]) if len(sys.argv) >= 3 else 48,
+    )
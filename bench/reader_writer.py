@@ -0,0 +1,123 @@
+"""
+Latency of start/stop commits while another process runs yearly reports
+in long read transactions: in rollback journal mode with the reports read
+through the writer's kind of engine, and in WAL mode with the reports read
+through the read-only engine of create_app(), compared with no reads.
+
+Usage:
+    python3 -m bench.reader_writer [commits] [years of sample data]
+"""
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app_registry import AppRegistry, create_app
+from config import Config
+from models import Base, TimeLog, Report
+from tests.template import populate_sample_data
+from models.command_stats import LatencyHistogram
+
+
+NOW = datetime(2023, 6, 1)
+
+
+def make_config(path: str, journal_mode: str, read_pool_size: int) -> Config:
+    config = Config()
+    config.database_uri = f"sqlite:///{path}"
+    config.journal_mode = journal_mode
+    config.read_pool_size = read_pool_size
+    return config
+
+
+def populate(config: Config, years: int) -> None:
+    app = create_app(config)
+    app.now = lambda: NOW
+    Base.metadata.create_all(app.session.get_bind())
+    populate_sample_data(app, users=1, days=365 * years, until=NOW)
+    app.session.close()
+
+
+def read_reports(config: Config, stop, reads) -> None:
+    app = create_app(config).for_reading()
+    app.now = lambda: NOW
+    while not stop.is_set():
+        # One transaction per report, like an export reading a snapshot
+        app.session.execute(text("BEGIN"))
+        Report.get(app, 1, 'year')
+        app.session.execute(text("COMMIT"))
+        app.session.close()
+        with reads.get_lock():
+            reads.value += 1
+
+
+def write_records(app: AppRegistry, commits: int) -> tuple:
+    histogram = LatencyHistogram()
+    failures = 0
+    for i in range(commits):
+        app.now = lambda: NOW + timedelta(minutes=i)
+        started = time.perf_counter()
+        try:
+            TimeLog.start_project(app, 1, f"project{i % 2}")
+        except OperationalError:
+            app.session.rollback()
+            failures += 1
+        histogram.record(time.perf_counter() - started)
+        time.sleep(0.01)
+    return histogram, failures
+
+
+def run(config: Config, commits: int, with_reads: bool) -> tuple:
+    stop = multiprocessing.Event()
+    reads = multiprocessing.Value('i', 0)
+    reader = None
+    if with_reads:
+        reader = multiprocessing.Process(
+            target=read_reports, args=(config, stop, reads))
+        reader.start()
+        time.sleep(0.5)
+    app = create_app(config)
+    try:
+        histogram, failures = write_records(app, commits)
+    finally:
+        stop.set()
+        if reader is not None:
+            reader.join()
+        app.session.close()
+    return histogram, failures, reads.value
+
+
+def main(commits: int, years: int) -> None:
+    scenarios = [
+        ('no reads', 'wal', 0, False),
+        ('rollback journal', 'delete', 0, True),
+        ('wal + reader', 'wal', 4, True),
+    ]
+    print(f"{commits} commits, {years} years of records, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'':<18}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'failed':>8}{'reports':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, journal_mode, read_pool_size, with_reads in scenarios:
+            path = os.path.join(tmp_dir, f"{journal_mode}.sqlite3")
+            config = make_config(path, journal_mode, read_pool_size)
+            if not os.path.exists(path):
+                populate(config, years)
+            histogram, failures, reads = run(config, commits, with_reads)
+            print(
+                f"{name:<18}"
+                f"{histogram.percentile(0.5) * 1000:>9.1f}"
+                f"{histogram.percentile(0.99) * 1000:>9.1f}"
+                f"{histogram.percentile(1) * 1000:>9.1f}"
+                f"{failures:>8}{reads:>9}"
+            )
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) >= 2 else 200,
+        int(sys.argv[2]) if len(sys.argv) >= 3 else 3,
+    )
@@ -0,0 +1,44 @@
+"""
+Time to get a populated database for a test or a benchmark iteration:
+building it from scratch versus cloning a template with sqlite3's
+deserialize() and restoring a clone in place.
+
+Usage:
+    python3 -m bench.template_clone [days of sample data]
+"""
+import sys
+import timeit
+from sqlalchemy import delete
+from models import TimeLog
+from tests.template import (
+    DatabaseTemplate, populate_sample_data, SAMPLE_UNTIL
+)
+
+
+def main(days: int) -> None:
+    def populate(app):
+        populate_sample_data(app, days=days)
+
+    now = lambda: SAMPLE_UNTIL
+    build_s = timeit.timeit(
+        lambda: DatabaseTemplate.build(populate, now=now), number=3) / 3
+    template = DatabaseTemplate.build(populate, now=now)
+    clone_s = timeit.timeit(lambda: template.clone(now), number=50) / 50
+
+    app = template.clone(now)
+
+    def reset() -> None:
+        # An iteration which changed the data
+        app.session.execute(delete(TimeLog).where(TimeLog.user_id == 1))
+        app.session.commit()
+        template.restore(app)
+    restore_s = timeit.timeit(reset, number=50) / 50
+
+    print(f"{days} days of sample data, {len(template.data) / 2**20:.1f} MiB")
+    print(f"{'build':<10}{build_s * 1000:>10.1f} ms")
+    print(f"{'clone':<10}{clone_s * 1000:>10.1f} ms")
+    print(f"{'restore':<10}{restore_s * 1000:>10.1f} ms (after a delete)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) >= 2 else 365)
@@ -1,26 +1,171 @@
 import cmd
+import time
+from datetime import datetime
 from typing import Callable
+from sqlalchemy.exc import OperationalError
+from models.command_stats import CommandLatency, LatencyHistogram
 from app_registry import AppRegistry
+from .output import BufferedOutput
+
+try:
+    import readline
+except ImportError:
+    readline = None
 
 
 class BaseCommand(cmd.Cmd):
     def __init__(
         self, app: AppRegistry, print_fn: Callable = None
     ):
-        self.app = app
-        self.print_fn = print_fn or print
-
         self.current_user_id = app.config.cli_user_id
+        # The user's shard if sharding is on
+        self.app = app.for_user(self.current_user_id)
+        # Commands which only read go through the read-only engine, so
+        # they don't hold the writer's connection
+        self.reader = self.app.for_reading()
+        # Output goes through a BufferedOutput of every command unless
+        # print_fn is given
+        self.print_fn = print_fn
+        self.output = None
+        # Latencies of this shell's commands, saved at exit
+        self.latencies = {}  # (command, hour) -> LatencyHistogram
+        self.command_started = None
+
         self.prompt = f"{self.app.now().strftime('%H:%M')}> "
         super().__init__()
 
+    def precmd(self, line: str) -> str:
+        self.command_started = time.perf_counter()
+        self.begin_unit_of_work()
+        return line
+
+    def onecmd(self, line: str) -> bool:
+        try:
+            return super().onecmd(line)
+        except BaseException:
+            # Don't leave the session in a failed transaction for the
+            # next command
+            self.app.session.rollback()
+            self.end_read()
+            self.close_output()
+            raise
+
     def postcmd(self, stop: bool, line: str) -> bool:
+        try:
+            self.end_unit_of_work()
+            command = self.parseline(line)[0]
+            if command and hasattr(self, 'do_' + command):
+                self.record_latency(command, self.command_started)
+        finally:
+            # After the latency is recorded, time in the pager isn't counted
+            self.close_output()
         # Update time in the command prompt
         self.prompt = f"{self.app.now().strftime('%H:%M')}> "
         return stop
 
+    def postloop(self) -> None:
+        self.save_latencies()
+
+    def complete(self, text: str, state: int) -> str:
+        if state != 0:
+            # Matches are computed on the first call
+            return super().complete(text, state)
+        started = time.perf_counter()
+        try:
+            return super().complete(text, state)
+        finally:
+            self.end_read()
+            command = None
+            if readline is not None:
+                command = self.parseline(
+                    readline.get_line_buffer().lstrip())[0]
+            if command and hasattr(self, 'complete_' + command):
+                self.record_latency('complete_' + command, started)
+            else:
+                self.record_latency('complete', started)
+
+    def record_latency(self, command: str, started: float) -> None:
+        """Count the time since the perf_counter() value started."""
+        hour = self.app.now().replace(minute=0, second=0, microsecond=0)
+        histogram = self.latencies.get((command, hour))
+        if histogram is None:
+            histogram = self.latencies[(command, hour)] = LatencyHistogram()
+        histogram.record(time.perf_counter() - started)
+
+    def get_latencies(self, since: datetime) -> dict[str, LatencyHistogram]:
+        """
+        Get latency histograms of commands since the given time, saved and
+        of this shell.
+        """
+        histograms = CommandLatency.get_histograms(self.reader, since)
+        since_hour = since.replace(minute=0, second=0, microsecond=0)
+        for (command, hour), histogram in self.latencies.items():
+            if hour >= since_hour:
+                histograms.setdefault(
+                    command, LatencyHistogram()).merge(histogram)
+        return histograms
+
+    def save_latencies(self) -> None:
+        try:
+            CommandLatency.save(self.app, self.latencies)
+        except OperationalError as e:
+            self.app.session.rollback()
+            self.print_w_time(f"Latencies not saved, run migrate: {e.orig}")
+            self.close_output()
+            return
+        self.latencies = {}
+
+    def begin_unit_of_work(self) -> None:
+        """
+        Prepare the session for a new command: drop whatever is left of
+        the previous transaction and keep the identity map from growing
+        for the whole life of the shell.
+        """
+        session = self.app.session
+        if session.in_transaction():
+            session.rollback()
+        if len(session.identity_map) > self.app.config.session_max_objects:
+            session.expunge_all()
+
+    def end_unit_of_work(self) -> None:
+        """Commit the work of a command or roll it back if it fails."""
+        session = self.app.session
+        try:
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            self.end_read()
+
+    def end_read(self) -> None:
+        """
+        Close the reader's session: its connection goes back to the pool
+        and the next command reads a fresh snapshot.
+        """
+        if self.reader is not self.app:
+            self.reader.session.close()
+
     def print(self, message: str) -> None:
-        self.print_fn(message)
+        if self.print_fn is not None:
+            self.print_fn(message)
+            return
+        if self.output is None:
+            self.output = BufferedOutput(self.stdout, self.app.config.pager)
+        self.output.write(message)
 
     def print_w_time(self, message: str) -> None:
-        self.print_fn(f"{self.app.now().strftime('%H:%M')}: {message}")
+        """Print a status message, shown at once."""
+        message = f"{self.app.now().strftime('%H:%M')}: {message}"
+        if self.print_fn is not None:
+            self.print_fn(message)
+            return
+        if self.output is None:
+            self.output = BufferedOutput(self.stdout, self.app.config.pager)
+        self.output.write_now(message)
+
+    def close_output(self) -> None:
+        """Write out what's left of the command's output."""
+        if self.output is not None:
+            output, self.output = self.output, None
+            output.close()
@@ -1,9 +1,13 @@
 from sqlalchemy.exc import ArgumentError
 from .base import BaseCommand
-from models import Project, Goal, GoalType, Commitment
+from models import (
+    Project, Goal, GoalType, Commitment, GoalFailure, GoalBalance, Forecast
+)
 from .helper import (
-    n_params_from_line, get_param_number, matching_options, get_goal_type_names
+    n_params_from_line, get_param_number, matching_options,
+    get_goal_type_names
 )
+from models.helper import seconds_to_hm
 
 
 class GoalCommand(BaseCommand):
@@ -20,7 +24,7 @@ class GoalCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Project.find_root_projects(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         elif param_number == 3:
             return matching_options(text, get_goal_type_names())
         else:
@@ -46,7 +50,7 @@ class GoalCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Goal.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         elif param_number == 2:
             return matching_options(text, ['type'])
         elif param_number == 3:
@@ -74,7 +78,7 @@ class GoalCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Goal.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -99,7 +103,7 @@ class GoalCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Goal.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -128,19 +132,95 @@ class GoalCommand(BaseCommand):
         return self.do_goalsinfo(line)
 
     def do_goalsinfo(self, line: str) -> None:
-        pass  # TODO
-        # goals_info = self.zud.get_goals_info()
-        # for goal in goals_info:
-        #     print(f"# {goal['name']}")
-        #     if goal['status'] == 'due':
-        #         print(f"DUE {goal['duration']} more before {goal['deadline']}")
-        #     else:
-        #         print(f"OVERWORKED goal by {goal['duration']}")
-
-        #     print(f"(goal started at {goal['started']}, "
-        #           f"hours per day: {goal['last_hours_per_day']}, "
-        #           f"worked today {goal['total_worked_today']}, "
-        #           f"total {goal['total_worked']})")
+        """goalsinfo - show how much is due before the deadline or overworked for every mandatory-hours goal."""
+        lines = []
+        GoalBalance.update(self.app, self.current_user_id)
+        for info in GoalBalance.get_goals_info(
+                self.reader, self.current_user_id, update=False):
+            lines.append(f"# {info.goal.name}")
+            if info.balance < 0:
+                lines.append(
+                    f"DUE {seconds_to_hm(-info.balance)} more before "
+                    f"{info.deadline:%Y-%m-%d %H:%M}")
+            else:
+                lines.append(
+                    f"OVERWORKED goal by {seconds_to_hm(info.balance)}")
+            lines.append(
+                f"(hours today: {seconds_to_hm(info.due_today)}, "
+                f"worked today {seconds_to_hm(info.worked_today)})")
+        if not lines:
+            self.print_w_time("No mandatory-hours goals")
+            return
+        self.print("\n".join(lines))
+
+    def complete_forecast(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return Goal.find_by_name(
+                self.reader, self.current_user_id, text)
+        else:
+            return []
+
+    def do_forecast(self, line: str) -> None:
+        """forecast [goal_name] - how every active goal will end the week at the pace of the last 7 and 28 days, and whether the pace is growing."""
+        (goal_name,) = n_params_from_line(line, 1)
+        try:
+            forecasts = Forecast.get(
+                self.reader, self.current_user_id, goal_name)
+        except ValueError as e:
+            self.print_w_time(f"Invalid input: '{e}'")
+            return
+        if not forecasts:
+            self.print_w_time("No active goals")
+            return
+        lines = []
+        for forecast in forecasts:
+            if lines:
+                lines.append('')
+            lines.append(f"# {forecast.goal.name}")
+            lines.append(
+                f"this week: worked {seconds_to_hm(forecast.worked_week)} "
+                f"of {seconds_to_hm(forecast.due_week)} due")
+            for window, balance in forecast.projected_balance.items():
+                outcome = (
+                    f"{seconds_to_hm(-balance)} short" if balance < 0
+                    else f"{seconds_to_hm(balance)} ahead")
+                lines.append(
+                    f"at {window}-day pace "
+                    f"({seconds_to_hm(forecast.pace[window])}/day): "
+                    f"will finish the week {outcome}")
+            sign = '-' if forecast.trend < 0 else '+'
+            lines.append(
+                f"pace trend: {sign}{seconds_to_hm(abs(forecast.trend))} "
+                f"a day")
+        self.print("\n".join(lines))
+
+    def complete_failures(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return Goal.find_by_name(
+                self.reader, self.current_user_id, text)
+        else:
+            return []
+
+    def do_failures(self, line: str) -> None:
+        """failures [goal_name] - evaluate mandatory-hours goals on the days closed since the last evaluation and list the days they failed on."""
+        (goal_name,) = n_params_from_line(line, 1)
+        GoalFailure.evaluate(self.app, self.current_user_id)
+        failures = GoalFailure.get_failures(
+            self.reader, self.current_user_id, goal_name)
+        if not failures:
+            self.print_w_time("No failures")
+            return
+        self.print("\n".join(
+            f"{day} {name}: worked {seconds_to_hm(worked)} "
+            f"of {seconds_to_hm(due)}"
+            for name, day, due, worked in failures
+        ))
 
     def complete_worked(
         self, text: str, line: str, begidx: int, endidx: int
@@ -148,7 +228,7 @@ class GoalCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Goal.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -174,7 +254,7 @@ class GoalCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:  # project_name
             return Project.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
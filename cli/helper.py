@@ -59,27 +59,3 @@ def matching_last_penult(text: str) -> list[str]:
 
 def get_goal_type_names() -> list[str]:
     return [key.lower() for key in GoalType.__members__.keys()]
-
-
-def seconds_to_hms(seconds: int) -> str:
-    """
-    Convert seconds to a human-readable hours, minutes, and seconds string.
-
-    Example:
-        seconds_to_hms(3666) -> "1h 1m 6s"
-    """
-    remain_seconds = int(seconds % 60)
-    minutes = int(seconds // 60)
-    remain_minutes = int(minutes % 60)
-    hours = int(minutes // 60)
-    parts = []
-    if hours:
-        parts.append(str(hours)+'h')
-    if remain_minutes:
-        parts.append(str(remain_minutes)+'m')
-    if remain_seconds:
-        parts.append(str(remain_seconds)+'s')
-    if parts:
-        return ' '.join(parts)
-    else:
-        return '0'
@@ -1,9 +1,15 @@
 from .project import ProjectCommand
 from .timelog import TimeLogCommand
 from .goal import GoalCommand
+from .report import ReportCommand
+from .sync import SyncCommand
+from .maintenance import MaintenanceCommand
 
 
-class ZudilnikCmd(ProjectCommand, TimeLogCommand, GoalCommand):
+class ZudilnikCmd(
+    ProjectCommand, TimeLogCommand, GoalCommand, ReportCommand,
+    SyncCommand, MaintenanceCommand
+):
     def emptyline(self) -> None:
         pass
 
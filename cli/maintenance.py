@@ -0,0 +1,146 @@
+from datetime import datetime, date, timedelta
+from .base import BaseCommand
+from models.backup import backup_database, backup_rotated
+from models.fsck import TimeLogFsck
+from models.compact import TimeLogCompactor
+from models.migration import migrate
+from models.maintenance import maintain
+from .helper import n_params_from_line, get_param_number, matching_options
+
+
+class MaintenanceCommand(BaseCommand):
+    def do_backup(self, line: str) -> None:
+        """backup [dest] - copy the database to the dest file (timelog archives to the dest-archive directory) while it's being used, or into a new file of the backup directory (ZUD_BACKUP_DIR) removing the oldest backups above ZUD_BACKUP_KEEP."""
+        (dest,) = n_params_from_line(line, 1)
+        if dest:
+            pages = backup_database(self.app, dest)
+            self.print_w_time(f"Backed up {pages} pages to {dest}")
+        else:
+            try:
+                dest = backup_rotated(self.app)
+            except ValueError as e:
+                self.print_w_time(f"Backup failed: {e}")
+                return
+            self.print_w_time(f"Backed up to {dest}")
+
+    def complete_fsck(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return matching_options(text, ['fix'])
+        else:
+            return []
+
+    def do_fsck(self, line: str) -> None:
+        """fsck [fix] - check the timelog for stale or negative durations, overlapping records and extra running records, and fix them if 'fix' is given."""
+        (mode,) = n_params_from_line(line, 1)
+        if mode not in (None, 'fix'):
+            self.print_w_time(f"Invalid input: '{mode}'")
+            return
+
+        result = TimeLogFsck.run(self.app, fix=mode == 'fix')
+        lines = [
+            f"#{issue.record_id} (user #{issue.user_id}) {issue.kind}: "
+            f"{issue.message}"
+            for issue in result.issues
+        ]
+        lines.extend(
+            f"{kind}: {count}" for kind, count in sorted(result.counts.items())
+        )
+        lines.append(
+            f"Checked {result.checked} records, fixed {result.fixed}")
+        self.print("\n".join(lines))
+
+    def do_compact(self, line: str) -> None:
+        """compact [YYYY-MM-DD] [YYYY-MM-DD] - merge consecutive records of the same project and day with compatible comments and not more than ZUD_COMPACT_GAP seconds between them, started within the given dates inclusive (all records by default)."""
+        from_date, to_date = n_params_from_line(line, 2)
+        try:
+            from_dt = to_dt = None
+            if from_date:
+                from_dt = datetime.combine(
+                    date.fromisoformat(from_date), datetime.min.time())
+            if to_date:
+                to_dt = datetime.combine(
+                    date.fromisoformat(to_date) + timedelta(days=1),
+                    datetime.min.time())
+            result = TimeLogCompactor.run(self.app, from_dt, to_dt)
+        except ValueError as e:
+            self.print_w_time(f"Invalid input: '{e}'")
+            return
+
+        self.print_w_time(
+            f"Scanned {result.scanned} records, merged {result.deleted} "
+            f"into {result.merged}, reclaimed {result.pages_reclaimed} pages"
+        )
+
+    def do_migrate(self, line: str) -> None:
+        """migrate - apply pending sql/NNN.sql migrations, create indexes the database misses and refresh query planner statistics."""
+        result = migrate(self.app)
+        lines = [f"Applied {name}" for name in result.applied]
+        lines.extend(f"Created index {name}" for name in result.created_indexes)
+        lines.extend(
+            f"Index {name} isn't declared by the models"
+            for name in result.extra_indexes
+        )
+        lines.append(
+            f"Schema version {result.from_version} -> {result.to_version}")
+        self.print("\n".join(lines))
+
+    def complete_maintain(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return matching_options(text, ['full'])
+        else:
+            return []
+
+    def do_maintain(self, line: str) -> None:
+        """maintain [full] - give up to ZUD_MAINTAIN_VACUUM_PAGES free pages back to the file system and show page usage of tables and indexes; 'full' rebuilds the whole database with VACUUM and enables incremental vacuum."""
+        (mode,) = n_params_from_line(line, 1)
+        if mode not in (None, 'full'):
+            self.print_w_time(f"Invalid input: '{mode}'")
+            return
+
+        report = maintain(self.app, full=mode == 'full')
+        lines = [
+            f"{table.name}: {table.pages} pages, "
+            f"{table.unused_ratio:.0%} unused, "
+            f"{table.fragmentation:.0%} fragmented"
+            for table in report.tables
+        ]
+        lines.append(
+            f"{report.page_count} pages of {report.page_size} bytes, "
+            f"{report.freelist_count} free, vacuumed {report.vacuumed_pages}, "
+            f"auto_vacuum {report.auto_vacuum}"
+        )
+        self.print("\n".join(lines))
+
+    def do_stats(self, line: str) -> None:
+        """stats [days] - number of runs and p50/p95/p99 latency of shell commands and completions over the last days (7 by default)."""
+        (days,) = n_params_from_line(line, 1)
+        try:
+            days = int(days) if days else 7
+        except ValueError:
+            self.print_w_time(f"Invalid input: '{days}'")
+            return
+
+        histograms = self.get_latencies(
+            self.app.now() - timedelta(days=days))
+        if not histograms:
+            self.print_w_time("No commands recorded")
+            return
+        name_width = max(len(command) for command in histograms)
+        lines = [
+            f"{'command':<{name_width}}{'count':>8}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}"
+        ]
+        for command, histogram in sorted(histograms.items()):
+            lines.append(
+                f"{command:<{name_width}}{histogram.count:>8}" + ''.join(
+                    f"{histogram.percentile(q) * 1000:>10.1f}"
+                    for q in (0.5, 0.95, 0.99)
+                )
+            )
+        self.print("\n".join(lines))
@@ -0,0 +1,128 @@
+"""
+Output of shell commands. Messages are collected and written in large
+chunks instead of one write per line: through a pager when stdout is a
+terminal and the output doesn't fit the screen, in chunks of bounded size
+when it's a pipe or a file.
+"""
+import os
+import shlex
+import shutil
+import subprocess
+from typing import TextIO
+
+
+# Held output is written to pipes and files when it reaches that many chars
+CHUNK_SIZE = 64 * 1024
+
+
+class BufferedOutput:
+    """
+    Output of a single command, closed when the command ends.
+
+    Example:
+    output = BufferedOutput(sys.stdout, pager='less -FRX')
+    for line in lines:
+        output.write(line)
+    output.close()
+    """
+
+    def __init__(self, stream: TextIO, pager: str = None):
+        self.stream = stream
+        self.pager_command = pager
+        self.is_tty = stream.isatty()
+        self.held = []
+        self.held_size = 0
+        # Screen lines taken by the output so far
+        self.screen_lines = 0
+        self.pager = None
+        # The reader went away, e.g. 'head' or the pager quit
+        self.broken = False
+
+    def write(self, message: str) -> None:
+        if self.broken:
+            return
+        self.held.append(message)
+        self.held_size += len(message) + 1
+        if self.pager is not None:
+            if self.held_size >= CHUNK_SIZE:
+                self.flush()
+        elif self.is_tty:
+            self.screen_lines += self._count_screen_lines(message)
+            if self.pager_command and \
+                    self.screen_lines >= shutil.get_terminal_size().lines:
+                self._start_pager()
+        elif self.held_size >= CHUNK_SIZE:
+            self.flush()
+
+    def write_now(self, message: str) -> None:
+        """
+        Write a message at once, ahead of the held output, e.g. a status
+        line of a long command.
+        """
+        if self.broken:
+            return
+        if self.pager is None and self.is_tty:
+            self.screen_lines += self._count_screen_lines(message)
+        target = self.pager.stdin if self.pager is not None else self.stream
+        try:
+            target.write(message + "\n")
+            target.flush()
+        except BrokenPipeError:
+            self._break()
+
+    def flush(self) -> None:
+        if not self.held or self.broken:
+            return
+        text = "\n".join(self.held) + "\n"
+        self.held = []
+        self.held_size = 0
+        target = self.pager.stdin if self.pager is not None else self.stream
+        try:
+            target.write(text)
+            target.flush()
+        except BrokenPipeError:
+            self._break()
+
+    def close(self) -> None:
+        self.flush()
+        if self.pager is not None:
+            try:
+                self.pager.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.pager.wait()
+            self.pager = None
+
+    def _count_screen_lines(self, message: str) -> int:
+        columns = shutil.get_terminal_size().columns
+        return sum(
+            max(len(line) - 1, 0) // columns + 1
+            for line in message.split("\n")
+        )
+
+    def _start_pager(self) -> None:
+        try:
+            self.pager = subprocess.Popen(
+                shlex.split(self.pager_command),
+                stdin=subprocess.PIPE,
+                text=True,
+            )
+        except OSError:
+            # No such pager, write to the terminal
+            self.pager_command = None
+            return
+        self.flush()
+
+    def _break(self) -> None:
+        self.broken = True
+        self.held = []
+        if self.pager is not None:
+            return
+        try:
+            fileno = self.stream.fileno()
+        except (AttributeError, OSError):
+            return
+        # Python would fail flushing stdout at exit otherwise
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, fileno)
+        os.close(devnull)
@@ -1,5 +1,6 @@
 from .base import BaseCommand
 from .helper import n_params_from_line, get_param_number
+from models.helper import seconds_to_hms
 from models import Project
 
 
@@ -22,7 +23,7 @@ class ProjectCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Project.find_root_projects(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -50,7 +51,7 @@ class ProjectCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Project.find_root_projects(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -60,10 +61,46 @@ class ProjectCommand(BaseCommand):
         if project_name:
             # concrete project given - need to list all it's subprojects
             projects = Project.get_subprojects(
-                self.app, self.current_user_id, project_name)
+                self.reader, self.current_user_id, project_name)
         else:
             # no project given - need to list all projects
             projects = Project.get_root_projects(
-                self.app, self.current_user_id)
-        for project in projects:
-            self.print(f"#{project.id} {project.name}")
+                self.reader, self.current_user_id)
+        if projects:
+            self.print("\n".join(
+                f"#{project.id} {project.name}" for project in projects))
+
+    def complete_tree(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        """(autocomplete) suggest project names for completion."""
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return Project.find_by_name(
+                self.reader, self.current_user_id, text)
+        else:
+            return []
+
+    def do_tree(self, line: str) -> None:
+        """tree [project_name] - show the whole project tree or the subtree of the specified project with time worked on every project including its subprojects."""
+        (project_name,) = n_params_from_line(line, 1)
+        try:
+            roots = Project.get_tree(
+                self.reader, self.current_user_id, project_name,
+                with_worked=True)
+        except ValueError as e:
+            self.print_w_time(f"Invalid input: '{e}'")
+            return
+
+        lines = []
+        stack = [(root, 0) for root in reversed(roots)]
+        while stack:
+            node, depth = stack.pop()
+            lines.append(
+                f"{'  ' * depth}#{node.project.id} {node.project.name} "
+                f"({seconds_to_hms(node.worked)})"
+            )
+            stack.extend(
+                (child, depth + 1) for child in reversed(node.children))
+        if lines:
+            self.print("\n".join(lines))
@@ -0,0 +1,115 @@
+from datetime import date, timedelta
+from .base import BaseCommand
+from models import Project, Report, ReportData, REPORT_PERIODS
+from .helper import n_params_from_line, get_param_number, matching_options
+from models.helper import seconds_to_hms, seconds_to_hm
+
+
+COLUMN_FORMATS = {'week': '%a %d', 'month': 'W%V', 'year': '%b'}
+
+# Heatmap cells by worked hours: (upper bound in hours, char)
+HEATMAP_LEVELS = [(0, '·'), (2, '░'), (4, '▒'), (6, '▓'), (None, '█')]
+
+
+class ReportCommand(BaseCommand):
+    def complete_report(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return matching_options(text, REPORT_PERIODS)
+        elif param_number == 2:
+            return Project.find_by_name(
+                self.reader, self.current_user_id, text)
+        else:
+            return []
+
+    def do_report(self, line: str) -> None:
+        """report week|month|year [project] - time worked per project and day of the current week, per week of the current month or per month of the current year with the yearly heatmap. If project is given, only the project and its subprojects are counted."""
+        (period, project_name) = n_params_from_line(line, 2)
+        if period not in REPORT_PERIODS:
+            self.print_w_time(
+                f"Invalid input: period should be one of "
+                f"{', '.join(REPORT_PERIODS)}")
+            return
+
+        report = Report.get(
+            self.reader, self.current_user_id, period, project_name)
+
+        lines = self.format_pivot(report)
+        if period == 'year':
+            lines.append('')
+            lines.extend(self.format_heatmap(report))
+        self.print("\n".join(lines))
+
+    def format_pivot(self, report: ReportData) -> list[str]:
+        column_format = COLUMN_FORMATS[report.period]
+        headers = [column.strftime(column_format) for column in report.columns]
+        rows = [
+            (name, [seconds_to_hm(s) if s else '-' for s in row])
+            for name, row in sorted(report.rows.items())
+        ]
+        totals = report.column_totals
+        rows.append(
+            ('total', [seconds_to_hm(s) if s else '-' for s in totals]))
+
+        name_width = max(len(name) for name, cells in rows)
+        widths = [
+            max([len(header)] + [len(cells[i]) for name, cells in rows])
+            for i, header in enumerate(headers)
+        ]
+        lines = [
+            f"{report.from_day.isoformat()} - {report.to_day.isoformat()}",
+            ' ' * name_width + ''.join(
+                f"  {header:>{width}}"
+                for header, width in zip(headers, widths)
+            ),
+        ]
+        for name, cells in rows:
+            lines.append(f"{name:<{name_width}}" + ''.join(
+                f"  {cell:>{width}}" for cell, width in zip(cells, widths)
+            ))
+        lines.append(f"worked {seconds_to_hms(sum(totals))}")
+        return lines
+
+    def format_heatmap(self, report: ReportData) -> list[str]:
+        today = self.app.now().date()
+        first_monday = report.from_day - timedelta(
+            days=report.from_day.isoweekday() - 1)
+        weeks = (report.to_day - first_monday).days // 7 + 1
+
+        # Month names above the week a month starts in
+        month_line = [' '] * weeks
+        for month in range(1, 13):
+            first_day = report.from_day.replace(month=month, day=1)
+            week = (first_day - first_monday).days // 7
+            name = first_day.strftime('%b')
+            if week + len(name) <= weeks and month_line[week] == ' ':
+                month_line[week:week + len(name)] = name
+        lines = ['    ' + ''.join(month_line).rstrip()]
+
+        for weekday in range(7):
+            cells = []
+            for week in range(weeks):
+                day = first_monday + timedelta(days=week * 7 + weekday)
+                if day < report.from_day or day > report.to_day \
+                        or day > today:
+                    cells.append(' ')
+                else:
+                    cells.append(self.heatmap_cell(
+                        report.day_totals.get(day, 0)))
+            weekday_name = date(2023, 1, 2 + weekday).strftime('%a')
+            lines.append(f"{weekday_name} {''.join(cells).rstrip()}")
+
+        legend = ' '.join(
+            f"{char} {'≤' + str(hours) + 'h' if hours else '0h'}"
+            if hours is not None else f"{char} more"
+            for hours, char in HEATMAP_LEVELS
+        )
+        lines.append(legend)
+        return lines
+
+    def heatmap_cell(self, seconds: int) -> str:
+        for hours, char in HEATMAP_LEVELS:
+            if hours is None or seconds <= hours * 3600:
+                return char
@@ -0,0 +1,137 @@
+import os
+import json
+import socket
+from .base import BaseCommand
+from models import Change
+from .helper import n_params_from_line, get_param_number, matching_options
+
+
+SYNC_SUBCOMMANDS = ['export', 'import', 'serve', 'connect', 'bootstrap']
+
+
+class SyncCommand(BaseCommand):
+    def complete_sync(
+        self, text: str, line: str, begidx: int, endidx: int
+    ) -> list[str]:
+        param_number = get_param_number(line, begidx)
+        if param_number == 1:
+            return matching_options(text, SYNC_SUBCOMMANDS)
+        elif param_number == 3 and line.split()[1] == 'export':
+            return matching_options(text, Change.get_peers(self.reader))
+        else:
+            return []
+
+    def do_sync(self, line: str) -> None:
+        """sync export <file> [peer] | sync import <file> | sync serve <socket> | sync connect <socket> - exchange changes made since the last sync with another database through a file or a local unix socket. sync bootstrap - journal rows made before journaling, once before the first sync."""
+        (subcommand, path, peer) = n_params_from_line(line, 3)
+        if subcommand == 'bootstrap':
+            count = Change.bootstrap(self.app)
+            self.print_w_time(f"Journaled {count} rows")
+            return
+        if subcommand not in SYNC_SUBCOMMANDS or not path:
+            self.print_w_time(
+                f"Invalid input: use sync {'|'.join(SYNC_SUBCOMMANDS)} <path>")
+            return
+
+        if subcommand == 'export':
+            self.sync_export(path, peer)
+        elif subcommand == 'import':
+            self.sync_import(path)
+        elif subcommand == 'serve':
+            self.sync_serve(path)
+        else:
+            self.sync_connect(path)
+
+    def sync_export(self, path: str, peer: str = None) -> None:
+        if peer is None:
+            peers = Change.get_peers(self.reader)
+            peer = peers[0] if len(peers) == 1 else None
+        vector = Change.get_peer_vector(self.reader, peer) if peer else {}
+        changes = Change.get_changes_since(self.reader, vector)
+        with open(path, 'w') as f:
+            json.dump({
+                'node': Change.get_node(self.reader),
+                'vector': Change.get_vector(self.reader),
+                'changes': changes,
+            }, f)
+        self.print_w_time(
+            f"Exported {len(changes)} changes for {peer or 'any peer'}")
+
+    def sync_import(self, path: str) -> None:
+        with open(path) as f:
+            message = json.load(f)
+        applied = Change.apply_changes(self.app, message['changes'])
+        Change.set_peer_vector(self.app, message['node'], message['vector'])
+        self.print_w_time(
+            f"Imported {applied} new changes from {message['node']}")
+
+    def sync_serve(self, path: str) -> None:
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        self.print_w_time(f"Serving sync on {path}, Ctrl-C to stop")
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection, connection.makefile('rw') as stream:
+                    peer, received = self.exchange_as_server(stream)
+                self.print_w_time(
+                    f"Synced with {peer}, {received} new changes")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            socket_path_cleanup(path)
+
+    def sync_connect(self, path: str) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            with client.makefile('rw') as stream:
+                send_message(stream, {
+                    'node': Change.get_node(self.app),
+                    'vector': Change.get_vector(self.app),
+                })
+                reply = receive_message(stream)
+                received = Change.apply_changes(self.app, reply['changes'])
+                changes = Change.get_changes_since(self.app, reply['vector'])
+                send_message(stream, {'changes': changes})
+                receive_message(stream)
+        # Both sides have the same changes now
+        Change.set_peer_vector(
+            self.app, reply['node'], Change.get_vector(self.app))
+        self.print_w_time(
+            f"Synced with {reply['node']}: received {received}, "
+            f"sent {len(changes)} changes")
+
+    def exchange_as_server(self, stream) -> tuple[str, int]:
+        hello = receive_message(stream)
+        send_message(stream, {
+            'node': Change.get_node(self.app),
+            'vector': Change.get_vector(self.app),
+            'changes': Change.get_changes_since(self.app, hello['vector']),
+        })
+        message = receive_message(stream)
+        received = Change.apply_changes(self.app, message['changes'])
+        send_message(stream, {'received': received})
+        Change.set_peer_vector(
+            self.app, hello['node'], Change.get_vector(self.app))
+        return hello['node'], received
+
+
+def send_message(stream, message: dict) -> None:
+    stream.write(json.dumps(message) + "\n")
+    stream.flush()
+
+
+def receive_message(stream) -> dict:
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("Sync peer closed the connection")
+    return json.loads(line)
+
+
+def socket_path_cleanup(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
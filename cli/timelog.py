@@ -1,12 +1,12 @@
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import shlex
 from .base import BaseCommand
-from models import Project, TimeLog
+from models import Project, TimeLog, TimeLogSnapshot
 from .helper import (
     n_params_from_line, get_param_number, matching_options,
-    is_record_identifier, matching_last_penult, seconds_to_hms
+    is_record_identifier, matching_last_penult
 )
-from models.helper import get_day_regarding_deadline
+from models.helper import get_day_regarding_deadline, seconds_to_hms
 
 
 class TimeLogCommand(BaseCommand):
@@ -16,7 +16,7 @@ class TimeLogCommand(BaseCommand):
         param_number = get_param_number(line, begidx)
         if param_number == 1:
             return Project.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -128,7 +128,7 @@ class TimeLogCommand(BaseCommand):
         elif param_number == 2 and params[0] == 'project' \
                 or param_number == 3 and params[1] == 'project':
             return Project.find_by_name(
-                self.app, self.current_user_id, text)
+                self.reader, self.current_user_id, text)
         else:
             return []
 
@@ -200,8 +200,9 @@ class TimeLogCommand(BaseCommand):
             limit = 12
 
         timelog = TimeLog.get_timelog(
-            self.app, self.current_user_id, page_size=int(limit)
+            self.reader, self.current_user_id, page_size=int(limit)
         )
+        lines = []
         seen_days = set()
         for record, project in timelog:
             started_at_dt = datetime.fromtimestamp(record.started_at)
@@ -212,8 +213,8 @@ class TimeLogCommand(BaseCommand):
             if day not in seen_days:
                 # Print a blank line before every day other than first
                 if seen_days:
-                    self.print('')
-                self.print(day)
+                    lines.append('')
+                lines.append(day)
                 seen_days.add(day)
 
             if record.stoped_at:
@@ -229,8 +230,39 @@ class TimeLogCommand(BaseCommand):
             comment = record.comment if record.comment else '...'
             started_at = started_at_dt.strftime("%H:%M")
 
-            self.print(
+            lines.append(
                 f"#{record.id} {started_at}-{stoped_at}: "
                 f"[{project.name}] - "
                 f"{comment} ({seconds_to_hms(duration)})"
             )
+        if lines:
+            self.print("\n".join(lines))
+
+    def do_archive(self, line: str) -> None:
+        """archive [YYYY-MM-DD] - move finished records started before the given date (by default older than ZUD_ARCHIVE_AFTER_DAYS days) to per-year archive files."""
+        (before_date,) = n_params_from_line(line, 1)
+        try:
+            if before_date:
+                before = date.fromisoformat(before_date)
+            else:
+                before = self.app.now().date() - timedelta(
+                    days=self.app.config.archive_after_days)
+            moved = TimeLog.archive_records(
+                self.app, datetime.combine(before, datetime.min.time()))
+        except ValueError as e:
+            self.print_w_time(f"Invalid input: '{e}'")
+            return
+
+        if not moved:
+            self.print_w_time(f"No records to archive before {before}")
+        for year, count in moved.items():
+            self.print_w_time(f"Archived {count} records of {year}")
+
+    def do_snapshot(self, line: str) -> None:
+        """snapshot [full] - append finished records to the columnar timelog snapshot for analytics, or rebuild it from scratch with 'full'."""
+        (mode,) = n_params_from_line(line, 1)
+        if mode not in (None, 'full'):
+            self.print_w_time(f"Invalid input: '{mode}'")
+            return
+        appended = TimeLogSnapshot.build(self.app, full=mode == 'full')
+        self.print_w_time(f"Appended {appended} records to the snapshot")
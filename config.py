@@ -7,3 +7,77 @@ class Config:
     )
     deadline_time: str = os.environ.get("ZUD_DEADLINE_TIME", "06:00:00")
     cli_user_id: int = int(os.environ.get("ZUD_CLI_USER_ID", 1))
+    # Number of compiled statements kept per engine, see SQLAlchemy's
+    # create_engine(query_cache_size=...)
+    query_cache_size: int = int(os.environ.get("ZUD_QUERY_CACHE_SIZE", 1200))
+    # Expunge the CLI session when its identity map grows beyond this
+    session_max_objects: int = int(
+        os.environ.get("ZUD_SESSION_MAX_OBJECTS", 1000)
+    )
+    # Retries and base backoff (seconds) for writes hitting a locked database
+    busy_retries: int = int(os.environ.get("ZUD_BUSY_RETRIES", 5))
+    busy_backoff: float = float(os.environ.get("ZUD_BUSY_BACKOFF", 0.05))
+    # Directory of per-year timelog archives, 'archive' next to the database
+    # file by default
+    archive_dir: str = os.environ.get("ZUD_ARCHIVE_DIR")
+    # The archive command by default moves records older than that
+    archive_after_days: int = int(
+        os.environ.get("ZUD_ARCHIVE_AFTER_DAYS", 365)
+    )
+    # Directory of the columnar timelog snapshot, 'snapshot' next to the
+    # database file by default
+    snapshot_dir: str = os.environ.get("ZUD_SNAPSHOT_DIR")
+    # Name of this database in the change journal, the host name by default
+    sync_node: str = os.environ.get("ZUD_SYNC_NODE")
+    # Rotated backups: directory ('backup' next to the database file by
+    # default), number of kept files and daemon's backup interval in seconds
+    backup_dir: str = os.environ.get("ZUD_BACKUP_DIR")
+    backup_keep: int = int(os.environ.get("ZUD_BACKUP_KEEP", 7))
+    backup_interval: int = int(os.environ.get("ZUD_BACKUP_INTERVAL", 86400))
+    # Online backup copies that many pages per step and sleeps between steps
+    backup_step_pages: int = int(os.environ.get("ZUD_BACKUP_STEP_PAGES", 256))
+    backup_step_sleep: float = float(
+        os.environ.get("ZUD_BACKUP_STEP_SLEEP", 0.01)
+    )
+    # The compact command merges records of the same project separated by
+    # not more than that many seconds, the gap is counted as worked time
+    compact_gap: int = int(os.environ.get("ZUD_COMPACT_GAP", 0))
+    # Scheduler of the daemon: alert that many seconds before work on a goal
+    # must start to meet the deadline, alert when a record runs longer than
+    # that many seconds (0 disables), command to run with the alert message
+    # as its last argument (the message is only logged by default) and the
+    # maximum seconds between checks of the change journal
+    alert_lead: int = int(os.environ.get("ZUD_ALERT_LEAD", 900))
+    running_alert_after: int = int(
+        os.environ.get("ZUD_RUNNING_ALERT_AFTER", 7200)
+    )
+    alert_command: str = os.environ.get("ZUD_ALERT_COMMAND")
+    scheduler_poll: float = float(os.environ.get("ZUD_SCHEDULER_POLL", 5))
+    # The maintain command gives back at most that many free pages to the
+    # file system per run, so the database isn't locked for long
+    maintain_vacuum_pages: int = int(
+        os.environ.get("ZUD_MAINTAIN_VACUUM_PAGES", 1000)
+    )
+    # Sharding: every user's rows are kept in a database of their own in
+    # that directory, the configured database only holds the users catalog
+    # (off by default). At most shard_pool_size shard databases are open
+    # at a time.
+    shard_dir: str = os.environ.get("ZUD_SHARD_DIR")
+    shard_pool_size: int = int(os.environ.get("ZUD_SHARD_POOL_SIZE", 8))
+    # Worker processes building reports of many users, the number of CPUs
+    # by default
+    report_workers: int = int(os.environ.get("ZUD_REPORT_WORKERS", 0))
+    # The daemon serves latencies of shell commands to Prometheus on that
+    # port of localhost (off by default)
+    metrics_port: int = int(os.environ.get("ZUD_METRICS_PORT", 0))
+    # Journal mode the database is switched to when opened for writing,
+    # empty to keep the database's one. In WAL mode readers don't block
+    # commits of writers and aren't blocked by them.
+    journal_mode: str = os.environ.get("ZUD_JOURNAL_MODE", "wal")
+    # Connections of the read-only engine commands which only read go
+    # through, 0 to read through the writer's connection
+    read_pool_size: int = int(os.environ.get("ZUD_READ_POOL_SIZE", 4))
+    # Pager of shell output which doesn't fit the terminal, empty to disable
+    pager: str = os.environ.get(
+        "ZUD_PAGER", os.environ.get("PAGER", "less -FRX")
+    )
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Long-running process for periodic tasks, e.g. rotated online backups, and
+alerts about goals which are going to be missed and records running for
+too long. Serves latencies of shell commands to Prometheus on
+localhost:ZUD_METRICS_PORT if it's set.
+Run it next to the shell: python3 daemon.py
+"""
+import time
+import shlex
+import logging
+import subprocess
+import threading
+from datetime import timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from config import Config
+from app_registry import AppRegistry, create_app
+from models.backup import backup_rotated, get_last_backup_time
+from models.command_stats import (
+    CommandLatency, LatencyHistogram, format_prometheus
+)
+from scheduler import Scheduler
+
+
+def backup_task(app: AppRegistry) -> float:
+    """
+    Make a rotated backup if the last one is older than the backup
+    interval. Returns seconds until the next backup is due. With sharding,
+    every shard is backed up next to the catalog.
+    """
+    interval = timedelta(seconds=app.config.backup_interval)
+    last_backup_time = get_last_backup_time(app)
+    if last_backup_time is None or app.now() - last_backup_time >= interval:
+        dest = backup_rotated(app)
+        logging.info("Backed up to %s", dest)
+        last_backup_time = app.now()
+    next_in = (last_backup_time + interval - app.now()).total_seconds()
+    if app.shards is not None:
+        shard_next_ins = app.shards.map(lambda app, _: backup_task(app))
+        next_in = min([next_in, *shard_next_ins.values()])
+    return next_in
+
+
+def send_alert(app: AppRegistry, message: str) -> None:
+    """Log the alert and pass it to config.alert_command if it's set."""
+    logging.warning(message)
+    if app.config.alert_command:
+        subprocess.run(
+            [*shlex.split(app.config.alert_command), message], check=False)
+
+
+def get_all_latencies(app: AppRegistry) -> dict[str, LatencyHistogram]:
+    """Get all-time latency histograms of commands, of all shards."""
+    reader = app.for_reading()
+    histograms = CommandLatency.get_histograms(reader)
+    reader.session.rollback()
+    if app.shards is not None:
+        for shard_histograms in app.shards.map(
+            lambda app, _: CommandLatency.get_histograms(app)
+        ).values():
+            for command, histogram in shard_histograms.items():
+                histograms.setdefault(
+                    command, LatencyHistogram()).merge(histogram)
+    return histograms
+
+
+def serve_metrics(config: Config) -> None:
+    """
+    Serve latencies of shell commands in Prometheus text format on
+    localhost:config.metrics_port from a thread with a registry of its own.
+    """
+    app = create_app(config)
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = format_prometheus(get_all_latencies(app)).encode()
+            self.send_response(200)
+            self.send_header(
+                'Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            logging.debug(format, *args)
+
+    server = HTTPServer(('127.0.0.1', config.metrics_port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("Serving metrics on port %s", server.server_port)
+
+
+def run(app: AppRegistry) -> None:
+    if app.config.metrics_port:
+        serve_metrics(app.config)
+    scheduler = Scheduler(app, alert=lambda message: send_alert(app, message))
+    scheduler.add_task(backup_task)
+    while True:
+        try:
+            timeout = scheduler.run_pending()
+        except Exception:
+            logging.exception("Scheduler failed")
+            timeout = app.config.scheduler_poll
+        finally:
+            app.session.rollback()
+            if app.shards is not None:
+                app.shards.rollback()
+        time.sleep(timeout)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config = Config()
+    try:
+        run(create_app(config))
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,14 @@
 from .base import Base
+from .journal import Change, SyncRow, SyncPeer
 from .user import User
-from .project import Project
+from .project import Project, ProjectTreeNode
 from .timelog import TimeLog, StartProjectData
 from .goal import Goal, GoalType
 from .commitment import Commitment
+from .goal_failure import GoalFailure, GoalEvaluation
+from .goal_balance import GoalBalance, GoalInfo
+from .report import Report, ReportData, REPORT_PERIODS
+from .forecast import Forecast, GoalForecast
+from .snapshot import TimeLogSnapshot
+from .migration import SchemaVersion
+from .command_stats import CommandLatency
@@ -0,0 +1,92 @@
+import os
+import re
+from functools import lru_cache
+from sqlalchemy import Table, Column, MetaData, Index
+from .helper import get_database_dir
+from app_registry import AppRegistry
+
+
+ARCHIVE_FILE_PATTERN = re.compile(r'timelog_(\d{4})\.sqlite3$')
+
+
+def get_archive_dir(app: AppRegistry) -> str:
+    """
+    Get the directory of per-year archive files. By default it's the
+    'archive' directory next to the database file.
+    """
+    if app.config.archive_dir:
+        return app.config.archive_dir
+    return os.path.join(get_database_dir(app), 'archive')
+
+
+def get_archive_path(app: AppRegistry, year: int) -> str:
+    return os.path.join(get_archive_dir(app), f"timelog_{year}.sqlite3")
+
+
+def get_archive_schema(year: int) -> str:
+    """Name the archive file of the given year is attached as."""
+    return f"archive_{year}"
+
+
+def get_archived_years(app: AppRegistry) -> list[int]:
+    """Get years which have archive files, in ascending order."""
+    try:
+        archive_dir = get_archive_dir(app)
+    except ValueError:
+        return []
+    if not os.path.isdir(archive_dir):
+        return []
+    years = []
+    for filename in os.listdir(archive_dir):
+        if match := ARCHIVE_FILE_PATTERN.match(filename):
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+
+def attach_archives(app: AppRegistry, years: list[int]) -> None:
+    """
+    Attach the archive files of the given years to the session's current
+    connection unless they are attached already. Must be called outside
+    of a write transaction.
+    """
+    connection = app.session.connection()
+    attached = {
+        row[1] for row in connection.exec_driver_sql("PRAGMA database_list")
+    }
+    for year in years:
+        schema = get_archive_schema(year)
+        if schema in attached:
+            continue
+        connection.exec_driver_sql(
+            f"ATTACH DATABASE ? AS {schema}",
+            (get_archive_path(app, year),)
+        )
+
+
+@lru_cache
+def get_archive_table(table: Table, year: int) -> Table:
+    """
+    Get a copy of the timelog table living in the archive of the given
+    year. Foreign keys are dropped as they can't cross database files.
+    """
+    metadata = MetaData()
+    archive_table = Table(
+        table.name,
+        metadata,
+        *[
+            Column(column.name, column.type, primary_key=column.primary_key)
+            for column in table.columns
+        ],
+        schema=get_archive_schema(year),
+    )
+    Index(
+        f"{table.name}__user_id_started_at_idx",
+        archive_table.c.user_id,
+        archive_table.c.started_at,
+    )
+    Index(
+        f"{table.name}__user_id_duration_idx",
+        archive_table.c.user_id,
+        archive_table.c.duration,
+    )
+    return archive_table
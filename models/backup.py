@@ -0,0 +1,141 @@
+import os
+import re
+import shutil
+import time
+import sqlite3
+from datetime import datetime
+from .helper import get_database_dir
+from .archive import get_archived_years, get_archive_path
+from app_registry import AppRegistry
+
+
+BACKUP_FILE_PATTERN = re.compile(r'db-\d{8}-\d{6}\.sqlite3$')
+
+
+def get_backup_dir(app: AppRegistry) -> str:
+    """
+    Get the directory of rotated backups. By default it's the 'backup'
+    directory next to the database file.
+    """
+    if app.config.backup_dir:
+        return app.config.backup_dir
+    return os.path.join(get_database_dir(app), 'backup')
+
+
+def get_backup_archive_dir(dest: str) -> str:
+    """Get the directory the archive files of a backup are copied into."""
+    return os.path.splitext(dest)[0] + '-archive'
+
+
+def backup_database(app: AppRegistry, dest: str) -> int:
+    """
+    Copy the database to dest with the SQLite online backup API, while
+    it's being used. Pages are copied in small steps with sleeps between
+    them, so the source is never locked for long and writers go on.
+    Archive files of the timelog (see TimeLog.archive_records()) are
+    copied the same way into the directory of get_backup_archive_dir(),
+    after the database, so a record archived meanwhile ends up in both
+    copies rather than in none. Every copy is checked with PRAGMA
+    integrity_check before it replaces the previous one. Returns the
+    number of copied pages.
+
+    Example:
+    backup_database(app, '/mnt/backup/db.sqlite3')
+    """
+    raw_connection = app.session.get_bind().raw_connection()
+    try:
+        copied_pages = _backup_connection(
+            app, raw_connection.driver_connection, dest)
+    finally:
+        raw_connection.close()
+
+    years = get_archived_years(app)
+    if years:
+        archive_dest = get_backup_archive_dir(dest)
+        os.makedirs(archive_dest, exist_ok=True)
+        for year in years:
+            archive_path = get_archive_path(app, year)
+            source = sqlite3.connect(archive_path)
+            try:
+                copied_pages += _backup_connection(
+                    app, source, os.path.join(
+                        archive_dest, os.path.basename(archive_path)))
+            finally:
+                source.close()
+    return copied_pages
+
+
+def _backup_connection(
+    app: AppRegistry, source: sqlite3.Connection, dest: str
+) -> int:
+    """Copy a database in steps to dest, returns the number of pages."""
+    step_pages = app.config.backup_step_pages
+    step_sleep = app.config.backup_step_sleep
+    tmp_dest = dest + '.tmp'
+    copied_pages = 0
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal copied_pages
+        copied_pages = total - remaining
+        if remaining:
+            time.sleep(step_sleep)
+
+    target = sqlite3.connect(tmp_dest)
+    try:
+        source.backup(
+            target,
+            pages=step_pages,
+            progress=progress,
+            sleep=step_sleep,
+        )
+        (result,) = target.execute("PRAGMA integrity_check").fetchone()
+        if result != 'ok':
+            raise ValueError(f"Backup integrity check failed: {result}")
+    except BaseException:
+        target.close()
+        os.remove(tmp_dest)
+        raise
+    target.close()
+
+    os.replace(tmp_dest, dest)
+    return copied_pages
+
+
+def backup_rotated(app: AppRegistry, backup_dir: str = None) -> str:
+    """
+    Back the database and its archive files up into a new timestamped
+    file (and directory) of the backup directory and remove the oldest
+    ones above config.backup_keep. Returns the path of the new backup.
+    """
+    keep = app.config.backup_keep
+    if keep < 1:
+        raise ValueError(f"At least one backup must be kept, not {keep}")
+    backup_dir = backup_dir or get_backup_dir(app)
+    os.makedirs(backup_dir, exist_ok=True)
+    dest = os.path.join(
+        backup_dir, app.now().strftime('db-%Y%m%d-%H%M%S.sqlite3'))
+    backup_database(app, dest)
+
+    backups = sorted(
+        filename for filename in os.listdir(backup_dir)
+        if BACKUP_FILE_PATTERN.match(filename)
+    )
+    for filename in backups[:max(len(backups) - keep, 0)]:
+        path = os.path.join(backup_dir, filename)
+        os.remove(path)
+        shutil.rmtree(get_backup_archive_dir(path), ignore_errors=True)
+    return dest
+
+
+def get_last_backup_time(app: AppRegistry) -> datetime:
+    """Get the time of the latest rotated backup, None if there isn't any."""
+    backup_dir = get_backup_dir(app)
+    if not os.path.isdir(backup_dir):
+        return None
+    backups = sorted(
+        filename for filename in os.listdir(backup_dir)
+        if BACKUP_FILE_PATTERN.match(filename)
+    )
+    if not backups:
+        return None
+    return datetime.strptime(backups[-1], 'db-%Y%m%d-%H%M%S.sqlite3')
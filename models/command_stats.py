@@ -0,0 +1,190 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, select, func
+from sqlalchemy.dialects.sqlite import insert
+from models import Base
+from app_registry import AppRegistry
+
+
+# Linear sub-buckets per power of two of microseconds, so a bucket's
+# upper bound is at most 1/16 above any value counted in it
+SUB_BUCKETS = 16
+
+
+def get_bucket(microseconds: int) -> int:
+    """Get the histogram bucket of the latency in microseconds."""
+    shift = max(microseconds.bit_length() - SUB_BUCKETS.bit_length(), 0)
+    return shift * SUB_BUCKETS + (microseconds >> shift)
+
+
+def get_bucket_upper_bound(bucket: int) -> int:
+    """Get the highest latency in microseconds counted in the bucket."""
+    if bucket < 2 * SUB_BUCKETS:
+        return bucket
+    shift = bucket // SUB_BUCKETS - 1
+    mantissa = bucket - shift * SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the manner of HdrHistogram: constant
+    relative precision from microseconds to hours in a few hundred
+    buckets, so histograms are cheap to keep, store and merge.
+
+    Example:
+    histogram = LatencyHistogram()
+    histogram.record(0.0123)
+    print(histogram.count, histogram.percentile(0.99))
+    """
+
+    def __init__(self):
+        self.counts = {}  # bucket -> count
+        self.totals = {}  # bucket -> sum of latencies, microseconds
+
+    def record(self, seconds: float) -> None:
+        microseconds = round(seconds * 1_000_000)
+        self.add(get_bucket(microseconds), 1, microseconds)
+
+    def add(self, bucket: int, count: int, total: int) -> None:
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.totals[bucket] = self.totals.get(bucket, 0) + total
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for bucket, count in other.counts.items():
+            self.add(bucket, count, other.totals[bucket])
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def total(self) -> float:
+        """Sum of recorded latencies in seconds."""
+        return sum(self.totals.values()) / 1_000_000
+
+    def percentile(self, q: float) -> float:
+        """
+        Get the latency in seconds not exceeded by the q share (0..1) of
+        recorded ones, rounded up to its bucket's upper bound.
+        """
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return get_bucket_upper_bound(bucket) / 1_000_000
+        return 0
+
+    def count_up_to(self, seconds: float) -> int:
+        """
+        Get the number of latencies in buckets which end at the given
+        seconds or before.
+        """
+        microseconds = int(seconds * 1_000_000)
+        return sum(
+            count for bucket, count in self.counts.items()
+            if get_bucket_upper_bound(bucket) <= microseconds
+        )
+
+
+# Upper bounds (seconds) of histogram buckets exported to Prometheus
+PROMETHEUS_BUCKETS = [
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+]
+
+
+def format_prometheus(histograms: dict[str, LatencyHistogram]) -> str:
+    """
+    Format latency histograms of commands in the Prometheus text exposition
+    format.
+    """
+    name = 'zudilnik_command_duration_seconds'
+    lines = [
+        f"# HELP {name} Latency of shell commands and completions.",
+        f"# TYPE {name} histogram",
+    ]
+    for command, histogram in sorted(histograms.items()):
+        labels = f'command="{command}"'
+        lines.extend(
+            f'{name}_bucket{{{labels},le="{le}"}} '
+            f'{histogram.count_up_to(le)}'
+            for le in PROMETHEUS_BUCKETS
+        )
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return "\n".join(lines) + "\n"
+
+
+class CommandLatency(Base):
+    """
+    Latency histograms of shell commands per hour, one row per non-empty
+    bucket. Local statistics, not journaled.
+    """
+    __tablename__ = 'command_latencies'
+
+    command = Column(String, primary_key=True)
+    hour = Column(Integer, primary_key=True)  # timestamp of the hour start
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)  # microseconds
+
+    @classmethod
+    def save(
+        cls,
+        app: AppRegistry,
+        histograms: dict[tuple[str, datetime], LatencyHistogram],
+    ) -> None:
+        """
+        Add {(command, hour): histogram} histograms to the stored ones in
+        one statement and commit.
+        """
+        rows = [
+            {
+                'command': command,
+                'hour': int(hour.timestamp()),
+                'bucket': bucket,
+                'count': count,
+                'total': histogram.totals[bucket],
+            }
+            for (command, hour), histogram in histograms.items()
+            for bucket, count in histogram.counts.items()
+        ]
+        if not rows:
+            return
+        stmt = insert(cls.__table__)
+        app.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['command', 'hour', 'bucket'],
+                set_={
+                    'count': cls.__table__.c.count + stmt.excluded.count,
+                    'total': cls.__table__.c.total + stmt.excluded.total,
+                },
+            ),
+            rows,
+        )
+        app.session.commit()
+
+    @classmethod
+    def get_histograms(
+        cls, app: AppRegistry, since: datetime = None
+    ) -> dict[str, LatencyHistogram]:
+        """
+        Get stored histograms of commands merged over the hours from the
+        one of since on, or over all time.
+        """
+        stmt = (
+            select(
+                cls.command, cls.bucket,
+                func.sum(cls.count), func.sum(cls.total),
+            )
+            .group_by(cls.command, cls.bucket)
+        )
+        if since is not None:
+            stmt = stmt.where(cls.hour >= int(
+                since.replace(minute=0, second=0, microsecond=0).timestamp()))
+        histograms = {}
+        for command, bucket, count, total in app.session.execute(stmt):
+            histogram = histograms.setdefault(command, LatencyHistogram())
+            histogram.add(bucket, count, total)
+        return histograms
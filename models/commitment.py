@@ -1,6 +1,9 @@
 from datetime import datetime, date, timedelta
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, or_
-from models import Base, Goal
+from sqlalchemy import (
+    Column, Integer, String, Numeric, ForeignKey, Index, or_
+)
+from sqlalchemy.orm import relationship
+from models import Base, Goal, Change
 from .helper import parse_weekday_filter, get_day_regarding_deadline
 from app_registry import AppRegistry
 
@@ -15,6 +18,15 @@ class Commitment(Base):
     date_from = Column(String, nullable=False)  # YYYY-MM-DD
     date_to = Column(String)
 
+    goal = relationship(Goal, back_populates='commitments')
+
+    __table_args__ = (
+        Index(
+            'hoursperday__goal_id_weekday_date_from_idx',
+            'goal_id', 'weekday', 'date_from',
+        ),
+    )
+
     @classmethod
     def _deactivate_previous_commitments(
         cls,
@@ -28,7 +40,7 @@ class Commitment(Base):
         before the given commitment date.
         """
         commitment_date_str = commitment_date.isoformat()
-        commitments = (
+        commitments = sorted(
             app.session.query(cls)
             .filter(
                 cls.goal_id == goal.id,
@@ -39,8 +51,10 @@ class Commitment(Base):
                     cls.date_to >= commitment_date_str
                 ),
             )
-            .order_by(cls.date_from.desc())
-            .all()
+            .all(),
+            # Sorted here, the weekday IN list breaks the index order
+            key=lambda commitment: commitment.date_from,
+            reverse=True,
         )
 
         day_before = commitment_date - timedelta(days=1)
@@ -62,9 +76,11 @@ class Commitment(Base):
             )
 
             if commitment_actual_start_date >= commitment_date:
+                Change.record_delete(app, prev_commitment)
                 app.session.delete(prev_commitment)
             else:
                 prev_commitment.date_to = day_before_str
+                Change.record(app, prev_commitment)
 
     @classmethod
     def _add_new_commitments(
@@ -88,6 +104,7 @@ class Commitment(Base):
                 date_from=commitment_date_str,
             )
             app.session.add(new_hours_per_day)
+            Change.record(app, new_hours_per_day)
 
     @classmethod
     def set_hours_per_day(
@@ -112,6 +129,10 @@ class Commitment(Base):
         commitment_date = get_day_regarding_deadline(
             app.config, app.now()
         )
+        # Goal ledger rows from the commitment date on depend on it
+        from models import GoalBalance
+
+        GoalBalance.invalidate(app, user_id, commitment_date)
         cls._deactivate_previous_commitments(
             app, goal, weekdays, commitment_date)
         cls._add_new_commitments(app, goal, hours, weekdays, commitment_date)
@@ -0,0 +1,209 @@
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select, update, delete, bindparam
+from sqlalchemy.exc import OperationalError
+from models import TimeLog, Change, GoalBalance
+from .helper import write_transaction, sql_day_regarding_deadline
+from .maintenance import incremental_vacuum
+from app_registry import AppRegistry
+
+
+# Rows are read from the database in chunks of this size, and merges are
+# written in batches of this size
+COMPACT_CHUNK_SIZE = 10_000
+
+
+@dataclass
+class CompactResult:
+    scanned: int = 0
+    # Records which absorbed the following ones
+    merged: int = 0
+    # Records absorbed and deleted
+    deleted: int = 0
+    # Pages no longer used by the timelog table and its indexes
+    pages_reclaimed: int = 0
+
+
+def _used_pages(app: AppRegistry) -> int:
+    """
+    Get the number of pages of the timelog table and its indexes, or of the
+    whole database if SQLite is built without the dbstat table.
+    """
+    connection = app.session.connection()
+    try:
+        return connection.exec_driver_sql(
+            "SELECT count(*) FROM dbstat WHERE name IN ("
+            "SELECT name FROM sqlite_schema WHERE tbl_name = ?)",
+            (TimeLog.__tablename__,)
+        ).scalar()
+    except OperationalError:
+        pass
+    page_count = connection.exec_driver_sql("PRAGMA page_count").scalar()
+    freelist_count = connection.exec_driver_sql(
+        "PRAGMA freelist_count").scalar()
+    return page_count - freelist_count
+
+
+def comments_compatible(comment: str, other: str) -> bool:
+    """Comments can be merged if they are equal or one of them is empty."""
+    return not comment or not other or comment == other
+
+
+class TimeLogCompactor:
+    """
+    Merges fragmented timelog records: consecutive finished records of the
+    same user and project, started on the same day regarding deadline,
+    with compatible comments and not more than config.compact_gap seconds
+    between them become one record. The time between merged records is
+    counted as worked, so the gap should be small.
+
+    Records are streamed in (user_id, started_at, id) order keeping only
+    the record being extended in memory. All merges are written in one
+    transaction and journaled. Archived records are not compacted.
+    """
+
+    def __init__(self, app: AppRegistry, gap: int):
+        self.app = app
+        self.gap = gap
+        self.result = CompactResult()
+        self.pending_merges = []
+        self.pending_deletes = []
+        # Earliest started_at of merged records per user
+        self.merged_since = {}
+
+    @classmethod
+    @write_transaction
+    def run(
+        cls,
+        app: AppRegistry,
+        from_dt: datetime = None,
+        to_dt: datetime = None,
+        gap: int = None,
+    ) -> CompactResult:
+        """
+        Compact records started within [from_dt, to_dt), all by default.
+
+        Example:
+        result = TimeLogCompactor.run(app, datetime(2023, 1, 1))
+        print(result.deleted, result.pages_reclaimed)
+        """
+        if gap is None:
+            gap = app.config.compact_gap
+        if gap < 0:
+            raise ValueError(f"Negative gap: {gap}")
+
+        compactor = cls(app, gap)
+        used_pages = _used_pages(app)
+        compactor.scan(from_dt, to_dt)
+        compactor.flush()
+        for user_id, started_at in compactor.merged_since.items():
+            GoalBalance.invalidate_at(app, user_id, started_at)
+        app.session.commit()
+
+        # Gives free pages back to the file system if auto_vacuum allows
+        incremental_vacuum(app)
+        compactor.result.pages_reclaimed = used_pages - _used_pages(app)
+        app.session.commit()
+        # Deleted records may still be in the identity map
+        app.session.expunge_all()
+        return compactor.result
+
+    def scan(self, from_dt: datetime = None, to_dt: datetime = None) -> None:
+        stmt = (
+            select(
+                TimeLog.id,
+                TimeLog.user_id,
+                TimeLog.project_id,
+                TimeLog.started_at,
+                TimeLog.stoped_at,
+                TimeLog.comment,
+                sql_day_regarding_deadline(
+                    self.app.config, TimeLog.started_at),
+            )
+            .order_by(TimeLog.user_id, TimeLog.started_at, TimeLog.id)
+            .execution_options(yield_per=COMPACT_CHUNK_SIZE)
+        )
+        if from_dt is not None:
+            stmt = stmt.where(TimeLog.started_at >= int(from_dt.timestamp()))
+        if to_dt is not None:
+            stmt = stmt.where(TimeLog.started_at < int(to_dt.timestamp()))
+
+        # Core rows on the session's connection skip the ORM loading layer
+        result = self.app.session.connection().execute(stmt)
+        head = None
+        for rows in result.partitions():
+            self.result.scanned += len(rows)
+            for row in rows:
+                if head is not None and self.can_merge(head, row):
+                    head[4] = max(head[4], row[4])
+                    head[5] = head[5] or row[5]
+                    head[7] = True
+                    self.queue_delete(row[0])
+                    continue
+                self.queue_merge(head)
+                # The last item tells if the record absorbed others
+                head = [*row, False] if row[4] is not None else None
+        self.queue_merge(head)
+
+    def can_merge(self, head: list, row: tuple) -> bool:
+        (_, user_id, project_id, started_at, stoped_at, comment, day) = row
+        return (
+            stoped_at is not None
+            and user_id == head[1]
+            and project_id == head[2]
+            and day == head[6]
+            and 0 <= started_at - head[4] <= self.gap
+            and comments_compatible(head[5], comment)
+        )
+
+    def queue_merge(self, head: list) -> None:
+        if head is None or not head[7]:
+            return
+        user_id, started_at = head[1], head[3]
+        self.merged_since[user_id] = min(
+            self.merged_since.get(user_id, started_at), started_at)
+        self.pending_merges.append({
+            'record_id': head[0],
+            'new_stoped_at': head[4],
+            'new_duration': head[4] - head[3],
+            'new_comment': head[5],
+        })
+        if len(self.pending_merges) >= COMPACT_CHUNK_SIZE:
+            self.flush()
+
+    def queue_delete(self, record_id: int) -> None:
+        self.pending_deletes.append(record_id)
+        if len(self.pending_deletes) >= COMPACT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        table = TimeLog.__table__
+        if self.pending_merges:
+            self.app.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('record_id'))
+                .values(
+                    stoped_at=bindparam('new_stoped_at'),
+                    duration=bindparam('new_duration'),
+                    comment=bindparam('new_comment'),
+                ),
+                self.pending_merges,
+            )
+            records = self.app.session.execute(
+                select(TimeLog)
+                .where(TimeLog.id.in_(
+                    [merge['record_id'] for merge in self.pending_merges]))
+                .execution_options(populate_existing=True)
+            ).scalars().all()
+            for record in records:
+                Change.record(self.app, record)
+            self.result.merged += len(self.pending_merges)
+            self.pending_merges = []
+
+        if self.pending_deletes:
+            Change.record_delete_ids(
+                self.app, table.name, self.pending_deletes)
+            self.app.session.execute(
+                delete(table).where(table.c.id.in_(self.pending_deletes)))
+            self.result.deleted += len(self.pending_deletes)
+            self.pending_deletes = []
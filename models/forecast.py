@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from datetime import timedelta
+import numpy as np
+from models import Goal, GoalFailure
+from .helper import get_day_regarding_deadline, get_day_end
+from app_registry import AppRegistry
+
+
+# Days of the rolling means the pace of work is measured over
+FORECAST_WINDOWS = (7, 28)
+
+
+@dataclass
+class GoalForecast:
+    goal: Goal
+    # Window in days -> mean seconds worked per day over the last closed
+    # days of that many
+    pace: dict[int, float]
+    # Change per day of the shortest window's rolling mean over the days
+    # of the longest window, seconds
+    trend: float
+    # Seconds due and worked (up to now) this week, monday to sunday
+    due_week: int
+    worked_week: int
+    # Window -> worked minus due seconds by the end of the week if the
+    # rest of it is worked at that window's pace
+    projected_balance: dict[int, int]
+
+
+class Forecast:
+    @classmethod
+    def get(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        goal_name: str = None,
+        windows: tuple[int, ...] = FORECAST_WINDOWS,
+    ) -> list[GoalForecast]:
+        """
+        Forecast how active goals of the user (or the given one) end the
+        current week at the pace of the last days. Seconds due and worked
+        on every goal are put in goals x days matrices once, from the
+        longest window before today to the end of the week, by the same
+        rules failures and balances are evaluated with, see
+        GoalFailure.get_due_matrix() and get_worked_matrix(); rolling
+        means, trends and projections are computed for all goals at once
+        with NumPy. Read-only.
+
+        Example:
+        for forecast in Forecast.get(app, user_id):
+            balance = forecast.projected_balance[7]
+            print(forecast.goal.name, balance)
+        """
+        goals = Goal.get_list(app, user_id)
+        if goal_name:
+            goals = [goal for goal in goals if goal.name == goal_name]
+            if not goals:
+                raise ValueError(f"Goal '{goal_name}' was not found")
+        if not goals:
+            return []
+
+        today = get_day_regarding_deadline(app.config, app.now())
+        week_start = today - timedelta(days=today.isoweekday() - 1)
+        week_end = week_start + timedelta(days=6)
+        longest = max(windows)
+        first_day = min(today - timedelta(days=longest), week_start)
+        today_index = today.toordinal() - first_day.toordinal()
+        week_index = week_start.toordinal() - first_day.toordinal()
+
+        goal_ids = [goal.id for goal in goals]
+        due = GoalFailure.get_due_matrix(app, goal_ids, first_day, week_end)
+        worked = GoalFailure.get_worked_matrix(
+            app, user_id, goal_ids, first_day, week_end)
+
+        # Rolling means over the closed days, [goal, last day of window]
+        closed = worked[:, :today_index]
+        sums = np.concatenate(
+            (np.zeros((len(goals), 1)), np.cumsum(closed, axis=1)), axis=1)
+        paces = {
+            window: (sums[:, window:] - sums[:, :-window]) / window
+            for window in windows
+        }
+
+        # Least squares slope of the shortest window's rolling mean
+        shortest = paces[min(windows)][:, -(longest - min(windows) + 1):]
+        if shortest.shape[1] > 1:
+            x = np.arange(shortest.shape[1]) - (shortest.shape[1] - 1) / 2
+            trends = shortest @ x / (x @ x)
+        else:
+            trends = np.zeros(len(goals))
+
+        # Days left after now: the rest of today and the days after it
+        now = app.now()
+        today_left = min(max(
+            (get_day_end(app.config, today) - now).total_seconds() / 86400,
+            0), 1)
+        days_left = (week_end - today).days + today_left
+        due_week = due[:, week_index:].sum(axis=1)
+        worked_week = worked[:, week_index:today_index + 1].sum(axis=1)
+        projected = {
+            window: worked_week + pace[:, -1] * days_left - due_week
+            for window, pace in paces.items()
+        }
+
+        return [
+            GoalForecast(
+                goal=goal,
+                pace={window: float(paces[window][i, -1])
+                      for window in windows},
+                trend=float(trends[i]),
+                due_week=int(due_week[i]),
+                worked_week=int(worked_week[i]),
+                projected_balance={
+                    window: int(round(projected[window][i]))
+                    for window in windows
+                },
+            )
+            for i, goal in enumerate(goals)
+        ]
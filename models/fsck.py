@@ -0,0 +1,182 @@
+from dataclasses import dataclass, field
+from sqlalchemy import select, update, bindparam
+from models import TimeLog, GoalBalance
+from app_registry import AppRegistry
+
+
+# Rows are read from the database in chunks of this size, and fixes are
+# written in batches of this size
+FSCK_CHUNK_SIZE = 10_000
+
+# Kinds of anomalies
+STALE_DURATION = 'stale_duration'
+NEGATIVE_DURATION = 'negative_duration'
+OVERLAP = 'overlap'
+EXTRA_OPEN = 'extra_open'
+
+# Number of issues kept in the result for reporting
+MAX_REPORTED_ISSUES = 20
+
+
+@dataclass
+class FsckIssue:
+    kind: str
+    record_id: int
+    user_id: int
+    message: str
+
+
+@dataclass
+class FsckResult:
+    checked: int = 0
+    fixed: int = 0
+    counts: dict[str, int] = field(default_factory=dict)
+    # First MAX_REPORTED_ISSUES issues only
+    issues: list[FsckIssue] = field(default_factory=list)
+
+    def add_issue(
+        self, kind: str, record_id: int, user_id: int, message: str
+    ) -> None:
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if len(self.issues) < MAX_REPORTED_ISSUES:
+            self.issues.append(FsckIssue(kind, record_id, user_id, message))
+
+
+class TimeLogFsck:
+    """
+    Single pass timelog integrity check. Records of every user are
+    streamed in (started_at, id) order keeping only the previous record
+    in memory, and checked for:
+    - duration which doesn't match started_at and stoped_at (fixable)
+    - stoped_at before started_at (reported only)
+    - a record stopped after the next one started (fixable, the record is
+      stopped when the next one starts)
+    - running records other than the last one of a user (fixable, the
+      same way as overlaps)
+    Fixes are written in batches within one transaction. They are not
+    journaled: they are derived from the data, so every synced database
+    gets the same ones by running fsck.
+    """
+
+    def __init__(self, app: AppRegistry, fix: bool = False):
+        self.app = app
+        self.fix = fix
+        self.result = FsckResult()
+        self.pending_fixes = []
+        # Earliest started_at of fixed records per user
+        self.fixed_since = {}
+
+    @classmethod
+    def run(cls, app: AppRegistry, fix: bool = False) -> FsckResult:
+        """
+        Check the whole timelog, fixing what can be fixed if fix is set.
+
+        Example:
+        result = TimeLogFsck.run(app, fix=True)
+        print(result.counts, result.fixed)
+        """
+        fsck = cls(app, fix)
+        try:
+            fsck.check()
+            fsck.flush_fixes()
+            for user_id, started_at in fsck.fixed_since.items():
+                GoalBalance.invalidate_at(app, user_id, started_at)
+            app.session.commit()
+        except BaseException:
+            app.session.rollback()
+            raise
+        return fsck.result
+
+    def check(self) -> None:
+        stmt = (
+            select(
+                TimeLog.id,
+                TimeLog.user_id,
+                TimeLog.started_at,
+                TimeLog.stoped_at,
+                TimeLog.duration,
+            )
+            .order_by(TimeLog.user_id, TimeLog.started_at, TimeLog.id)
+            .execution_options(yield_per=FSCK_CHUNK_SIZE)
+        )
+        # Core rows on the session's connection skip the ORM loading layer
+        result = self.app.session.connection().execute(stmt)
+        prev = None
+        for rows in result.partitions():
+            self.result.checked += len(rows)
+            for row in rows:
+                # The last item tells if stoped_at was changed by the check
+                record = [*row, False]
+                if prev is not None:
+                    if prev[1] == record[1]:
+                        self.check_adjacent(prev, record)
+                    self.check_record(prev)
+                prev = record
+        if prev is not None:
+            self.check_record(prev)
+
+    def check_adjacent(self, prev: list, record: list) -> None:
+        """Check a record against the next record of the same user."""
+        (record_id, user_id, started_at, stoped_at, duration, _) = prev
+        next_started_at = record[2]
+        if stoped_at is None:
+            self.result.add_issue(
+                EXTRA_OPEN, record_id, user_id,
+                f"running while record #{record[0]} started after it")
+        elif stoped_at > next_started_at and stoped_at >= started_at:
+            self.result.add_issue(
+                OVERLAP, record_id, user_id,
+                f"stopped {stoped_at - next_started_at}s after "
+                f"record #{record[0]} started")
+        else:
+            return
+        # Stop the record when the next one starts
+        prev[3] = next_started_at
+        prev[5] = True
+
+    def check_record(self, record: list) -> None:
+        """Check duration of a record and queue its fix if needed."""
+        (record_id, user_id, started_at, stoped_at, duration, changed) = record
+        if stoped_at is not None and stoped_at < started_at:
+            self.result.add_issue(
+                NEGATIVE_DURATION, record_id, user_id,
+                f"stopped {started_at - stoped_at}s before it started")
+            return
+
+        expected = stoped_at - started_at if stoped_at is not None else None
+        if duration != expected or changed:
+            if not changed:
+                self.result.add_issue(
+                    STALE_DURATION, record_id, user_id,
+                    f"duration {duration} instead of {expected}")
+            record[4] = expected
+            self.queue_fix(record)
+
+    def queue_fix(self, record: list) -> None:
+        if not self.fix:
+            return
+        user_id, started_at = record[1], record[2]
+        self.fixed_since[user_id] = min(
+            self.fixed_since.get(user_id, started_at), started_at)
+        self.pending_fixes.append({
+            'record_id': record[0],
+            'new_stoped_at': record[3],
+            'new_duration': record[4],
+        })
+        if len(self.pending_fixes) >= FSCK_CHUNK_SIZE:
+            self.flush_fixes()
+
+    def flush_fixes(self) -> None:
+        if not self.pending_fixes:
+            return
+        self.app.session.execute(
+            update(TimeLog.__table__)
+            .where(TimeLog.__table__.c.id == bindparam('record_id'))
+            .values(
+                stoped_at=bindparam('new_stoped_at'),
+                duration=bindparam('new_duration'),
+            ),
+            self.pending_fixes,
+        )
+        self.result.fixed += len(self.pending_fixes)
+        self.pending_fixes = []
@@ -6,9 +6,13 @@ from sqlalchemy import (
     String,
     ForeignKey,
     UniqueConstraint,
+    Index,
     Enum as SQLAlchemyEnum,
+    select,
+    bindparam,
 )
-from models import Base, Project
+from sqlalchemy.orm import relationship, joinedload, selectinload
+from models import Base, Project, Change
 from app_registry import AppRegistry
 
 
@@ -34,7 +38,21 @@ class Goal(Base):
     archived_at = Column(Integer)
     type = Column(GoalTypeEnum, nullable=False, default=GoalType.HOURS_LIGHT)
 
-    __table_args__ = (UniqueConstraint('user_id', 'name'),)
+    project = relationship(Project)
+    commitments = relationship(
+        'Commitment',
+        back_populates='goal',
+        # goal_id first, so loading commitments of many goals at once reads
+        # them in index order instead of sorting
+        order_by=(
+            '[Commitment.goal_id, Commitment.weekday, Commitment.date_from]'
+        ),
+    )
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'name'),
+        Index('goals__created_at_idx', 'created_at'),
+    )
 
     @classmethod
     def add_new(
@@ -56,6 +74,7 @@ class Goal(Base):
         )
 
         app.session.add(goal)
+        Change.record(app, goal)
         app.session.commit()
         return goal.id
 
@@ -64,29 +83,48 @@ class Goal(Base):
         cls, app: AppRegistry, user_id: int, goal_name: str
     ) -> TGoal:
         """Get goal by name for a specific user."""
-        return (
-            app.session.query(cls)
-            .filter(
-                cls.name == goal_name,
-                cls.user_id == user_id,
-            )
-            .one()
+        return app.session.execute(
+            _get_by_name_stmt, {"user_id": user_id, "goal_name": goal_name}
+        ).scalar_one()
+
+    @classmethod
+    def get_list(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        include_archived: bool = False,
+        with_commitments: bool = False,
+    ) -> list[TGoal]:
+        """
+        Get goals of a user ordered by name along with their projects, by a
+        single query. With with_commitments, commitments of all the goals
+        are loaded by one more query.
+
+        Example:
+        for goal in Goal.get_list(app, user_id, with_commitments=True):
+            print(goal.name, goal.project.name, len(goal.commitments))
+        """
+        stmt = (
+            select(cls)
+            .options(joinedload(cls.project))
+            .where(cls.user_id == user_id)
+            .order_by(cls.name)
         )
+        if not include_archived:
+            stmt = stmt.where(cls.archived_at.is_(None))
+        if with_commitments:
+            stmt = stmt.options(selectinload(cls.commitments))
+        return app.session.execute(stmt).scalars().all()
 
     @classmethod
     def find_by_name(
         cls, app: AppRegistry, user_id: int, pattern: str
     ) -> list[str]:
         """Find goals by pattern for a specific user."""
-        goals = (
-            app.session.query(cls.name)
-            .filter(
-                cls.name.like(pattern + "%"),
-                cls.user_id == user_id,
-            )
-            .all()
-        )
-        return [goal[0] for goal in goals]
+        return app.session.execute(
+            _find_by_name_stmt,
+            {"user_id": user_id, "pattern": pattern + "%"},
+        ).scalars().all()
 
     @classmethod
     def set_type_by_name(
@@ -96,20 +134,17 @@ class Goal(Base):
         goal_type: GoalType
     ) -> None:
         """Set the type of a goal by its name for a specific user."""
-        affected_rows = (
-            app.session.query(cls)
-            .filter(
-                cls.name == goal_name,
-                cls.user_id == user_id,
-            )
-            .update({cls.type: goal_type})
-        )
-        app.session.commit()
-
-        if affected_rows == 0:
+        goal = app.session.execute(
+            _get_by_name_stmt, {"user_id": user_id, "goal_name": goal_name}
+        ).scalar_one_or_none()
+        if not goal:
             raise ValueError(
                 "No goal was found with the provided user_id and goal_name.")
 
+        goal.type = goal_type
+        Change.record(app, goal)
+        app.session.commit()
+
     @classmethod
     def archive_by_name(
         cls, app: AppRegistry, user_id: int, goal_name: str
@@ -118,17 +153,25 @@ class Goal(Base):
         Archive a goal by setting the archived_at field to the current
         timestamp.
         """
-        affected_rows = (
-            app.session.query(cls)
-            .filter(
-                cls.user_id == user_id,
-                cls.name == goal_name
-            )
-            .update({cls.archived_at: int(app.now().timestamp())})
-        )
+        goal = app.session.execute(
+            _get_by_name_stmt, {"user_id": user_id, "goal_name": goal_name}
+        ).scalar_one_or_none()
+        if not goal:
+            raise ValueError(
+                "No goal was found with the provided user_id and goal_name.")
 
+        goal.archived_at = int(app.now().timestamp())
+        Change.record(app, goal)
         app.session.commit()
 
-        if affected_rows == 0:
-            raise ValueError(
-                "No goal was found with the provided user_id and goal_name.")
+
+# Prebuilt statements for the hot lookups, see models/project.py
+_get_by_name_stmt = select(Goal).where(
+    Goal.name == bindparam("goal_name"),
+    Goal.user_id == bindparam("user_id"),
+)
+
+_find_by_name_stmt = select(Goal.name).where(
+    Goal.name.like(bindparam("pattern")),
+    Goal.user_id == bindparam("user_id"),
+)
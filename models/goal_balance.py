@@ -0,0 +1,233 @@
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    select,
+    delete,
+    insert,
+    func,
+    and_,
+)
+from sqlalchemy.orm import aliased, joinedload
+from models import Base, Goal, GoalType, GoalFailure
+from .helper import (
+    write_transaction, get_day_regarding_deadline, get_day_end
+)
+from app_registry import AppRegistry
+
+
+@dataclass
+class GoalInfo:
+    goal: Goal
+    # Worked minus due since the goal was created, including today
+    balance: int
+    due_today: int
+    worked_today: int
+    # The moment today ends regarding deadline
+    deadline: datetime
+
+
+class GoalBalance(Base):
+    """
+    Ledger of mandatory-hours goals: due and worked seconds of every
+    closed day and the cumulative balance (worked minus due) since the
+    goal was created up to that day. Rows are appended by update() and
+    dropped from the earliest day affected by a change of timelog or
+    commitments by invalidate(), so the next update() recomputes only the
+    days from there on. Derived data, not journaled.
+    """
+    __tablename__ = 'goal_balances'
+
+    goal_id = Column(Integer, ForeignKey('goals.id'), primary_key=True)
+    day = Column(String, primary_key=True)  # YYYY-MM-DD
+    due = Column(Integer, nullable=False)  # seconds
+    worked = Column(Integer, nullable=False)  # seconds
+    balance = Column(Integer, nullable=False)  # seconds
+
+    @classmethod
+    def invalidate(
+        cls, app: AppRegistry, user_id: int, from_day: date
+    ) -> None:
+        """
+        Drop ledger rows of the user's goals from from_day on. Call it in
+        the transaction changing timelog records or commitments of that day.
+        """
+        app.session.execute(
+            delete(cls).where(
+                cls.day >= from_day.isoformat(),
+                cls.goal_id.in_(
+                    select(Goal.id).where(Goal.user_id == user_id)),
+            )
+        )
+
+    @classmethod
+    def invalidate_at(
+        cls, app: AppRegistry, user_id: int, *timestamps: int
+    ) -> None:
+        """
+        Drop ledger rows from the day of the earliest of the given
+        timestamps (started_at of changed records) on.
+        """
+        timestamps = [ts for ts in timestamps if ts is not None]
+        if not timestamps:
+            return
+        cls.invalidate(app, user_id, get_day_regarding_deadline(
+            app.config, datetime.fromtimestamp(min(timestamps))))
+
+    @classmethod
+    @write_transaction
+    def update(cls, app: AppRegistry, user_id: int = None) -> int:
+        """
+        Append ledger rows of mandatory-hours goals for the days closed
+        since their last row, of all users if user_id isn't given.
+        Returns the number of appended rows.
+        """
+        # Correlated, so it's a primary key lookup per goal
+        ledger = aliased(cls)
+        last_day = (
+            select(func.max(ledger.day))
+            .where(ledger.goal_id == Goal.id)
+            .scalar_subquery()
+        )
+        stmt = (
+            select(Goal, cls.day, cls.balance)
+            .outerjoin(cls, and_(
+                cls.goal_id == Goal.id, cls.day == last_day))
+            .where(Goal.type == GoalType.HOURS_MANDATORY)
+            .order_by(Goal.user_id, Goal.name)
+        )
+        if user_id is not None:
+            stmt = stmt.where(Goal.user_id == user_id)
+        goals_by_user = {}
+        for goal, last_day, balance in app.session.execute(stmt):
+            goals_by_user.setdefault(goal.user_id, []).append(
+                (goal, last_day, balance or 0))
+
+        rows = []
+        for goal_user_id, goals in goals_by_user.items():
+            goal_days = {}
+            balances = {}
+            for goal, last_day, balance in goals:
+                from_day, to_day = GoalFailure.get_goal_days(app, goal)
+                if last_day is not None:
+                    from_day = date.fromisoformat(last_day) + timedelta(days=1)
+                goal_days[goal.id] = (from_day, to_day)
+                balances[goal.id] = balance
+
+            goal_results = GoalFailure.get_due_and_worked(
+                app, goal_user_id, goal_days)
+            for goal_id, days in goal_results.items():
+                balance = balances[goal_id]
+                for day, due, worked in days:
+                    balance += worked - due
+                    rows.append({
+                        'goal_id': goal_id,
+                        'day': day.isoformat(),
+                        'due': due,
+                        'worked': worked,
+                        'balance': balance,
+                    })
+
+        if rows:
+            app.session.execute(insert(cls.__table__), rows)
+        app.session.commit()
+        return len(rows)
+
+    @classmethod
+    def get_balance(cls, app: AppRegistry, goal_id: int) -> int:
+        """
+        Get the balance of the goal as of its last ledger row, 0 if there
+        isn't any. A single-row lookup, call update() first to include the
+        recently closed days.
+        """
+        balance = app.session.execute(
+            select(cls.balance)
+            .where(cls.goal_id == goal_id)
+            .order_by(cls.day.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+        return balance or 0
+
+    @classmethod
+    def get_balances(
+        cls, app: AppRegistry, goal_ids: list[int]
+    ) -> dict[int, int]:
+        """
+        Get {goal_id: balance} of the given goals as of their last ledger
+        rows by a single query, goals without rows are left out.
+        """
+        if not goal_ids:
+            return {}
+        ledger = aliased(cls)
+        last_day = (
+            select(func.max(ledger.day))
+            .where(ledger.goal_id == cls.goal_id)
+            .scalar_subquery()
+        )
+        return dict(app.session.execute(
+            select(cls.goal_id, cls.balance)
+            .where(cls.goal_id.in_(goal_ids), cls.day == last_day)
+        ).all())
+
+    @classmethod
+    def get_goals_info(
+        cls, app: AppRegistry, user_id: int, update: bool = True
+    ) -> list[GoalInfo]:
+        """
+        Get the current balance of every active mandatory-hours goal of the
+        user: the ledger balance plus what's due and worked today. Goals
+        come with their projects loaded, and the number of queries doesn't
+        depend on the number of goals. The ledger is brought up to date
+        first unless update is False, e.g. when it was updated through the
+        writer and app is a read-only registry.
+
+        Example:
+        for info in GoalBalance.get_goals_info(app, user_id):
+            if info.balance < 0:
+                print(f"{info.goal.name}: {-info.balance}s due")
+        """
+        if update:
+            cls.update(app, user_id)
+        today = get_day_regarding_deadline(app.config, app.now())
+        deadline = get_day_end(app.config, today)
+
+        goals = app.session.execute(
+            select(Goal)
+            .options(joinedload(Goal.project))
+            .where(
+                Goal.user_id == user_id,
+                Goal.type == GoalType.HOURS_MANDATORY,
+                Goal.archived_at.is_(None),
+            )
+            .order_by(Goal.name)
+        ).scalars().all()
+        today_results = GoalFailure.get_due_and_worked(
+            app, user_id, {
+                goal.id: (
+                    max(today, GoalFailure.get_goal_days(app, goal)[0]),
+                    today,
+                )
+                for goal in goals
+            }
+        )
+
+        balances = cls.get_balances(app, [goal.id for goal in goals])
+
+        infos = []
+        for goal in goals:
+            due_today = worked_today = 0
+            for _, due, worked in today_results.get(goal.id, []):
+                due_today, worked_today = due, worked
+            infos.append(GoalInfo(
+                goal=goal,
+                balance=(
+                    balances.get(goal.id, 0) + worked_today - due_today
+                ),
+                due_today=due_today,
+                worked_today=worked_today,
+                deadline=deadline,
+            ))
+        return infos
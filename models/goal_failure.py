@@ -0,0 +1,360 @@
+from datetime import datetime, date, time, timedelta
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    select,
+    delete,
+    insert,
+    func,
+    or_,
+)
+from models import Base, Project, TimeLog, Goal, GoalType, Commitment
+from .helper import (
+    write_transaction,
+    get_day_regarding_deadline,
+    sql_day_regarding_deadline,
+)
+from app_registry import AppRegistry
+
+
+class GoalFailure(Base):
+    """
+    Failure of a mandatory-hours goal on a day: less was worked than was
+    due. Derived from timelog and commitments, so it's not journaled,
+    every synced database evaluates failures itself.
+    """
+    __tablename__ = 'goal_failures'
+
+    goal_id = Column(Integer, ForeignKey('goals.id'), primary_key=True)
+    failed_at = Column(String, primary_key=True)  # YYYY-MM-DD
+    due = Column(Integer, nullable=False)  # seconds
+    worked = Column(Integer, nullable=False)  # seconds
+
+    @classmethod
+    def get_closed_day(cls, app: AppRegistry) -> date:
+        """Get the last day regarding deadline which is over."""
+        return (
+            get_day_regarding_deadline(app.config, app.now())
+            - timedelta(days=1)
+        )
+
+    @classmethod
+    def get_goal_days(cls, app: AppRegistry, goal: Goal) -> tuple[date, date]:
+        """
+        Get the first and the last day a goal is evaluated on: from the day
+        it was created to the last closed day, or to the day before it was
+        archived.
+        """
+        first_day = get_day_regarding_deadline(
+            app.config, datetime.fromtimestamp(goal.created_at))
+        last_day = cls.get_closed_day(app)
+        if goal.archived_at is not None:
+            archived_day = get_day_regarding_deadline(
+                app.config, datetime.fromtimestamp(goal.archived_at))
+            last_day = min(last_day, archived_day - timedelta(days=1))
+        return first_day, last_day
+
+    @classmethod
+    def get_due_and_worked(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        goal_days: dict[int, tuple[date, date]],
+    ) -> dict[int, list[tuple[date, int, int]]]:
+        """
+        Get (day, due seconds, worked seconds) of every day of the given
+        {goal_id: (from_day, to_day)} ranges of goals of the user, see
+        get_due_matrix() and get_worked_matrix().
+        """
+        goal_days = {
+            goal_id: (from_day, to_day)
+            for goal_id, (from_day, to_day) in goal_days.items()
+            if from_day <= to_day
+        }
+        if not goal_days:
+            return {}
+        goal_ids = list(goal_days)
+        from_day = min(from_day for from_day, _ in goal_days.values())
+        to_day = max(to_day for _, to_day in goal_days.values())
+        due = cls.get_due_matrix(app, goal_ids, from_day, to_day)
+        worked = cls.get_worked_matrix(
+            app, user_id, goal_ids, from_day, to_day)
+
+        result = {}
+        for i, (goal_id, (goal_from, goal_to)) in enumerate(
+            goal_days.items()
+        ):
+            first = (goal_from - from_day).days
+            last = (goal_to - from_day).days
+            result[goal_id] = [
+                (goal_from + timedelta(days=j), int(day_due), int(day_worked))
+                for j, (day_due, day_worked) in enumerate(zip(
+                    due[i, first:last + 1], worked[i, first:last + 1]))
+            ]
+        return result
+
+    @classmethod
+    def get_due_matrix(
+        cls,
+        app: AppRegistry,
+        goal_ids: list[int],
+        from_day: date,
+        to_day: date,
+    ) -> np.ndarray:
+        """
+        Get seconds due on the given goals, a [goal, day] matrix of the
+        days from from_day to to_day. Commitments of all goals are read by
+        one query; a commitment is due on its weekday between its date_from
+        and date_to, both included.
+        """
+        goal_indexes = {goal_id: i for i, goal_id in enumerate(goal_ids)}
+        days = np.arange(
+            from_day.toordinal(), to_day.toordinal() + 1, dtype=np.int64)
+        commitments = app.session.execute(
+            select(
+                Commitment.goal_id,
+                Commitment.weekday,
+                Commitment.date_from,
+                Commitment.date_to,
+                Commitment.hours,
+            ).where(
+                Commitment.goal_id.in_(goal_ids),
+                Commitment.date_from <= to_day.isoformat(),
+                or_(
+                    Commitment.date_to.is_(None),
+                    Commitment.date_to >= from_day.isoformat(),
+                ),
+            )
+        ).all()
+        if not commitments:
+            return np.zeros((len(goal_ids), len(days)), dtype=np.int64)
+
+        commitment_goals, weekdays, dates_from, dates_to, hours = zip(
+            *commitments)
+        dates_from = np.array([
+            date.fromisoformat(day).toordinal() for day in dates_from])
+        dates_to = np.array([
+            date.fromisoformat(day).toordinal() if day else days[-1]
+            for day in dates_to
+        ])
+        # Ordinal 1 is a monday
+        day_weekdays = (days - 1) % 7 + 1
+        # [commitment, day]
+        active = (
+            (np.array(weekdays)[:, np.newaxis] == day_weekdays)
+            & (dates_from[:, np.newaxis] <= days)
+            & (days <= dates_to[:, np.newaxis])
+        )
+        seconds = np.array([int(h * 3600) for h in hours], dtype=np.int64)
+        owners = np.zeros((len(goal_ids), len(commitments)), dtype=np.int64)
+        owners[[goal_indexes[goal_id] for goal_id in commitment_goals],
+               np.arange(len(commitments))] = 1
+        return owners @ (active * seconds[:, np.newaxis])
+
+    @classmethod
+    def get_worked_matrix(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        goal_ids: list[int],
+        from_day: date,
+        to_day: date,
+    ) -> np.ndarray:
+        """
+        Get seconds worked on the given goals of the user, a [goal, day]
+        matrix of the days from from_day to to_day. Time worked on the
+        goal's project and its subprojects counts, on every project for
+        goals without one. A record counts whole for the day it started on
+        regarding deadline, running ones up to now, like in
+        TimeLog.get_day_totals(), so failures, balances and forecasts agree
+        with each other and with the daily totals; TimeLog.range_totals()
+        clips records to days instead. Read by one query grouped by
+        project and day.
+        """
+        goal_projects = dict(app.session.execute(
+            select(Goal.id, Goal.project_id).where(Goal.id.in_(goal_ids))
+        ).all())
+        parents = dict(app.session.execute(
+            select(Project.id, Project.parent_id)
+            .where(Project.user_id == user_id)
+        ).all())
+        project_indexes = {
+            project_id: j for j, project_id in enumerate(parents)}
+
+        # [goal, project] is 1 if the project's time counts for the goal:
+        # the goal is of the project itself or of one of its ancestors
+        counts_for = np.zeros((len(goal_ids), len(parents)), dtype=np.int64)
+        goal_indexes = {}
+        for i, goal_id in enumerate(goal_ids):
+            if goal_projects.get(goal_id) is None:
+                counts_for[i, :] = 1
+            else:
+                goal_indexes.setdefault(goal_projects[goal_id], []).append(i)
+        for j, project_id in enumerate(parents):
+            ancestor_ids = set()
+            ancestor_id = project_id
+            while ancestor_id is not None and ancestor_id not in ancestor_ids:
+                ancestor_ids.add(ancestor_id)
+                counts_for[goal_indexes.get(ancestor_id, []), j] = 1
+                ancestor_id = parents.get(ancestor_id)
+
+        now = int(app.now().timestamp())
+        timelog = TimeLog.records_source(app, from_day)
+        day = sql_day_regarding_deadline(app.config, timelog.c.started_at)
+        # Coarse started_at range for the index, see TimeLog.get_day_totals
+        from_ts = datetime.combine(from_day - timedelta(days=1), time())
+        to_ts = datetime.combine(to_day + timedelta(days=2), time())
+        project_days = app.session.execute(
+            select(
+                timelog.c.project_id,
+                day,
+                func.sum(func.coalesce(
+                    timelog.c.duration, now - timelog.c.started_at
+                )),
+            )
+            .where(
+                timelog.c.user_id == user_id,
+                timelog.c.started_at >= int(from_ts.timestamp()),
+                timelog.c.started_at < int(to_ts.timestamp()),
+                day.between(from_day.isoformat(), to_day.isoformat()),
+            )
+            .group_by(timelog.c.project_id, day)
+        ).all()
+
+        # [project, day]
+        worked = np.zeros(
+            (len(parents), (to_day - from_day).days + 1), dtype=np.int64)
+        if project_days:
+            project_ids, day_strs, seconds = zip(*project_days)
+            np.add.at(
+                worked,
+                (
+                    [project_indexes[id_] for id_ in project_ids],
+                    [(date.fromisoformat(day_str) - from_day).days
+                     for day_str in day_strs],
+                ),
+                seconds,
+            )
+        return counts_for @ worked
+
+    @classmethod
+    @write_transaction
+    def evaluate(
+        cls, app: AppRegistry, user_id: int = None, full: bool = False
+    ) -> int:
+        """
+        Record failures of mandatory-hours goals on the days which closed
+        since the last evaluation, of all users if user_id isn't given.
+        The last evaluated day of every goal is kept in goal_evaluations,
+        so each run only looks at new days and it's cheap enough to run
+        on every prompt. Days already evaluated aren't looked at again
+        when their records change, unless full is set, which evaluates
+        everything from scratch. Returns the number of new failures.
+
+        Example:
+        GoalFailure.evaluate(app, user_id)
+        for name, day, due, worked in GoalFailure.get_failures(
+            app, user_id
+        ):
+            print(name, day, due - worked)
+        """
+        stmt = (
+            select(Goal, GoalEvaluation.evaluated_to)
+            .outerjoin(GoalEvaluation, GoalEvaluation.goal_id == Goal.id)
+            .where(Goal.type == GoalType.HOURS_MANDATORY)
+            .order_by(Goal.user_id, Goal.name)
+        )
+        if user_id is not None:
+            stmt = stmt.where(Goal.user_id == user_id)
+        goals_by_user = {}
+        for goal, evaluated_to in app.session.execute(stmt):
+            goals_by_user.setdefault(goal.user_id, []).append(
+                (goal, None if full else evaluated_to))
+
+        failures = []
+        marks = []
+        for goal_user_id, goals in goals_by_user.items():
+            goal_days = {}
+            for goal, evaluated_to in goals:
+                from_day, to_day = cls.get_goal_days(app, goal)
+                if evaluated_to is not None:
+                    from_day = max(
+                        from_day,
+                        date.fromisoformat(evaluated_to) + timedelta(days=1))
+                goal_days[goal.id] = (from_day, to_day)
+
+            goal_results = cls.get_due_and_worked(
+                app, goal_user_id, goal_days)
+            for goal_id, days in goal_results.items():
+                failures.extend(
+                    {
+                        'goal_id': goal_id,
+                        'failed_at': day.isoformat(),
+                        'due': due,
+                        'worked': worked,
+                    }
+                    for day, due, worked in days
+                    if worked < due
+                )
+                marks.append({
+                    'goal_id': goal_id,
+                    'evaluated_to': days[-1][0].isoformat(),
+                })
+
+        if full:
+            goal_ids = [
+                goal.id for goals in goals_by_user.values()
+                for goal, _ in goals
+            ]
+            app.session.execute(
+                delete(cls).where(cls.goal_id.in_(goal_ids)))
+            app.session.execute(
+                delete(GoalEvaluation)
+                .where(GoalEvaluation.goal_id.in_(goal_ids)))
+        if failures:
+            app.session.execute(insert(cls.__table__), failures)
+        if marks:
+            app.session.execute(
+                insert(GoalEvaluation.__table__).prefix_with('OR REPLACE'),
+                marks,
+            )
+        app.session.commit()
+        return len(failures)
+
+    @classmethod
+    def get_failures(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        goal_name: str = None,
+        from_day: date = None,
+    ) -> list[tuple[str, date, int, int]]:
+        """
+        Get recorded failures of the user's goals as (goal name, day, due
+        seconds, worked seconds) tuples ordered by day.
+        """
+        stmt = (
+            select(Goal.name, cls.failed_at, cls.due, cls.worked)
+            .join(Goal, Goal.id == cls.goal_id)
+            .where(Goal.user_id == user_id)
+            .order_by(cls.failed_at, Goal.name)
+        )
+        if goal_name:
+            stmt = stmt.where(Goal.name == goal_name)
+        if from_day:
+            stmt = stmt.where(cls.failed_at >= from_day.isoformat())
+        return [
+            (name, date.fromisoformat(failed_at), due, worked)
+            for name, failed_at, due, worked in app.session.execute(stmt)
+        ]
+
+
+class GoalEvaluation(Base):
+    """The last day failures of a goal were evaluated on."""
+    __tablename__ = 'goal_evaluations'
+
+    goal_id = Column(Integer, ForeignKey('goals.id'), primary_key=True)
+    evaluated_to = Column(String, nullable=False)  # YYYY-MM-DD
@@ -1,5 +1,14 @@
+import os
 import re
+import time as systime
+import random
+import sqlite3
+from functools import wraps
 from datetime import datetime, date, time, timedelta
+from typing import Callable
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import ColumnElement
 from config import Config
 from app_registry import AppRegistry
 
@@ -36,6 +45,41 @@ def parse_weekday_filter(weekday_filter: str) -> list[int]:
     return weekdays
 
 
+def seconds_to_hms(seconds: int) -> str:
+    """
+    Convert seconds to a human-readable hours, minutes, and seconds string.
+
+    Example:
+        seconds_to_hms(3666) -> "1h 1m 6s"
+    """
+    remain_seconds = int(seconds % 60)
+    minutes = int(seconds // 60)
+    remain_minutes = int(minutes % 60)
+    hours = int(minutes // 60)
+    parts = []
+    if hours:
+        parts.append(str(hours)+'h')
+    if remain_minutes:
+        parts.append(str(remain_minutes)+'m')
+    if remain_seconds:
+        parts.append(str(remain_seconds)+'s')
+    if parts:
+        return ' '.join(parts)
+    else:
+        return '0'
+
+
+def seconds_to_hm(seconds: int) -> str:
+    """
+    Convert seconds to a compact hours and minutes string for tables.
+
+    Example:
+        seconds_to_hm(3666) -> "1:01"
+    """
+    minutes = int(seconds // 60)
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
 def datetime_from_string(app: AppRegistry, time_str: str) -> datetime:
     """
     Convert a time string to a datetime object.
@@ -100,3 +144,118 @@ def get_day_regarding_deadline(config: Config, dt: datetime) -> date:
         commitment_date += timedelta(days=1)
 
     return commitment_date
+
+
+def get_day_end(config: Config, day: date) -> datetime:
+    """
+    Get the moment the given day regarding deadline ends, which is the
+    moment the next one starts.
+    """
+    deadline = time.fromisoformat(config.deadline_time)
+    # A deadline before noon ends the day on the next date
+    return datetime.combine(
+        day + timedelta(days=1 if deadline < time(12) else 0), deadline)
+
+
+def deadline_day_shift(config: Config) -> int:
+    """
+    Get the number of seconds to add to a local time so that the date of
+    the result is the day it belongs to regarding deadline, i.e. the same
+    day get_day_regarding_deadline() returns.
+    """
+    deadline = time.fromisoformat(config.deadline_time)
+    deadline_seconds = (
+        deadline.hour * 3600 + deadline.minute * 60 + deadline.second
+    )
+    # A time equal to the deadline still belongs to the previous day
+    shift = -deadline_seconds - 1
+    if deadline >= time(12):
+        shift += 24 * 3600
+    return shift
+
+
+def sql_day_regarding_deadline(
+    config: Config, timestamp: ColumnElement
+) -> ColumnElement:
+    """
+    SQL (SQLite) expression of the 'YYYY-MM-DD' day a unix timestamp
+    belongs to regarding deadline. Matches get_day_regarding_deadline().
+    """
+    return func.date(
+        timestamp,
+        'unixepoch',
+        'localtime',
+        f'{deadline_day_shift(config):+d} seconds',
+    )
+
+
+def get_database_dir(app: AppRegistry) -> str:
+    """
+    Get the directory of the database file, where files derived from the
+    database (archives, snapshots, backups) are kept by default.
+    """
+    url = app.session.get_bind().url
+    database = url.database
+    if database and url.query.get('uri') and database.startswith('file:'):
+        # Read-only engines open the file by an URI
+        database = database[len('file:'):]
+    if not database or database == ':memory:':
+        raise ValueError("In-memory database has no directory")
+    return os.path.dirname(os.path.abspath(database))
+
+
+def is_busy_error(error: OperationalError) -> bool:
+    """Check if the error is SQLite's SQLITE_BUSY ("database is locked")."""
+    errorcode = getattr(error.orig, 'sqlite_errorcode', None)
+    if errorcode is not None:
+        return errorcode & 0xff == sqlite3.SQLITE_BUSY
+    return 'database is locked' in str(error.orig)
+
+
+def begin_immediate(app: AppRegistry) -> None:
+    """
+    Start the session transaction with BEGIN IMMEDIATE, so the write lock
+    is taken before the first read and concurrent writers are serialized.
+    Does nothing for non-SQLite databases or if the underlying connection
+    is already in a transaction.
+    """
+    connection = app.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    if connection.connection.dbapi_connection.in_transaction:
+        return
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+    # Anything loaded before the lock was taken may be outdated by now
+    app.session.expire_all()
+
+
+def write_transaction(method: Callable) -> Callable:
+    """
+    Decorator for model classmethods which read and then write timelog
+    state. Runs the method under BEGIN IMMEDIATE and retries it with
+    exponential backoff when the database is locked by another process.
+
+    Usage:
+        @classmethod
+        @write_transaction
+        def start_project(cls, app, user_id, ...):
+            ...
+    """
+    @wraps(method)
+    def wrapper(cls, app: AppRegistry, *args, **kwargs):
+        retries = app.config.busy_retries
+        for attempt in range(retries + 1):
+            try:
+                begin_immediate(app)
+                return method(cls, app, *args, **kwargs)
+            except OperationalError as e:
+                app.session.rollback()
+                if not is_busy_error(e) or attempt == retries:
+                    raise
+            except BaseException:
+                app.session.rollback()
+                raise
+            backoff = app.config.busy_backoff * 2 ** attempt
+            systime.sleep(backoff * random.uniform(0.5, 1.5))
+
+    return wrapper
@@ -0,0 +1,529 @@
+import json
+import socket
+from typing import Callable
+from datetime import date
+from enum import Enum
+from decimal import Decimal
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    Index,
+    select,
+    func,
+    and_,
+    tuple_,
+    insert,
+    Select,
+    Table,
+    Row,
+)
+from sqlalchemy.orm import aliased
+from models import Base
+from app_registry import AppRegistry
+
+
+# Foreign key columns of journaled tables and tables they refer to.
+# In the journal they hold row uids instead of local ids.
+FOREIGN_KEYS = {
+    'parent_id': 'projects',
+    'project_id': 'projects',
+    'goal_id': 'goals',
+}
+
+# Rows of these tables are matched by natural key when a peer creates
+# a row which already exists locally under a different uid
+NATURAL_KEYS = {
+    'projects': ('user_id', 'name'),
+    'goals': ('user_id', 'name'),
+}
+
+# Journaled tables in the order their rows may reference each other
+JOURNALED_TABLES = ['projects', 'goals', 'hoursperday', 'timelog']
+
+
+class SyncRow(Base):
+    """
+    Global uid of a local row, shared by all synced databases. A row may
+    have several uids when the same project or goal was created on
+    several nodes.
+    """
+    __tablename__ = 'sync_rows'
+
+    table_name = Column(String, primary_key=True)
+    uid = Column(String, primary_key=True)
+    local_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index(
+            'sync_rows__table_name_local_id_idx', 'table_name', 'local_id'
+        ),
+    )
+
+
+class SyncPeer(Base):
+    """Version vector of changes a peer is known to have."""
+    __tablename__ = 'sync_peers'
+
+    node = Column(String, primary_key=True)
+    vector = Column(Text, nullable=False)  # json {node: node_seq}
+    synced_at = Column(Integer, nullable=False)
+
+
+class Change(Base):
+    """
+    Change journal. Every mutation of a journaled row is appended with a
+    monotonic local seq. node and node_seq identify the change globally:
+    the node it was made on and its sequence number on that node.
+    """
+    __tablename__ = 'changes'
+
+    seq = Column(Integer, primary_key=True)
+    node = Column(String, nullable=False)
+    node_seq = Column(Integer, nullable=False)
+    table_name = Column(String, nullable=False)
+    row_uid = Column(String, nullable=False)
+    op = Column(String, nullable=False)  # upsert or delete
+    data = Column(Text)  # json of column values, foreign keys as uids
+    changed_at = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('node', 'node_seq'),
+        Index('changes__row_uid_idx', 'row_uid'),
+    )
+
+    @classmethod
+    def get_node(cls, app: AppRegistry) -> str:
+        """Name of this database in the journal, the host name by default."""
+        return app.config.sync_node or socket.gethostname()
+
+    @classmethod
+    def _get_mapped_class(cls, table_name: str) -> type:
+        for mapper in Base.registry.mappers:
+            if mapper.class_.__tablename__ == table_name:
+                return mapper.class_
+        raise ValueError(f"Table '{table_name}' is not mapped")
+
+    @classmethod
+    def get_uid(
+        cls, app: AppRegistry, table_name: str, local_id: int
+    ) -> str:
+        """Get the uid of a local row, assigning a new one if needed."""
+        uid = app.session.execute(
+            select(SyncRow.uid)
+            .where(
+                SyncRow.table_name == table_name,
+                SyncRow.local_id == local_id,
+            )
+            .order_by(SyncRow.uid)
+            .limit(1)
+        ).scalar_one_or_none()
+        if uid is None:
+            uid = f"{cls.get_node(app)}:{table_name}:{local_id}"
+            app.session.add(SyncRow(
+                table_name=table_name, local_id=local_id, uid=uid))
+        return uid
+
+    @classmethod
+    def _get_local_id(
+        cls, app: AppRegistry, table_name: str, uid: str
+    ) -> int:
+        return app.session.execute(
+            select(SyncRow.local_id).where(
+                SyncRow.table_name == table_name,
+                SyncRow.uid == uid,
+            )
+        ).scalar_one_or_none()
+
+    @classmethod
+    def _journaled_ids(cls, table_name: str) -> Select:
+        """Select ids of local rows of the table present in the journal."""
+        return (
+            select(SyncRow.local_id)
+            .join(cls, and_(
+                cls.table_name == SyncRow.table_name,
+                cls.row_uid == SyncRow.uid,
+            ))
+            .where(SyncRow.table_name == table_name)
+        )
+
+    @classmethod
+    def _ensure_journaled(
+        cls, app: AppRegistry, table_name: str, local_id: int
+    ) -> bool:
+        """Journal the row unless it's there already, True if it was."""
+        mapped_class = cls._get_mapped_class(table_name)
+        journaled = app.session.execute(
+            cls._journaled_ids(table_name)
+            .where(SyncRow.local_id == local_id)
+            .limit(1)
+        ).scalar_one_or_none()
+        if journaled is None:
+            obj = app.session.get(mapped_class, local_id)
+            if obj is not None:
+                cls.record(app, obj)
+                return True
+        return False
+
+    @classmethod
+    def _serialize(cls, app: AppRegistry, obj: Base) -> str:
+        def get_uid(table_name: str, local_id: int) -> str:
+            # Referenced rows go to the journal first, so peers can
+            # apply changes in journal order
+            cls._ensure_journaled(app, table_name, local_id)
+            return cls.get_uid(app, table_name, local_id)
+
+        return cls._serialize_values(
+            obj.__table__, lambda column: getattr(obj, column.key), get_uid)
+
+    @classmethod
+    def _serialize_values(
+        cls,
+        table: Table,
+        get_value: Callable[[Column], object],
+        get_uid: Callable[[str, int], str],
+    ) -> str:
+        """Get json of column values of a row, foreign keys as uids."""
+        data = {}
+        for column in table.columns:
+            if column.primary_key:
+                continue
+            value = get_value(column)
+            if column.name in FOREIGN_KEYS and value is not None:
+                value = get_uid(FOREIGN_KEYS[column.name], value)
+            elif isinstance(value, Enum):
+                value = value.value
+            elif isinstance(value, Decimal):
+                value = str(value)
+            data[column.name] = value
+        return json.dumps(data, sort_keys=True)
+
+    @classmethod
+    def _append(
+        cls,
+        app: AppRegistry,
+        table_name: str,
+        local_id: int,
+        op: str,
+        data: str = None,
+    ) -> None:
+        node = cls.get_node(app)
+        node_seq = app.session.execute(
+            select(func.coalesce(func.max(cls.node_seq), 0))
+            .where(cls.node == node)
+        ).scalar_one() + 1
+        app.session.add(cls(
+            node=node,
+            node_seq=node_seq,
+            table_name=table_name,
+            row_uid=cls.get_uid(app, table_name, local_id),
+            op=op,
+            data=data,
+            changed_at=int(app.now().timestamp()),
+        ))
+
+    @classmethod
+    def record(cls, app: AppRegistry, obj: Base) -> None:
+        """
+        Append the current state of a created or updated row to the
+        journal. Must be called before the session is committed.
+
+        Example:
+        project = Project(...)
+        app.session.add(project)
+        Change.record(app, project)
+        app.session.commit()
+        """
+        app.session.flush([obj])
+        cls._append(
+            app, obj.__tablename__, obj.id, 'upsert', cls._serialize(app, obj))
+
+    @classmethod
+    def record_delete(cls, app: AppRegistry, obj: Base) -> None:
+        """Append deletion of a row to the journal, call before deleting."""
+        cls._append(app, obj.__tablename__, obj.id, 'delete')
+
+    @classmethod
+    def record_delete_ids(
+        cls, app: AppRegistry, table_name: str, local_ids: list[int]
+    ) -> None:
+        """
+        Append deletion of rows removed with a bulk DELETE, which doesn't
+        load them into the session.
+        """
+        for local_id in local_ids:
+            cls._append(app, table_name, local_id, 'delete')
+
+    @classmethod
+    def bootstrap(cls, app: AppRegistry) -> int:
+        """
+        Journal rows created before journaling (or by code which doesn't
+        journal), so peers can receive them. It reads whole tables, so
+        it's an explicit step (sync bootstrap) run once before the first
+        sync of such a database, syncs only read the journal. Rows are
+        journaled in bulk, rows they refer to first. Returns the number
+        of journaled rows.
+        """
+        uids = dict(  # (table_name, local_id) -> uid
+            ((table_name, local_id), uid)
+            for table_name, local_id, uid in app.session.execute(
+                select(
+                    SyncRow.table_name, SyncRow.local_id, func.min(SyncRow.uid)
+                ).group_by(SyncRow.table_name, SyncRow.local_id)
+            )
+        )
+        node = cls.get_node(app)
+        node_seq = app.session.execute(
+            select(func.coalesce(func.max(cls.node_seq), 0))
+            .where(cls.node == node)
+        ).scalar_one()
+        changed_at = int(app.now().timestamp())
+
+        sync_rows = []
+        changes = []
+        for table_name in JOURNALED_TABLES:
+            table = cls._get_mapped_class(table_name).__table__
+            rows = app.session.execute(
+                select(table)
+                .where(table.c.id.not_in(cls._journaled_ids(table_name)))
+                .order_by(table.c.id)
+            ).all()
+            # Uids of all rows first, they may refer to each other
+            for row in rows:
+                if (table_name, row.id) not in uids:
+                    uid = f"{node}:{table_name}:{row.id}"
+                    uids[(table_name, row.id)] = uid
+                    sync_rows.append({
+                        'table_name': table_name,
+                        'uid': uid,
+                        'local_id': row.id,
+                    })
+            for row in cls._parents_first(table, rows):
+                node_seq += 1
+                changes.append({
+                    'node': node,
+                    'node_seq': node_seq,
+                    'table_name': table_name,
+                    'row_uid': uids[(table_name, row.id)],
+                    'op': 'upsert',
+                    'data': cls._serialize_values(
+                        table,
+                        lambda column: row._mapping[column],
+                        lambda ref_table, ref_id: uids[(ref_table, ref_id)],
+                    ),
+                    'changed_at': changed_at,
+                })
+
+        if sync_rows:
+            app.session.execute(insert(SyncRow.__table__), sync_rows)
+        if changes:
+            app.session.execute(insert(cls.__table__), changes)
+        app.session.commit()
+        return len(changes)
+
+    @classmethod
+    def _parents_first(cls, table: Table, rows: list[Row]) -> list[Row]:
+        """Order rows so that rows of the same table they refer to go first."""
+        parent_keys = [
+            column.name for column in table.columns
+            if FOREIGN_KEYS.get(column.name) == table.name
+        ]
+        if not parent_keys:
+            return rows
+        by_id = {row.id: row for row in rows}
+        ordered = []
+        seen = set()
+        for row in rows:
+            chain = []
+            while row is not None and row.id not in seen:
+                seen.add(row.id)
+                chain.append(row)
+                row = by_id.get(getattr(row, parent_keys[0]))
+            ordered.extend(reversed(chain))
+        return ordered
+
+    @classmethod
+    def get_vector(cls, app: AppRegistry) -> dict[str, int]:
+        """
+        Get the last node_seq of every node present in the journal. Nodes
+        are walked in the (node, node_seq) index with a recursive CTE, a
+        lookup per node instead of a scan of the journal.
+        """
+        changes = aliased(cls)
+        nodes = (
+            select(func.min(cls.node).label('node'))
+            .cte('nodes', recursive=True)
+        )
+        nodes = nodes.union_all(
+            select(
+                select(func.min(changes.node))
+                .where(changes.node > nodes.c.node)
+                .scalar_subquery()
+            ).where(nodes.c.node.is_not(None))
+        )
+        return dict(app.session.execute(
+            select(
+                nodes.c.node,
+                select(func.max(changes.node_seq))
+                .where(changes.node == nodes.c.node)
+                .scalar_subquery(),
+            ).where(nodes.c.node.is_not(None))
+        ).all())
+
+    @classmethod
+    def get_changes_since(
+        cls, app: AppRegistry, vector: dict[str, int]
+    ) -> list[dict]:
+        """
+        Get changes a peer with the given version vector doesn't have yet,
+        in the order they were journaled here.
+        """
+        # One range of the (node, node_seq) index per node known here
+        changes = []
+        for node in cls.get_vector(app):
+            changes.extend(app.session.execute(
+                select(cls).where(
+                    cls.node == node,
+                    cls.node_seq > vector.get(node, 0),
+                )
+            ).scalars())
+        changes.sort(key=lambda change: change.seq)
+        return [
+            {
+                'node': change.node,
+                'node_seq': change.node_seq,
+                'table_name': change.table_name,
+                'row_uid': change.row_uid,
+                'op': change.op,
+                'data': change.data,
+                'changed_at': change.changed_at,
+            }
+            for change in changes
+        ]
+
+    @classmethod
+    def apply_changes(cls, app: AppRegistry, changes: list[dict]) -> int:
+        """
+        Apply changes received from a peer in one transaction. Returns the
+        number of changes which were new here. Conflicts are resolved
+        deterministically by last writer wins: the change with the greatest
+        (changed_at, node, node_seq) defines the row, whatever the order
+        changes arrive in.
+        """
+        applied = 0
+        for change in changes:
+            known = app.session.execute(
+                select(cls.seq).where(
+                    cls.node == change['node'],
+                    cls.node_seq == change['node_seq'],
+                )
+            ).scalar_one_or_none()
+            if known is not None:
+                continue
+
+            newer = app.session.execute(
+                select(cls.seq).where(
+                    cls.row_uid == change['row_uid'],
+                    tuple_(cls.changed_at, cls.node, cls.node_seq) > tuple_(
+                        change['changed_at'], change['node'],
+                        change['node_seq']
+                    ),
+                ).limit(1)
+            ).scalar_one_or_none()
+            if newer is None:
+                cls._apply_change(app, change)
+
+            app.session.add(cls(**change))
+            applied += 1
+        app.session.commit()
+        return applied
+
+    @classmethod
+    def _apply_change(cls, app: AppRegistry, change: dict) -> None:
+        table_name = change['table_name']
+        mapped_class = cls._get_mapped_class(table_name)
+        local_id = cls._get_local_id(app, table_name, change['row_uid'])
+        obj = None
+        if local_id is not None:
+            obj = app.session.get(mapped_class, local_id)
+
+        if change['op'] == 'delete':
+            if obj is not None:
+                cls._invalidate_balances(app, table_name, obj)
+                app.session.delete(obj)
+            return
+
+        values = {}
+        for name, value in json.loads(change['data']).items():
+            if name in FOREIGN_KEYS and value is not None:
+                uid = value
+                value = cls._get_local_id(app, FOREIGN_KEYS[name], uid)
+                if value is None:
+                    raise ValueError(
+                        f"Unknown {FOREIGN_KEYS[name]} row '{uid}'")
+            values[name] = value
+
+        if obj is None and local_id is None and table_name in NATURAL_KEYS:
+            # Same project or goal created on both sides, use local one
+            natural_key = NATURAL_KEYS[table_name]
+            obj = app.session.execute(
+                select(mapped_class).filter_by(
+                    **{name: values[name] for name in natural_key})
+            ).scalar_one_or_none()
+
+        if obj is None:
+            # New row, or the row deleted here was updated by a later change
+            obj = mapped_class(id=local_id)
+            app.session.add(obj)
+        else:
+            cls._invalidate_balances(app, table_name, obj)
+        for column in mapped_class.__table__.columns:
+            if column.name in values:
+                value = values[column.name]
+                enum_class = getattr(column.type, 'enum_class', None)
+                if enum_class and value is not None:
+                    value = enum_class(value)
+                setattr(obj, column.key, value)
+        app.session.flush([obj])
+        cls._invalidate_balances(app, table_name, obj)
+
+        if local_id is None:
+            app.session.add(SyncRow(
+                table_name=table_name, uid=change['row_uid'], local_id=obj.id
+            ))
+
+    @classmethod
+    def _invalidate_balances(
+        cls, app: AppRegistry, table_name: str, obj: Base
+    ) -> None:
+        """Drop goal ledger rows depending on a timelog or commitment row."""
+        from models import Goal, GoalBalance
+
+        if table_name == 'timelog':
+            GoalBalance.invalidate_at(app, obj.user_id, obj.started_at)
+        elif table_name == 'hoursperday':
+            goal = app.session.get(Goal, obj.goal_id)
+            GoalBalance.invalidate(
+                app, goal.user_id, date.fromisoformat(obj.date_from))
+
+    @classmethod
+    def get_peer_vector(cls, app: AppRegistry, node: str) -> dict[str, int]:
+        peer = app.session.get(SyncPeer, node)
+        return json.loads(peer.vector) if peer else {}
+
+    @classmethod
+    def set_peer_vector(
+        cls, app: AppRegistry, node: str, vector: dict[str, int]
+    ) -> None:
+        app.session.merge(SyncPeer(
+            node=node,
+            vector=json.dumps(vector),
+            synced_at=int(app.now().timestamp()),
+        ))
+        app.session.commit()
+
+    @classmethod
+    def get_peers(cls, app: AppRegistry) -> list[str]:
+        return app.session.execute(select(SyncPeer.node)).scalars().all()
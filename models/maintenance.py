@@ -0,0 +1,135 @@
+from dataclasses import dataclass, field
+from sqlalchemy.exc import OperationalError
+from app_registry import AppRegistry
+
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+@dataclass
+class TableStats:
+    name: str
+    pages: int
+    # Share of page bytes not used by data
+    unused_ratio: float
+    # Share of leaf pages not following the previous leaf page in the file
+    fragmentation: float
+
+
+@dataclass
+class MaintenanceReport:
+    page_size: int
+    page_count: int
+    freelist_count: int
+    auto_vacuum: str
+    vacuumed_pages: int = 0
+    # Largest tables and indexes first, empty without the dbstat table
+    tables: list[TableStats] = field(default_factory=list)
+
+
+def _pragma(app: AppRegistry, name: str) -> int:
+    return app.session.connection().exec_driver_sql(
+        f"PRAGMA {name}").scalar()
+
+
+def _run_script(app: AppRegistry, script: str) -> None:
+    """
+    Run the script outside of any transaction, to completion: pragmas like
+    incremental_vacuum do one step of work per returned row.
+    """
+    raw_connection = app.session.get_bind().raw_connection()
+    try:
+        raw_connection.driver_connection.executescript(script)
+    finally:
+        raw_connection.close()
+
+
+def incremental_vacuum(app: AppRegistry, max_pages: int = None) -> None:
+    """
+    Give at most max_pages free pages back to the file system, all of them
+    by default. Does nothing unless auto_vacuum is incremental. Commits the
+    session.
+    """
+    app.session.commit()
+    pages = '' if max_pages is None else f"({int(max_pages)})"
+    _run_script(app, f"PRAGMA incremental_vacuum{pages};")
+
+
+def get_table_stats(app: AppRegistry) -> list[TableStats]:
+    """
+    Get page usage of every table and index from the dbstat virtual
+    table, which lists pages in b-tree order. Empty if SQLite is built
+    without it.
+    """
+    try:
+        rows = app.session.connection().exec_driver_sql(
+            "SELECT name, pageno, pagetype, unused, pgsize FROM dbstat")
+    except OperationalError:
+        return []
+
+    stats = {}  # name -> [pages, unused, size, leaves, jumps, last leaf]
+    for name, pageno, pagetype, unused, pgsize in rows:
+        table = stats.setdefault(name, [0, 0, 0, 0, 0, None])
+        table[0] += 1
+        table[1] += unused
+        table[2] += pgsize
+        if pagetype == 'leaf':
+            if table[5] is not None and pageno != table[5] + 1:
+                table[4] += 1
+            table[3] += 1
+            table[5] = pageno
+    return sorted(
+        (
+            TableStats(
+                name=name,
+                pages=pages,
+                unused_ratio=unused / size if size else 0,
+                fragmentation=jumps / (leaves - 1) if leaves > 1 else 0,
+            )
+            for name, (pages, unused, size, leaves, jumps, _)
+            in stats.items()
+        ),
+        key=lambda table: table.pages,
+        reverse=True,
+    )
+
+
+def maintain(
+    app: AppRegistry, full: bool = False, max_pages: int = None
+) -> MaintenanceReport:
+    """
+    Give free pages back to the file system with an incremental vacuum of
+    at most max_pages (config.maintain_vacuum_pages by default) pages, so
+    the database isn't locked for long, and report page counts and
+    fragmentation. Incremental vacuum needs auto_vacuum=incremental; full
+    switches the database to it and rebuilds it with VACUUM, which also
+    defragments it but needs exclusive access.
+
+    Example:
+    report = maintain(app)
+    print(report.freelist_count, report.tables[0].fragmentation)
+    """
+    if max_pages is None:
+        max_pages = app.config.maintain_vacuum_pages
+    app.session.rollback()
+    freelist_count = _pragma(app, 'freelist_count')
+    auto_vacuum = AUTO_VACUUM_MODES[_pragma(app, 'auto_vacuum')]
+    app.session.rollback()
+    if full:
+        _run_script(
+            app, "PRAGMA auto_vacuum = INCREMENTAL; VACUUM; PRAGMA optimize;")
+    elif auto_vacuum == 'incremental':
+        incremental_vacuum(app, max_pages)
+        _run_script(app, "PRAGMA optimize;")
+
+    report = MaintenanceReport(
+        page_size=_pragma(app, 'page_size'),
+        page_count=_pragma(app, 'page_count'),
+        freelist_count=_pragma(app, 'freelist_count'),
+        auto_vacuum=AUTO_VACUUM_MODES[_pragma(app, 'auto_vacuum')],
+    )
+    report.vacuumed_pages = max(freelist_count - report.freelist_count, 0)
+    report.tables = get_table_stats(app)
+    app.session.rollback()
+    return report
@@ -0,0 +1,219 @@
+import os
+import re
+import sqlite3
+from dataclasses import dataclass, field
+from sqlalchemy import Column, Integer, inspect
+from sqlalchemy.schema import CreateIndex
+from models import Base
+from app_registry import AppRegistry
+
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'sql')
+
+SCRIPT_PATTERN = re.compile(r'(\d{3})\.sql$')
+
+# Databases migrated by hand have no schema_version, their version is
+# detected by the newest of these schema objects present
+VERSION_MARKERS = {
+    10: "SELECT 1 FROM sqlite_master WHERE type = 'index' "
+        "AND name = 'projects__parent_id_idx'",
+    9: "SELECT 1 FROM sqlite_master WHERE name = 'command_latencies'",
+    8: "SELECT 1 FROM sqlite_master WHERE type = 'index' "
+       "AND name = 'timelog__user_id_started_at_idx'",
+    7: "SELECT 1 FROM sqlite_master WHERE name = 'goal_balances'",
+    6: "SELECT 1 FROM sqlite_master WHERE name = 'goal_evaluations'",
+    5: "SELECT 1 FROM sqlite_master WHERE name = 'changes'",
+    4: "SELECT 1 FROM sqlite_master WHERE name = 'users'",
+    3: "SELECT 1 FROM pragma_table_info('goals') WHERE name = 'type'",
+    2: "SELECT 1 FROM sqlite_master WHERE name = 'punishments'",
+    1: "SELECT 1 FROM sqlite_master WHERE name = 'timelog'",
+}
+
+
+class SchemaVersion(Base):
+    """Versions of sql/NNN.sql scripts applied to the database."""
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(Integer, nullable=False)
+
+
+@dataclass
+class MigrationResult:
+    from_version: int
+    to_version: int
+    applied: list[str] = field(default_factory=list)
+    created_indexes: list[str] = field(default_factory=list)
+    # Indexes of the database the models don't declare
+    extra_indexes: list[str] = field(default_factory=list)
+
+
+def get_scripts(sql_dir: str = SQL_DIR) -> dict[int, str]:
+    """Get migration script paths by version."""
+    scripts = {}
+    for filename in os.listdir(sql_dir):
+        if match := SCRIPT_PATTERN.match(filename):
+            scripts[int(match.group(1))] = os.path.join(sql_dir, filename)
+    return dict(sorted(scripts.items()))
+
+
+def split_statements(script: str) -> list[str]:
+    """Split an SQL script into complete statements."""
+    statements = []
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    if statement.strip():
+        statements.append(statement.strip())
+    return statements
+
+
+def _has_schema_version(connection: sqlite3.Connection) -> bool:
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'schema_version'"
+    ).fetchone() is not None
+
+
+def detect_version(connection: sqlite3.Connection) -> int:
+    """
+    Get the schema version of the database: the last applied script if
+    migrations were recorded, otherwise guessed from the schema. 0 means
+    an empty database.
+    """
+    if _has_schema_version(connection):
+        (version,) = connection.execute(
+            "SELECT max(version) FROM schema_version").fetchone()
+        if version is not None:
+            return version
+    for version, marker in VERSION_MARKERS.items():
+        if connection.execute(marker).fetchone():
+            return version
+    return 0
+
+
+def _stamp(connection: sqlite3.Connection, app: AppRegistry, version: int):
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, applied_at INTEGER NOT NULL)"
+    )
+    connection.execute(
+        "INSERT OR IGNORE INTO schema_version VALUES (?, ?)",
+        (version, int(app.now().timestamp()))
+    )
+
+
+def apply_script(
+    connection: sqlite3.Connection, app: AppRegistry, version: int, path: str
+) -> None:
+    """
+    Apply a migration script in one transaction and record its version.
+    Table rebuilds of the scripts need foreign keys off, which can't be
+    switched inside a transaction, so the script's foreign_keys pragmas
+    are replaced with a foreign key check before commit.
+    """
+    with open(path) as f:
+        statements = [
+            statement for statement in split_statements(f.read())
+            if not re.match(
+                r'(\s|--[^\n]*\n)*PRAGMA\s+foreign_keys', statement, re.I)
+        ]
+    (foreign_keys,) = connection.execute("PRAGMA foreign_keys").fetchone()
+    connection.execute("PRAGMA foreign_keys = OFF")
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            violation = connection.execute(
+                "PRAGMA foreign_key_check").fetchone()
+            if violation:
+                raise ValueError(
+                    f"{os.path.basename(path)} breaks a foreign key of "
+                    f"table {violation[0]}")
+            _stamp(connection, app, version)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+
+
+def sync_indexes(app: AppRegistry, result: MigrationResult) -> None:
+    """
+    Make indexes of the database match the ones declared by the models:
+    create missing ones, recreate ones with different columns and report
+    the ones the models don't declare.
+    """
+    engine = app.session.get_bind()
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {
+                index['name']: index['column_names']
+                for index in inspector.get_indexes(table.name)
+            }
+            for index in table.indexes:
+                columns = [column.name for column in index.columns]
+                if existing.pop(index.name, None) == columns:
+                    continue
+                connection.exec_driver_sql(
+                    f"DROP INDEX IF EXISTS {index.name}")
+                connection.execute(CreateIndex(index))
+                result.created_indexes.append(index.name)
+            result.extra_indexes.extend(sorted(existing))
+
+
+def migrate(app: AppRegistry, sql_dir: str = SQL_DIR) -> MigrationResult:
+    """
+    Bring the database schema up to date. An empty database gets the
+    schema of the models and the latest version. Otherwise pending
+    sql/NNN.sql scripts are applied in order, each in its own transaction.
+    Then indexes are synced with the models and planner statistics are
+    refreshed with ANALYZE and PRAGMA optimize.
+
+    Example:
+    result = migrate(app)
+    print(result.from_version, result.to_version, result.applied)
+    """
+    app.session.rollback()
+    scripts = get_scripts(sql_dir)
+    latest = max(scripts, default=0)
+    raw_connection = app.session.get_bind().raw_connection()
+    connection = raw_connection.driver_connection
+    isolation_level = connection.isolation_level
+    # Transactions are controlled explicitly
+    connection.isolation_level = None
+    try:
+        version = detect_version(connection)
+        result = MigrationResult(from_version=version, to_version=version)
+        if version == 0:
+            Base.metadata.create_all(app.session.get_bind())
+            _stamp(connection, app, latest)
+            result.to_version = latest
+        else:
+            # Records the detected version of a hand-migrated database
+            _stamp(connection, app, version)
+            for script_version, path in scripts.items():
+                if script_version <= version:
+                    continue
+                apply_script(connection, app, script_version, path)
+                result.applied.append(os.path.basename(path))
+                result.to_version = script_version
+    finally:
+        connection.isolation_level = isolation_level
+        raw_connection.close()
+
+    sync_indexes(app, result)
+    with app.session.get_bind().connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+        connection.exec_driver_sql("PRAGMA optimize")
+        connection.commit()
+    app.session.expire_all()
+    return result
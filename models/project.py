@@ -1,13 +1,33 @@
-from typing import TypeVar
-from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
-from sqlalchemy.orm import aliased
-from models import Base
+from typing import TypeVar, Optional
+from dataclasses import dataclass, field
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    UniqueConstraint,
+    Index,
+    select,
+    bindparam,
+    func,
+    Select,
+)
+from sqlalchemy.orm import aliased, relationship, selectinload
+from models import Base, Change
 from app_registry import AppRegistry
 
 
 TProject = TypeVar("TProject", bound="Project")
 
 
+@dataclass
+class ProjectTreeNode:
+    project: TProject
+    children: list["ProjectTreeNode"] = field(default_factory=list)
+    # Seconds worked on the project and all of its subprojects
+    worked: Optional[int] = None
+
+
 class Project(Base):
     __tablename__ = 'projects'
 
@@ -17,7 +37,17 @@ class Project(Base):
     name = Column(String, nullable=False)
     created_at = Column(Integer, nullable=False)
 
-    __table_args__ = (UniqueConstraint('user_id', 'name'),)
+    parent = relationship(
+        'Project', remote_side=[id], back_populates='children')
+    # In the order of creation, as read from projects__parent_id_idx
+    children = relationship('Project', back_populates='parent')
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'name'),
+        Index('projects__created_at_idx', 'created_at'),
+        # Children of loaded projects, see Project.children
+        Index('projects__parent_id_idx', 'parent_id'),
+    )
 
     @classmethod
     def add_new(
@@ -30,6 +60,7 @@ class Project(Base):
             created_at=int(app.now().timestamp())
         )
         app.session.add(project)
+        Change.record(app, project)
         app.session.commit()
         return project.id
 
@@ -39,14 +70,7 @@ class Project(Base):
         subproject_name: str
     ) -> int:
         """Create a new subproject."""
-        project = (
-            app.session.query(cls)
-            .filter(
-                cls.name == project_name,
-                cls.user_id == user_id
-            )
-            .one()
-        )
+        project = cls.get_by_name(app, user_id, project_name)
         subproject = cls(
             parent_id=project.id,
             user_id=user_id,
@@ -54,6 +78,7 @@ class Project(Base):
             created_at=int(app.now().timestamp())
         )
         app.session.add(subproject)
+        Change.record(app, subproject)
         app.session.commit()
         return subproject.id
 
@@ -61,79 +86,214 @@ class Project(Base):
     def get_by_id(
         cls, app: AppRegistry, project_id: int
     ) -> TProject:
-        return (
-            app.session.query(cls)
-            .filter(cls.id == project_id)
-            .one()
-        )
+        return app.session.execute(
+            _get_by_id_stmt, {"project_id": project_id}
+        ).scalar_one()
 
     @classmethod
     def get_by_name(
         cls, app: AppRegistry, user_id: int, project_name: str
     ) -> TProject:
-        return (
-            app.session.query(cls)
-            .filter(cls.name == project_name, cls.user_id == user_id)
-            .one()
-        )
+        return app.session.execute(
+            _get_by_name_stmt,
+            {"user_id": user_id, "project_name": project_name},
+        ).scalar_one()
 
     @classmethod
     def get_root_projects(
-        cls, app: AppRegistry, user_id: int
+        cls, app: AppRegistry, user_id: int, with_children: bool = False
     ) -> list[TProject]:
-        """Get all root projects for a specific user."""
-        return (
-            app.session.query(cls)
-            .filter(
-                cls.user_id == user_id,
-                cls.parent_id.is_(None)
-            )
-            .all()
+        """
+        Get all root projects for a specific user. With with_children,
+        children of all of them are loaded by one more query.
+
+        Example:
+        for project in Project.get_root_projects(
+                app, user_id, with_children=True):
+            print(project.name, [child.name for child in project.children])
+        """
+        query = app.session.query(cls).filter(
+            cls.user_id == user_id,
+            cls.parent_id.is_(None)
         )
+        if with_children:
+            query = query.options(selectinload(cls.children))
+        return query.all()
 
     @classmethod
     def get_subprojects(
-        cls, app: AppRegistry, user_id: int, project_name: str
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        project_name: str,
+        with_children: bool = False,
     ) -> list[TProject]:
-        """Get all subprojects of a specific project for a specific user."""
+        """
+        Get all subprojects of a specific project for a specific user. With
+        with_children, their own children are loaded by one more query.
+        """
         Subproject = aliased(cls)
-        return (
+        query = (
             app.session.query(Subproject)
             .join(cls, Subproject.parent_id == cls.id)
             .filter(
                 cls.user_id == user_id,
                 cls.name == project_name,
             )
-            .all()
         )
+        if with_children:
+            query = query.options(selectinload(Subproject.children))
+        return query.all()
+
+    @classmethod
+    def get_tree(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        project_name: str = None,
+        with_worked: bool = False,
+    ) -> list[ProjectTreeNode]:
+        """
+        Get the projects of a user as a tree: the whole tree if no project
+        name is given, otherwise the subtree of the given project.
+        All projects are fetched by a single query and the hierarchy is
+        built in memory. With with_worked, every node also gets the time
+        worked on it and its subprojects (running records are counted up
+        to now), calculated by one aggregate query.
+
+        Example:
+        for node in Project.get_tree(app, user_id, with_worked=True):
+            print(node.project.name, node.worked)
+            for child in node.children:
+                print("  ", child.project.name, child.worked)
+        """
+        # Projects are read in the (user_id, name) index order
+        projects_stmt = select(cls).where(cls.user_id == user_id)
+        if project_name:
+            project_ids = cls.subtree_ids(user_id, project_name)
+            projects_stmt = projects_stmt.where(cls.id.in_(project_ids))
+        else:
+            project_ids = None
+        projects = app.session.execute(
+            projects_stmt.order_by(cls.name)
+        ).scalars().all()
+
+        if project_name and not projects:
+            raise ValueError(f"Project '{project_name}' was not found")
+
+        nodes = {project.id: ProjectTreeNode(project) for project in projects}
+        roots = []
+        for node in nodes.values():
+            parent = nodes.get(node.project.parent_id)
+            if parent:
+                parent.children.append(node)
+            else:
+                roots.append(node)
+
+        if with_worked:
+            worked = cls._get_worked_by_project(app, user_id, project_ids)
+            for root in roots:
+                cls._roll_up_worked(root, worked)
+
+        return roots
+
+    @classmethod
+    def subtree_ids(cls, user_id: int, project_name: str) -> Select:
+        """
+        Build a select of ids of the given project and all of its
+        subprojects (recursive CTE), to be used in IN clauses.
+        """
+        subtree = (
+            select(cls.id)
+            .where(cls.user_id == user_id, cls.name == project_name)
+            .cte("subtree", recursive=True)
+        )
+        subtree = subtree.union_all(
+            select(cls.id).join(subtree, cls.parent_id == subtree.c.id)
+        )
+        return select(subtree.c.id)
+
+    @classmethod
+    def _get_worked_by_project(
+        cls, app: AppRegistry, user_id: int, project_ids: Select = None
+    ) -> dict[int, int]:
+        """
+        Get total worked seconds per project id. Running records are
+        counted up to now.
+        """
+        from models import TimeLog
+
+        now = int(app.now().timestamp())
+        timelog = TimeLog.records_source(app)
+        stmt = (
+            select(
+                timelog.c.project_id,
+                func.sum(func.coalesce(
+                    timelog.c.duration, now - timelog.c.started_at
+                )),
+            )
+            .where(timelog.c.user_id == user_id)
+            .group_by(timelog.c.project_id)
+        )
+        if project_ids is not None:
+            stmt = stmt.where(timelog.c.project_id.in_(project_ids))
+        return dict(app.session.execute(stmt).all())
+
+    @classmethod
+    def _roll_up_worked(
+        cls, root: ProjectTreeNode, worked: dict[int, int]
+    ) -> None:
+        """Sum worked time of every node with its subprojects in place."""
+        # Iterative post-order walk, trees may be deep
+        stack = [(root, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                node.worked = worked.get(node.project.id, 0) + sum(
+                    child.worked for child in node.children
+                )
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
 
     @classmethod
     def find_by_name(
         cls, app: AppRegistry, user_id: int, pattern: str
     ) -> list[str]:
         """Find projects by pattern for a specific user."""
-        projects = (
-            app.session.query(cls.name)
-            .filter(
-                cls.name.like(pattern + "%"),
-                cls.user_id == user_id,
-            )
-            .all()
-        )
-        return [project[0] for project in projects]
+        return app.session.execute(
+            _find_by_name_stmt,
+            {"user_id": user_id, "pattern": pattern + "%"},
+        ).scalars().all()
 
     @classmethod
     def find_root_projects(
         cls, app: AppRegistry, user_id: int, pattern: str
     ) -> list[str]:
         """Find root projects by pattern for a specific user."""
-        projects = (
-            app.session.query(cls.name)
-            .filter(
-                cls.name.like(pattern + "%"),
-                cls.parent_id.is_(None),
-                cls.user_id == user_id,
-            )
-            .all()
-        )
-        return [project[0] for project in projects]
+        return app.session.execute(
+            _find_root_projects_stmt,
+            {"user_id": user_id, "pattern": pattern + "%"},
+        ).scalars().all()
+
+
+# Statements for the hot lookups are built once at import time, so each call
+# only binds parameters and hits the engine's compiled cache instead of
+# rebuilding and recompiling a query chain.
+_get_by_id_stmt = select(Project).where(Project.id == bindparam("project_id"))
+
+_get_by_name_stmt = select(Project).where(
+    Project.name == bindparam("project_name"),
+    Project.user_id == bindparam("user_id"),
+)
+
+_find_by_name_stmt = select(Project.name).where(
+    Project.name.like(bindparam("pattern")),
+    Project.user_id == bindparam("user_id"),
+)
+
+_find_root_projects_stmt = select(Project.name).where(
+    Project.name.like(bindparam("pattern")),
+    Project.parent_id.is_(None),
+    Project.user_id == bindparam("user_id"),
+)
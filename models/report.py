@@ -0,0 +1,221 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, date, timedelta
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from config import Config
+from models import TimeLog
+from .helper import get_day_regarding_deadline
+from app_registry import AppRegistry, create_read_only_engine
+
+
+REPORT_PERIODS = ['week', 'month', 'year']
+
+
+@dataclass
+class ReportData:
+    period: str
+    from_day: date
+    to_day: date
+    # Pivot columns: days for a week, weeks (by their mondays) for a month
+    # and months (by their first days) for a year
+    columns: list[date]
+    # Project name -> seconds worked per column
+    rows: dict[str, list[int]] = field(default_factory=dict)
+    # Day -> seconds worked on all projects that day
+    day_totals: dict[date, int] = field(default_factory=dict)
+
+    @property
+    def column_totals(self) -> list[int]:
+        totals = [0] * len(self.columns)
+        for row in self.rows.values():
+            for i, seconds in enumerate(row):
+                totals[i] += seconds
+        return totals
+
+
+def get_period_bounds(period: str, day: date) -> tuple[date, date]:
+    """
+    Get the first and the last day of the week, month or year the given
+    day belongs to.
+    """
+    if period == 'week':
+        from_day = day - timedelta(days=day.isoweekday() - 1)
+        return from_day, from_day + timedelta(days=6)
+    elif period == 'month':
+        from_day = day.replace(day=1)
+        next_month = (from_day + timedelta(days=31)).replace(day=1)
+        return from_day, next_month - timedelta(days=1)
+    elif period == 'year':
+        return day.replace(month=1, day=1), day.replace(month=12, day=31)
+    raise ValueError(f"Unknown report period '{period}'")
+
+
+def get_month_ranges(from_day: date, to_day: date) -> list[tuple[date, date]]:
+    """Split the range of days into (first day, last day) of its months."""
+    ranges = []
+    while from_day <= to_day:
+        _, month_end = get_period_bounds('month', from_day)
+        ranges.append((from_day, min(month_end, to_day)))
+        from_day = month_end + timedelta(days=1)
+    return ranges
+
+
+def get_column(period: str, day: date) -> date:
+    """Get the pivot column the given day is counted in."""
+    if period == 'week':
+        return day
+    elif period == 'month':
+        return day - timedelta(days=day.isoweekday() - 1)
+    else:
+        return day.replace(day=1)
+
+
+@dataclass
+class ReportPartition:
+    """A user's month of a report, computed by a worker process."""
+    user_id: int
+    from_day: date
+    to_day: date
+    # Config of the database with the user's rows
+    config: Config
+    now: datetime
+    project_name: str = None
+
+
+# Registries of a worker process by database URI
+_worker_apps = {}
+
+
+def get_partition_day_totals(
+    partition: ReportPartition
+) -> list[tuple[str, date, int]]:
+    """
+    Get day totals of the partition in a worker process, through a
+    read-only connection of the process opened on first use.
+    """
+    app = _worker_apps.get(partition.config.database_uri)
+    if app is None:
+        engine = create_read_only_engine(partition.config)
+        app = _worker_apps[partition.config.database_uri] = AppRegistry(
+            partition.config, Session(engine), None)
+    app.now = lambda: partition.now
+    try:
+        return TimeLog.get_day_totals(
+            app, partition.user_id, partition.from_day, partition.to_day,
+            partition.project_name)
+    finally:
+        app.session.rollback()
+
+
+class Report:
+    @classmethod
+    def get(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        period: str,
+        project_name: str = None,
+        day: date = None,
+    ) -> ReportData:
+        """
+        Build a report for the week, month or year containing the given day
+        (today regarding deadline by default): a projects x period pivot
+        and per day totals for a heatmap. Uses a single aggregate query.
+
+        Example:
+        report = Report.get(app, user_id, 'week')
+        for project_name, seconds in report.rows.items():
+            print(project_name, seconds)
+        """
+        if day is None:
+            day = get_day_regarding_deadline(app.config, app.now())
+        from_day, to_day = get_period_bounds(period, day)
+        day_totals = TimeLog.get_day_totals(
+            app, user_id, from_day, to_day, project_name)
+        return cls.from_day_totals(period, from_day, to_day, day_totals)
+
+    @classmethod
+    def get_many(
+        cls,
+        app: AppRegistry,
+        user_ids: list[int],
+        period: str,
+        project_name: str = None,
+        day: date = None,
+        workers: int = None,
+    ) -> dict[int, ReportData]:
+        """
+        Build reports of the same period for many users, see get(). The
+        period of every user is split into months, which are computed in
+        parallel by up to workers (config.report_workers, the number of
+        CPUs by default) processes, each with read-only connections of its
+        own. The day totals are merged and pivoted here. Runs in this
+        process if there's a single worker or the database is in memory.
+
+        Example:
+        reports = Report.get_many(app, [1, 2, 3], 'year')
+        for user_id, report in reports.items():
+            print(user_id, sum(report.column_totals))
+        """
+        if day is None:
+            day = get_day_regarding_deadline(app.config, app.now())
+        from_day, to_day = get_period_bounds(period, day)
+        workers = workers or app.config.report_workers or os.cpu_count()
+        database = make_url(app.config.database_uri).database
+        if workers == 1 or not database or database == ':memory:':
+            return {
+                user_id: cls.get(
+                    app.for_user(user_id), user_id, period, project_name, day)
+                for user_id in user_ids
+            }
+
+        now = app.now()
+        partitions = [
+            ReportPartition(
+                user_id, month_from, month_to,
+                app.for_user(user_id).config, now, project_name)
+            for user_id in user_ids
+            for month_from, month_to in get_month_ranges(from_day, to_day)
+        ]
+        day_totals = {user_id: [] for user_id in user_ids}
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(partitions))
+        ) as executor:
+            results = executor.map(get_partition_day_totals, partitions)
+            for partition, partition_totals in zip(partitions, results):
+                day_totals[partition.user_id].extend(partition_totals)
+        return {
+            user_id: cls.from_day_totals(period, from_day, to_day, totals)
+            for user_id, totals in day_totals.items()
+        }
+
+    @classmethod
+    def from_day_totals(
+        cls,
+        period: str,
+        from_day: date,
+        to_day: date,
+        day_totals: list[tuple[str, date, int]],
+    ) -> ReportData:
+        """
+        Pivot (project name, day, seconds) tuples into a report.
+        """
+        columns = []
+        day = from_day
+        while day <= to_day:
+            column = get_column(period, day)
+            if not columns or columns[-1] != column:
+                columns.append(column)
+            day += timedelta(days=1)
+        column_index = {column: i for i, column in enumerate(columns)}
+
+        report = ReportData(period, from_day, to_day, columns)
+        for project_name, day, seconds in day_totals:
+            row = report.rows.get(project_name)
+            if row is None:
+                row = report.rows[project_name] = [0] * len(columns)
+            row[column_index[get_column(period, day)]] += seconds
+            report.day_totals[day] = report.day_totals.get(day, 0) + seconds
+        return report
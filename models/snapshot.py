@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import numpy as np
+from sqlalchemy import select, func, or_
+from models import Project, TimeLog
+from .helper import get_database_dir, deadline_day_shift
+from app_registry import AppRegistry
+
+
+# Column files of a snapshot and their fixed-width types
+SNAPSHOT_COLUMNS = {
+    'id': np.int64,
+    'user_id': np.int32,
+    'project_id': np.int32,
+    'started_at': np.int64,
+    'duration': np.int64,
+}
+
+# Rows are fetched from the database and appended in chunks of this size
+SNAPSHOT_CHUNK_SIZE = 100_000
+
+
+def get_snapshot_dir(app: AppRegistry) -> str:
+    """
+    Get the snapshot directory. By default it's the 'snapshot' directory
+    next to the database file.
+    """
+    if app.config.snapshot_dir:
+        return app.config.snapshot_dir
+    return os.path.join(get_database_dir(app), 'snapshot')
+
+
+def _write_json(path: str, data: dict) -> None:
+    """Replace a json file atomically, so readers never see half of it."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class TimeLogSnapshot:
+    """
+    Read-only columnar snapshot of finished timelog records. Every column
+    is a raw file of fixed-width values, memory-mapped with np.memmap
+    without copying. meta.json holds the number of rows, the greatest id
+    seen by the last build and ids of records that were running then,
+    projects.json is the project dictionary.
+
+    Example:
+    TimeLogSnapshot.build(app)
+    snapshot = TimeLogSnapshot(get_snapshot_dir(app))
+    print(snapshot.duration.sum())
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, 'projects.json')) as f:
+            self.projects = {
+                int(project_id): project
+                for project_id, project in json.load(f).items()
+            }
+
+        rows = self.meta['rows']
+        for name, dtype in SNAPSHOT_COLUMNS.items():
+            if rows:
+                column = np.memmap(
+                    os.path.join(path, f"{name}.bin"),
+                    dtype=dtype, mode='r', shape=(rows,)
+                )
+            else:
+                column = np.empty(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self) -> int:
+        return self.meta['rows']
+
+    @classmethod
+    def build(
+        cls, app: AppRegistry, path: str = None, full: bool = False
+    ) -> int:
+        """
+        Create or update the snapshot, returns the number of appended rows.
+        Finished records with id greater than the last snapshotted one are
+        appended. Running records are skipped and their ids kept in
+        meta.json, so they are appended once they are finished. Edits of
+        already snapshotted records need a full rebuild.
+        """
+        path = path or get_snapshot_dir(app)
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+
+        meta = {'rows': 0, 'last_id': 0, 'running_ids': []}
+        if not full and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+        timelog = TimeLog.records_source(app)
+        new_or_running = or_(
+            timelog.c.id > meta['last_id'],
+            timelog.c.id.in_(meta.get('running_ids', [])),
+        )
+        running_ids = app.session.execute(
+            select(timelog.c.id).where(
+                new_or_running, timelog.c.stoped_at.is_(None))
+        ).scalars().all()
+        stmt = (
+            select(
+                timelog.c.id,
+                timelog.c.user_id,
+                timelog.c.project_id,
+                timelog.c.started_at,
+                func.coalesce(
+                    timelog.c.duration,
+                    timelog.c.stoped_at - timelog.c.started_at
+                ),
+            )
+            .where(new_or_running, timelog.c.stoped_at.is_not(None))
+            .order_by(timelog.c.id)
+        )
+
+        files = {
+            name: open(
+                os.path.join(path, f"{name}.bin"), 'wb' if full else 'ab')
+            for name in SNAPSHOT_COLUMNS
+        }
+        appended = 0
+        try:
+            for name, file in files.items():
+                # Drop rows written by an interrupted build
+                file.truncate(
+                    meta['rows'] * np.dtype(SNAPSHOT_COLUMNS[name]).itemsize)
+            result = app.session.execute(
+                stmt, execution_options={'yield_per': SNAPSHOT_CHUNK_SIZE})
+            for rows in result.partitions():
+                chunk = np.array(rows, dtype=np.int64)
+                for i, (name, dtype) in enumerate(SNAPSHOT_COLUMNS.items()):
+                    files[name].write(chunk[:, i].astype(dtype).tobytes())
+                appended += len(rows)
+                meta['last_id'] = max(meta['last_id'], int(chunk[-1, 0]))
+        finally:
+            for file in files.values():
+                file.close()
+
+        projects = {
+            project.id: {'name': project.name, 'parent_id': project.parent_id}
+            for project in app.session.execute(select(Project)).scalars()
+        }
+        _write_json(os.path.join(path, 'projects.json'), projects)
+
+        meta['rows'] += appended
+        meta['running_ids'] = sorted(running_ids)
+        meta['last_id'] = max([meta['last_id'], *running_ids])
+        meta['deadline_shift'] = deadline_day_shift(app.config)
+        meta['built_at'] = int(app.now().timestamp())
+        # Meta is written last, readers see only the complete rows
+        _write_json(meta_path, meta)
+        return appended
+
+    def days(self) -> np.ndarray:
+        """
+        Day numbers (days since 1970-01-01) of the records regarding
+        deadline, in local time of the snapshot reader.
+        """
+        # Local UTC offset is looked up once per distinct UTC day rather
+        # than per record, so DST changes are still taken into account
+        utc_days, inverse = np.unique(
+            self.started_at // 86400, return_inverse=True)
+        offsets = np.array(
+            [time.localtime(int(day) * 86400).tm_gmtoff for day in utc_days],
+            dtype=np.int64,
+        )
+        local = self.started_at + offsets[inverse]
+        return (local + self.meta['deadline_shift']) // 86400
+
+    def weekdays(self) -> np.ndarray:
+        """Weekdays of the records regarding deadline, 1 - monday."""
+        # 1970-01-01 was thursday
+        return (self.days() + 3) % 7 + 1
+
+    def total_by_project(self, user_id: int) -> dict[str, int]:
+        """Seconds worked per project name."""
+        mask = self.user_id == user_id
+        project_ids, inverse = np.unique(
+            self.project_id[mask], return_inverse=True)
+        totals = np.bincount(inverse, weights=self.duration[mask])
+        return {
+            self.projects[int(project_id)]['name']: int(total)
+            for project_id, total in zip(project_ids, totals)
+        }
+
+    def average_session_by_weekday(
+        self, user_id: int
+    ) -> dict[str, list[float]]:
+        """
+        Average record duration in seconds per project name and weekday
+        (monday first). Weekdays without records have 0.
+        """
+        mask = self.user_id == user_id
+        project_ids, inverse = np.unique(
+            self.project_id[mask], return_inverse=True)
+        cells = inverse * 7 + (self.weekdays()[mask] - 1)
+        size = len(project_ids) * 7
+        sums = np.bincount(cells, weights=self.duration[mask], minlength=size)
+        counts = np.bincount(cells, minlength=size)
+        averages = np.divide(
+            sums, counts, out=np.zeros(size), where=counts > 0
+        ).reshape(-1, 7)
+        return {
+            self.projects[int(project_id)]['name']: averages[i].tolist()
+            for i, project_id in enumerate(project_ids)
+        }
@@ -1,14 +1,44 @@
+import os
 import re
+from datetime import datetime, date, time, timedelta
 from typing import TypeVar
 from dataclasses import dataclass
-from sqlalchemy import Column, Integer, String, ForeignKey
-from models import Base, Project
-from .helper import datetime_from_string
+import numpy as np
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    ForeignKey,
+    Index,
+    select,
+    bindparam,
+    func,
+    union_all,
+    FromClause,
+)
+from sqlalchemy.orm import relationship, joinedload
+from models import Base, Project, Change
+from .helper import (
+    datetime_from_string,
+    write_transaction,
+    begin_immediate,
+    sql_day_regarding_deadline,
+    get_day_end,
+)
+from .archive import (
+    get_archive_dir,
+    get_archived_years,
+    attach_archives,
+    get_archive_table,
+)
 from app_registry import AppRegistry
 
 
 TTimeLog = TypeVar("TTimeLog", bound="TimeLog")
 
+# Groupings of TimeLog.range_totals()
+RANGE_GROUPS = ('day', 'project', 'project_day')
+
 
 @dataclass
 class StartProjectData:
@@ -27,6 +57,17 @@ class TimeLog(Base):
     duration = Column(Integer)
     comment = Column(String)
 
+    project = relationship(Project)
+
+    __table_args__ = (
+        Index('timelog__started_at_idx', 'started_at'),
+        # Last records of a user, day totals; ordered by (started_at, id)
+        # as id is the rowid
+        Index('timelog__user_id_started_at_idx', 'user_id', 'started_at'),
+        # Longest record of a user, the look-back of range_totals()
+        Index('timelog__user_id_duration_idx', 'user_id', 'duration'),
+    )
+
     @classmethod
     def get_last_time_record(
         cls, app: AppRegistry, user_id: int, tail_number: int = 1
@@ -37,15 +78,13 @@ class TimeLog(Base):
         the record in the list of time records when sorted by start time
         in descending order.
         """
-        return (
-            app.session.query(cls)
-            .filter(cls.user_id == user_id)
-            .order_by(cls.started_at.desc(), cls.id.desc())
-            .offset(tail_number - 1)
-            .first()
-        )
+        return app.session.execute(
+            _last_time_record_stmt,
+            {"user_id": user_id, "offset": tail_number - 1},
+        ).scalar_one_or_none()
 
     @classmethod
+    @write_transaction
     def stop_last_record(
         cls,
         app: AppRegistry,
@@ -56,12 +95,15 @@ class TimeLog(Base):
 
         # Return if last time record is non existent or is already stoped
         if not last_time_record or last_time_record.stoped_at:
+            if commit:
+                app.session.commit()  # release the write lock
             return None
 
         last_time_record.stop(app, commit=commit)
         return last_time_record
 
     @classmethod
+    @write_transaction
     def start_project(
         cls,
         app: AppRegistry,
@@ -72,7 +114,8 @@ class TimeLog(Base):
     ) -> StartProjectData:
         """
         Start working on a project.
-        If a project is currently running, stop it first.
+        If a project is currently running, stop it first. If it's the same
+        project, keep it running unless restart_anyway is set.
         If no project name is provided, the last active project
         will be started.
         """
@@ -84,20 +127,20 @@ class TimeLog(Base):
         else:
             if not last_time_record:
                 raise ValueError("No projects with timelog records yet")
-            project_to_start = Project.get_by_id(
-                app, last_time_record.project_id)
+            project_to_start = last_time_record.project
 
-        # Stop the last timelog record if needed
+        # Stop the last timelog record if it's still running
         time_record_to_stop = None
-        if (
-            last_time_record
-            and (
-                last_time_record.project_id != project_to_start.id
-                or restart_anyway
-            )
-        ):
+        if last_time_record and not last_time_record.stoped_at:
+            if (
+                last_time_record.project_id == project_to_start.id
+                and not restart_anyway
+            ):
+                # Already working on this project, just release the lock
+                app.session.commit()
+                return StartProjectData(project_to_start, None)
             time_record_to_stop = last_time_record
-            time_record_to_stop.stop(app)
+            time_record_to_stop.stop(app, commit=False)
 
         # Insert a new timelog record
         new_time_record = cls(
@@ -107,6 +150,7 @@ class TimeLog(Base):
             comment=comment
         )
         app.session.add(new_time_record)
+        Change.record(app, new_time_record)
         app.session.commit()
 
         return StartProjectData(project_to_start, time_record_to_stop)
@@ -145,11 +189,9 @@ class TimeLog(Base):
                 raise ValueError("No time records at all")
         else:
             record_id = int(record_identifier)
-            record = (
-                app.session.query(cls)
-                .filter(cls.id == record_id, cls.user_id == user_id)
-                .one()
-            )
+            record = app.session.execute(
+                _get_record_stmt, {"record_id": record_id, "user_id": user_id}
+            ).scalar_one()
 
         return record
 
@@ -169,6 +211,7 @@ class TimeLog(Base):
         """
         record = cls.get_record(app, user_id, record_identifier)
         record.comment = comment
+        Change.record(app, record)
         app.session.commit()
 
         return record
@@ -184,6 +227,8 @@ class TimeLog(Base):
         deleted_record = TimeLog.delete_record(app, user_id, "last")
         """
         record = cls.get_record(app, user_id, record_identifier)
+        cls._invalidate_balances(app, user_id, record.started_at)
+        Change.record_delete(app, record)
         app.session.delete(record)
         app.session.commit()
         return record
@@ -211,8 +256,11 @@ class TimeLog(Base):
         else:
             duration = None
 
+        cls._invalidate_balances(
+            app, user_id, record.started_at, int(started_at_dt.timestamp()))
         record.started_at = int(started_at_dt.timestamp())
         record.duration = duration
+        Change.record(app, record)
         app.session.commit()
 
         return record
@@ -244,6 +292,8 @@ class TimeLog(Base):
 
         record.stoped_at = int(stopped_at_dt.timestamp())
         record.duration = duration
+        cls._invalidate_balances(app, user_id, record.started_at)
+        Change.record(app, record)
         app.session.commit()
 
         return record
@@ -268,14 +318,27 @@ class TimeLog(Base):
         project = Project.get_by_name(app, user_id, project_name)
 
         record.project_id = project.id
+        cls._invalidate_balances(app, user_id, record.started_at)
+        Change.record(app, record)
         app.session.commit()
 
         return record
 
+    @classmethod
+    def _invalidate_balances(
+        cls, app: AppRegistry, user_id: int, *timestamps: int
+    ) -> None:
+        """Drop goal ledger rows from the day of the earliest timestamp."""
+        from models import GoalBalance
+
+        GoalBalance.invalidate_at(app, user_id, *timestamps)
+
     def stop(self, app: AppRegistry, commit: bool = True) -> None:
         now = int(app.now().timestamp())
         self.stoped_at = now
         self.duration = now - self.started_at
+        self._invalidate_balances(app, self.user_id, self.started_at)
+        Change.record(app, self)
         if commit:
             app.session.commit()
 
@@ -285,7 +348,7 @@ class TimeLog(Base):
     ) -> list[tuple[TTimeLog, Project]]:
         """
         Retrieve the timelog along with the associated projects
-            for the given user.
+            for the given user, by a single query.
 
         Example:
         timelog = TimeLog.get_timelog(app, user_id, page=1, page_size=10)
@@ -294,12 +357,333 @@ class TimeLog(Base):
             print(project.name)
         """
         offset = (page - 1) * page_size
-        return (
-            app.session.query(cls, Project)
-            .join(Project, cls.project_id == Project.id)
-            .filter(cls.user_id == user_id)
+        records = app.session.execute(
+            select(cls)
+            .options(joinedload(cls.project, innerjoin=True))
+            .where(cls.user_id == user_id)
             .order_by(cls.started_at.desc(), cls.id.desc())
             .offset(offset)
             .limit(page_size)
-            .all()
+        ).scalars().all()
+        return [(record, record.project) for record in records]
+
+    @classmethod
+    def get_day_totals(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        from_day: date,
+        to_day: date,
+        project_name: str = None,
+    ) -> list[tuple[str, date, int]]:
+        """
+        Get seconds worked per project and per day regarding deadline
+        from from_day to to_day inclusive, as (project name, day, seconds)
+        tuples. Records are attributed to the day they were started.
+        Running records are counted up to now. If project_name is given
+        only the project and its subprojects are counted.
+        Computed by a single grouped aggregate query.
+
+        Example:
+        for name, day, seconds in TimeLog.get_day_totals(
+            app, user_id, date(2023, 5, 1), date(2023, 5, 7)
+        ):
+            print(name, day, seconds)
+        """
+        now = int(app.now().timestamp())
+        timelog = cls.records_source(app, from_day)
+        day = sql_day_regarding_deadline(app.config, timelog.c.started_at)
+        # A record belongs to a day at most one day away from its local
+        # date, so a coarse started_at range lets SQLite use the index,
+        # while the exact filtering is done by the day expression
+        from_ts = datetime.combine(from_day - timedelta(days=1), time())
+        to_ts = datetime.combine(to_day + timedelta(days=2), time())
+        stmt = (
+            select(
+                Project.name,
+                day,
+                func.sum(func.coalesce(
+                    timelog.c.duration, now - timelog.c.started_at
+                )),
+            )
+            .join(Project, timelog.c.project_id == Project.id)
+            .where(
+                timelog.c.user_id == user_id,
+                timelog.c.started_at >= int(from_ts.timestamp()),
+                timelog.c.started_at < int(to_ts.timestamp()),
+                day.between(from_day.isoformat(), to_day.isoformat()),
+            )
+            .group_by(Project.name, day)
+            .order_by(Project.name, day)
         )
+        if project_name:
+            stmt = stmt.where(timelog.c.project_id.in_(
+                Project.subtree_ids(user_id, project_name)
+            ))
+        return [
+            (name, date.fromisoformat(day), seconds)
+            for name, day, seconds in app.session.execute(stmt)
+        ]
+
+    @classmethod
+    def range_totals(
+        cls,
+        app: AppRegistry,
+        user_id: int,
+        from_day: date,
+        to_day: date,
+        group_by: str = 'day',
+        project_name: str = None,
+    ) -> dict:
+        """
+        Get seconds worked from the start of from_day to the end of to_day
+        (days regarding deadline, inclusive), grouped by 'day', 'project'
+        or 'project_day' as {day: seconds}, {project name: seconds} or
+        {(project name, day): seconds}; groups with nothing worked are
+        left out. Unlike get_day_totals(), records are clipped to the
+        range and split between the days they cross, running records are
+        counted up to now. If project_name is given only the project and
+        its subprojects are counted. A standalone API: reports, failures,
+        balances and forecasts keep counting whole records on the day they
+        started on, see GoalFailure.get_worked_matrix().
+
+        Records overlapping the range are read through the (user_id,
+        started_at) index, looking back no further than the user's longest
+        record. Clipping is done by NumPy for all records at once.
+
+        Example:
+        totals = TimeLog.range_totals(
+            app, user_id, date(2023, 5, 1), date(2023, 5, 7), 'project_day')
+        for (name, day), seconds in totals.items():
+            print(name, day, seconds)
+        """
+        if group_by not in RANGE_GROUPS:
+            raise ValueError(
+                f"Unknown grouping '{group_by}', "
+                f"expected one of: {', '.join(RANGE_GROUPS)}")
+        days = [
+            from_day + timedelta(days=i)
+            for i in range((to_day - from_day).days + 1)
+        ]
+        edges = np.array([
+            int(get_day_end(app.config, day).timestamp())
+            for day in [from_day - timedelta(days=1)] + days
+        ], dtype=np.int64)
+        range_start, range_end = int(edges[0]), int(edges[-1])
+        now = int(app.now().timestamp())
+
+        look_back = cls._get_longest_duration(app, user_id, now)
+        timelog = cls.records_source(
+            app, date.fromtimestamp(range_start - look_back))
+        stoped_at = func.coalesce(timelog.c.stoped_at, now)
+        stmt = select(
+            timelog.c.project_id, timelog.c.started_at, stoped_at
+        ).where(
+            timelog.c.user_id == user_id,
+            timelog.c.started_at >= range_start - look_back,
+            timelog.c.started_at < range_end,
+            stoped_at > range_start,
+        )
+        if project_name:
+            stmt = stmt.where(timelog.c.project_id.in_(
+                Project.subtree_ids(user_id, project_name)
+            ))
+        # Plain tuples, NumPy probes Row objects for the array interface
+        rows = np.array(
+            [tuple(row) for row in app.session.execute(stmt)],
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        if not len(rows):
+            return {}
+
+        if group_by == 'day':
+            project_ids = np.zeros(1, dtype=np.int64)
+            groups = np.zeros(len(rows), dtype=np.int64)
+        else:
+            project_ids, groups = np.unique(rows[:, 0], return_inverse=True)
+        # seconds[group, day]
+        seconds = _split_by_edges(
+            np.clip(rows[:, 1], range_start, range_end),
+            np.clip(rows[:, 2], range_start, range_end),
+            groups,
+            len(project_ids),
+            edges,
+        )
+
+        if group_by == 'day':
+            return {
+                day: int(total)
+                for day, total in zip(days, seconds[0]) if total
+            }
+        names = dict(app.session.execute(
+            select(Project.id, Project.name)
+            .where(Project.id.in_(project_ids.tolist()))
+        ).all())
+        if group_by == 'project':
+            return {
+                names[project_id]: int(total)
+                for project_id, total in zip(
+                    project_ids.tolist(), seconds.sum(axis=1))
+                if total
+            }
+        return {
+            (names[project_ids[group]], days[day]): int(seconds[group, day])
+            for group, day in zip(*np.nonzero(seconds))
+        }
+
+    @classmethod
+    def _get_longest_duration(
+        cls, app: AppRegistry, user_id: int, now: int
+    ) -> int:
+        """
+        Get the duration of the longest record of the user, the running
+        one counted up to now.
+        """
+        timelog = cls.records_source(app)
+        longest = app.session.execute(
+            select(func.max(timelog.c.duration))
+            .where(timelog.c.user_id == user_id)
+        ).scalar() or 0
+        # Only the last record may be running
+        last_record = cls.get_last_time_record(app, user_id)
+        if last_record is not None and last_record.stoped_at is None:
+            longest = max(longest, now - last_record.started_at)
+        return longest
+
+    @classmethod
+    def records_source(
+        cls, app: AppRegistry, from_day: date = None
+    ) -> FromClause:
+        """
+        Get the selectable to read timelog records starting from the given
+        day (all records if not given) from. That's the timelog table
+        itself while the range doesn't reach archived years, otherwise
+        it's a UNION ALL of the table and the archives of the needed years,
+        which are attached on demand. Columns are the same in both cases.
+
+        Example:
+        timelog = TimeLog.records_source(app, date(2019, 1, 1))
+        stmt = select(func.sum(timelog.c.duration))
+        """
+        years = [
+            year for year in get_archived_years(app)
+            if from_day is None or year >= from_day.year
+        ]
+        if not years:
+            return cls.__table__
+
+        attach_archives(app, years)
+        return union_all(
+            select(cls.__table__),
+            *[
+                select(get_archive_table(cls.__table__, year))
+                for year in years
+            ],
+        ).subquery(cls.__tablename__)
+
+    @classmethod
+    def archive_records(
+        cls, app: AppRegistry, before: datetime
+    ) -> dict[int, int]:
+        """
+        Move closed records started before the given time from the timelog
+        table into per-year archive files, in one transaction. Returns the
+        number of moved records per year.
+
+        Example:
+        moved = TimeLog.archive_records(app, datetime(2022, 1, 1))
+        """
+        before_ts = int(before.timestamp())
+        year_expr = func.strftime(
+            '%Y', cls.started_at, 'unixepoch', 'localtime')
+        years = [
+            int(year) for (year,) in app.session.execute(
+                select(year_expr).where(
+                    cls.started_at < before_ts,
+                    cls.stoped_at.is_not(None),
+                ).distinct()
+            )
+        ]
+        if not years:
+            return {}
+
+        os.makedirs(get_archive_dir(app), exist_ok=True)
+        # ATTACH is not allowed inside of a transaction
+        app.session.commit()
+        attach_archives(app, years)
+
+        moved = {}
+        begin_immediate(app)
+        try:
+            connection = app.session.connection()
+            for year in years:
+                archive_table = get_archive_table(cls.__table__, year)
+                archive_table.create(connection, checkfirst=True)
+                for index in archive_table.indexes:
+                    index.create(connection, checkfirst=True)
+                records = select(cls.__table__).where(
+                    cls.started_at < before_ts,
+                    cls.stoped_at.is_not(None),
+                    year_expr == str(year),
+                )
+                connection.execute(archive_table.insert().from_select(
+                    [column.name for column in cls.__table__.columns],
+                    records,
+                ))
+                moved[year] = connection.execute(
+                    cls.__table__.delete().where(
+                        cls.id.in_(records.with_only_columns(cls.id))
+                    )
+                ).rowcount
+            app.session.commit()
+        except BaseException:
+            app.session.rollback()
+            raise
+        # Archived records may still be in the identity map
+        app.session.expunge_all()
+        return moved
+
+
+def _split_by_edges(
+    starts: np.ndarray,
+    stops: np.ndarray,
+    groups: np.ndarray,
+    group_count: int,
+    edges: np.ndarray,
+) -> np.ndarray:
+    """
+    Get the seconds of [start, stop) intervals of every group falling
+    between every two consecutive edges, as a (group_count, len(edges) - 1)
+    array. The intervals must lie within the edges.
+
+    The time covered up to a moment t is the sum of (t - start) over the
+    started intervals minus the sum of (t - stop) over the stopped ones,
+    so it's evaluated at all edges by binary searches in the sorted starts
+    and stops and their cumulative sums. Groups are shifted apart on the
+    time axis so they are evaluated in the same pass.
+    """
+    span = int(edges[-1] - edges[0]) + 1
+    shifts = np.arange(group_count, dtype=np.int64) * span
+    points = (edges[np.newaxis, :] + shifts[:, np.newaxis]).ravel()
+    covered = np.zeros(len(points), dtype=np.int64)
+    for values, sign in ((starts, 1), (stops, -1)):
+        values = np.sort(values + shifts[groups])
+        sums = np.concatenate(([0], np.cumsum(values)))
+        counts = np.searchsorted(values, points, side='right')
+        covered += sign * (points * counts - sums[counts])
+    return np.diff(covered.reshape(group_count, len(edges)), axis=1)
+
+
+# Prebuilt statements for the hot lookups, see models/project.py
+_last_time_record_stmt = (
+    select(TimeLog)
+    .where(TimeLog.user_id == bindparam("user_id"))
+    .order_by(TimeLog.started_at.desc(), TimeLog.id.desc())
+    .limit(1)
+    .offset(bindparam("offset", type_=Integer))
+)
+
+_get_record_stmt = select(TimeLog).where(
+    TimeLog.id == bindparam("record_id"),
+    TimeLog.user_id == bindparam("user_id"),
+)
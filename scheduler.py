@@ -0,0 +1,313 @@
+"""
+Timer heap of the long-running process. Next event times are computed
+per user and goal and kept in a heap, the process sleeps until the
+earliest one. Changes of timelog, goals and commitments are picked up
+from the change journal, and only events of the affected users are
+recomputed. With sharding, events of every user are computed on the user's
+shard and every shard's journal is followed.
+"""
+import heapq
+import itertools
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable
+from sqlalchemy import select, func
+from models import (
+    User, Project, TimeLog, Goal, Change, SyncRow, GoalFailure, GoalBalance
+)
+from models.helper import seconds_to_hm
+from app_registry import AppRegistry
+
+
+# Seconds until a failed task is retried
+TASK_RETRY_DELAY = 60
+
+# Kinds of events
+DEADLINE = 'deadline'  # the day is over regarding deadline
+MUST_START = 'must_start'  # a goal will be missed unless work starts soon
+RUNNING_TOO_LONG = 'running_too_long'  # the running record passed threshold
+TASK = 'task'  # periodic task of the process, e.g. backup
+
+
+@dataclass(order=True)
+class ScheduledEvent:
+    at: datetime
+    # Tie breaker keeping the heap order stable
+    seq: int
+    kind: str = field(compare=False)
+    user_id: int = field(compare=False, default=None)
+    # Identifies the event within the user, so an alert is sent once
+    key: tuple = field(compare=False, default=())
+    message: str = field(compare=False, default=None)
+    # Events of a user computed before the user's last refresh are stale
+    generation: int = field(compare=False, default=0)
+    task: Callable = field(compare=False, default=None)
+
+
+class Scheduler:
+    """
+    Example:
+    scheduler = Scheduler(app, alert=print)
+    scheduler.add_task(backup_task)
+    while True:
+        time.sleep(scheduler.run_pending())
+    """
+
+    def __init__(self, app: AppRegistry, alert: Callable[[str], None]):
+        self.app = app
+        self.alert = alert
+        self.heap = []
+        self.counter = itertools.count()
+        self.generations = {}  # user_id -> generation of current events
+        self.alerted = set()  # (user_id, key) of sent alerts
+        self.last_change_seq = None
+        self.last_change_seqs = {}  # user_id -> seq, with sharding
+        # user_id -> ShardPool.get_file_state() when the seq was read
+        self.shard_file_states = {}
+        # Stale events are dropped lazily when popped, the heap is rebuilt
+        # when they become the majority
+        self.live_counts = {}  # user_id -> number of current events
+        self.stale_count = 0
+
+    def push(self, event: ScheduledEvent) -> None:
+        event.seq = next(self.counter)
+        if event.user_id is not None:
+            event.generation = self.generations.get(event.user_id, 0)
+        heapq.heappush(self.heap, event)
+
+    def add_task(
+        self, task: Callable[[AppRegistry], float], at: datetime = None
+    ) -> None:
+        """
+        Schedule a periodic task, run now by default. The task returns the
+        number of seconds until it should run next time.
+        """
+        self.push(ScheduledEvent(
+            at=at or self.app.now(), seq=0, kind=TASK, task=task))
+
+    def refresh_all(self) -> None:
+        users = self.app.session.execute(select(User.id)).scalars().all()
+        for user_id in users:
+            self.refresh_user(user_id)
+
+    def refresh_user(self, user_id: int) -> None:
+        """
+        Replace events of the user with newly computed ones. Sent alerts of
+        records which aren't running any more are forgotten.
+        """
+        self.generations[user_id] = self.generations.get(user_id, 0) + 1
+        events = self.compute_user_events(user_id)
+        running_keys = {
+            event.key for event in events if event.kind == RUNNING_TOO_LONG}
+        self.alerted = {
+            (alerted_user_id, key) for alerted_user_id, key in self.alerted
+            if alerted_user_id != user_id or key[0] != RUNNING_TOO_LONG
+            or key in running_keys
+        }
+        self.stale_count += self.live_counts.get(user_id, 0)
+        self.live_counts[user_id] = len(events)
+        for event in events:
+            self.push(event)
+        if self.stale_count > len(self.heap) // 2:
+            self.heap = [
+                event for event in self.heap if not self.is_stale(event)]
+            heapq.heapify(self.heap)
+            self.stale_count = 0
+
+    def is_stale(self, event: ScheduledEvent) -> bool:
+        return (
+            event.user_id is not None
+            and event.generation != self.generations.get(event.user_id)
+        )
+
+    def compute_user_events(self, user_id: int) -> list[ScheduledEvent]:
+        app = self.app.for_user(user_id)
+        now = app.now()
+        config = app.config
+        events = []
+        infos = GoalBalance.get_goals_info(app, user_id)
+
+        today = GoalFailure.get_closed_day(app) + timedelta(days=1)
+        if infos:
+            # The deadline itself still belongs to the day
+            events.append(ScheduledEvent(
+                at=infos[0].deadline + timedelta(seconds=1), seq=0,
+                kind=DEADLINE, user_id=user_id, key=(DEADLINE, today)))
+
+        running = TimeLog.get_last_time_record(app, user_id)
+        if running is not None and running.stoped_at is not None:
+            running = None
+
+        for info in infos:
+            if info.balance >= 0:
+                continue
+            if running is not None and info.goal.project is not None:
+                subtree = app.session.execute(Project.subtree_ids(
+                    user_id, info.goal.project.name)).scalars().all()
+                if running.project_id in subtree:
+                    # Being worked on, the balance is growing
+                    continue
+            must_start_at = info.deadline - timedelta(seconds=-info.balance)
+            if must_start_at <= now:
+                message = (
+                    f"Goal '{info.goal.name}' will be missed: "
+                    f"{seconds_to_hm(-info.balance)} due before "
+                    f"{info.deadline:%H:%M}")
+            else:
+                message = (
+                    f"Start working on '{info.goal.name}' by "
+                    f"{must_start_at:%H:%M}: "
+                    f"{seconds_to_hm(-info.balance)} due before "
+                    f"{info.deadline:%H:%M}")
+            events.append(ScheduledEvent(
+                at=must_start_at - timedelta(seconds=config.alert_lead),
+                seq=0, kind=MUST_START, user_id=user_id,
+                key=(MUST_START, info.goal.id, today), message=message))
+
+        if running is not None and config.running_alert_after:
+            project = running.project
+            threshold = config.running_alert_after
+            events.append(ScheduledEvent(
+                at=datetime.fromtimestamp(running.started_at + threshold),
+                seq=0, kind=RUNNING_TOO_LONG, user_id=user_id,
+                key=(RUNNING_TOO_LONG, running.id),
+                message=(
+                    f"'{project.name}' is running for more than "
+                    f"{seconds_to_hm(threshold)}")))
+        return events
+
+    def get_changed_users(self) -> set[int]:
+        """
+        Get users whose timelog, goals or commitments changed since the
+        last call according to the change journal. None means everything
+        must be recomputed: the first call, or changes which can't be
+        attributed to a user, like deletions.
+        """
+        if self.app.shards is not None:
+            return self.get_changed_shard_users()
+
+        session = self.app.session
+        if self.last_change_seq is None:
+            self.last_change_seq = session.execute(
+                select(func.coalesce(func.max(Change.seq), 0))
+            ).scalar_one()
+            return None
+
+        changes = session.execute(
+            select(Change.seq, Change.table_name, Change.data)
+            .where(Change.seq > self.last_change_seq)
+            .order_by(Change.seq)
+        ).all()
+        if changes:
+            self.last_change_seq = changes[-1].seq
+        user_ids = set()
+        for _, table_name, data in changes:
+            if table_name == 'projects':
+                continue
+            data = json.loads(data) if data else {}
+            if 'user_id' in data:
+                user_ids.add(data['user_id'])
+            elif 'goal_id' in data:
+                user_id = session.execute(
+                    select(Goal.user_id)
+                    .join(SyncRow, SyncRow.local_id == Goal.id)
+                    .where(
+                        SyncRow.table_name == 'goals',
+                        SyncRow.uid == data['goal_id'],
+                    )
+                ).scalar_one_or_none()
+                if user_id is None:
+                    return None
+                user_ids.add(user_id)
+            else:
+                return None
+        return user_ids
+
+    def get_changed_shard_users(self) -> set[int]:
+        """
+        A shard only holds its user's rows, so the user changed if the
+        shard's journal grew. Only shards whose files changed since the
+        last call are opened to read it, so polling doesn't cycle all of
+        them through the pool. Users new to the catalog count as changed.
+        """
+        shards = self.app.shards
+        user_ids = set()
+        last_seqs = {}
+        file_states = {}
+        for user_id in shards.get_user_ids():
+            # Taken before reading, a write after it is seen next time
+            file_state = file_states[user_id] = shards.get_file_state(user_id)
+            if user_id in self.last_change_seqs and \
+                    file_state == self.shard_file_states.get(user_id):
+                last_seqs[user_id] = self.last_change_seqs[user_id]
+                continue
+            app = shards.get_app(user_id)
+            if file_state is None:
+                # Just created with an empty journal
+                file_states[user_id] = shards.get_file_state(user_id)
+            try:
+                last_seqs[user_id] = app.session.execute(
+                    select(func.coalesce(func.max(Change.seq), 0))
+                ).scalar_one()
+            finally:
+                app.session.rollback()
+            if self.last_change_seqs.get(user_id) != last_seqs[user_id]:
+                user_ids.add(user_id)
+        self.last_change_seqs = last_seqs
+        self.shard_file_states = file_states
+        return user_ids
+
+    def run_pending(self) -> float:
+        """
+        Refresh users changed since the last call, handle the events which
+        are due, and return seconds until the next one, but not more than
+        config.scheduler_poll so changes are picked up in time.
+        """
+        user_ids = self.get_changed_users()
+        if user_ids is None:
+            self.refresh_all()
+        else:
+            for user_id in user_ids:
+                self.refresh_user(user_id)
+
+        while self.heap and self.heap[0].at <= self.app.now():
+            event = heapq.heappop(self.heap)
+            if self.is_stale(event):
+                self.stale_count -= 1
+                continue
+            if event.user_id is not None:
+                self.live_counts[event.user_id] -= 1
+            self.handle(event)
+
+        timeout = self.app.config.scheduler_poll
+        if self.heap:
+            until_next = (self.heap[0].at - self.app.now()).total_seconds()
+            timeout = min(timeout, until_next)
+        return max(timeout, 0)
+
+    def handle(self, event: ScheduledEvent) -> None:
+        if event.kind == TASK:
+            try:
+                next_in = event.task(self.app)
+            except Exception:
+                logging.exception("Task %s failed", event.task.__name__)
+                next_in = TASK_RETRY_DELAY
+            finally:
+                self.app.session.rollback()
+            self.add_task(
+                event.task, self.app.now() + timedelta(seconds=next_in))
+        elif event.kind == DEADLINE:
+            # Alerts of the closed day won't be repeated anyway
+            self.alerted = {
+                (user_id, key) for user_id, key in self.alerted
+                if user_id != event.user_id or key[0] == RUNNING_TOO_LONG
+            }
+            app = self.app.for_user(event.user_id)
+            GoalFailure.evaluate(app, event.user_id)
+            GoalBalance.update(app, event.user_id)
+            self.refresh_user(event.user_id)
+        elif (event.user_id, event.key) not in self.alerted:
+            self.alerted.add((event.user_id, event.key))
+            self.alert(event.message)
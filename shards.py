@@ -0,0 +1,154 @@
+"""
+Per-user sharding. Every user's projects, goals, timelog and journal are
+kept in a database file of their own, so writers of different users don't
+wait for each other's lock. The configured database is the catalog of
+users, each shard holds a copy of its user's row for foreign keys.
+Enabled by ZUD_SHARD_DIR.
+"""
+import os
+import copy
+from collections import OrderedDict
+from typing import Callable, TypeVar
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from config import Config
+from models import User
+from models.migration import migrate
+from app_registry import AppRegistry
+
+
+T = TypeVar('T')
+
+
+def get_shard_path(config: Config, user_id: int) -> str:
+    """
+    Get the database file of the user's shard. Every shard has a directory,
+    so archives, snapshots and backups next to it are per user too.
+    """
+    return os.path.join(config.shard_dir, f"user_{user_id}", 'db.sqlite3')
+
+
+class ShardPool:
+    """
+    LRU pool of open shard databases, at most config.shard_pool_size.
+    Registries of shards evicted from the pool are closed, so don't keep
+    one across get_app() calls for other users.
+
+    Example:
+    app = create_app(config)  # with ZUD_SHARD_DIR set
+    user_app = app.for_user(user_id)
+    TimeLog.start_project(user_app, user_id, "Project")
+    last_records = app.shards.map(TimeLog.get_last_time_record)
+    """
+
+    def __init__(self, catalog: AppRegistry):
+        self.catalog = catalog
+        self.apps = OrderedDict()  # user_id -> AppRegistry, oldest first
+
+    def get_config(self, user_id: int) -> Config:
+        """Get the config of the user's shard."""
+        config = copy.copy(self.catalog.config)
+        config.database_uri = (
+            f"sqlite:///{get_shard_path(self.catalog.config, user_id)}")
+        config.shard_dir = None
+        for name in ('archive_dir', 'snapshot_dir', 'backup_dir'):
+            if getattr(config, name):
+                setattr(config, name, os.path.join(
+                    getattr(config, name), f"user_{user_id}"))
+        return config
+
+    def get_app(self, user_id: int) -> AppRegistry:
+        """
+        Get the registry of the user's shard, opening it if it isn't in
+        the pool. A missing shard is created with the latest schema.
+        """
+        app = self.apps.get(user_id)
+        if app is not None:
+            self.apps.move_to_end(user_id)
+            return app
+
+        user = self.catalog.session.execute(
+            select(User.id, User.name).where(User.id == user_id)
+        ).one_or_none()
+        # Don't hold a read lock on the catalog
+        self.catalog.session.rollback()
+        if user is None:
+            raise ValueError(f"User #{user_id} doesn't exist")
+
+        config = self.get_config(user_id)
+        path = get_shard_path(self.catalog.config, user_id)
+        is_new = not os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        engine = create_engine(
+            config.database_uri,
+            future=True,
+            query_cache_size=config.query_cache_size,
+        )
+        app = AppRegistry(
+            config, Session(engine), lambda: self.catalog.now())
+        if is_new:
+            migrate(app)
+            app.session.add(User(id=user.id, name=user.name))
+            app.session.commit()
+
+        self.apps[user_id] = app
+        while len(self.apps) > self.catalog.config.shard_pool_size:
+            _, evicted = self.apps.popitem(last=False)
+            self._close(evicted)
+        return app
+
+    def get_file_state(self, user_id: int) -> tuple:
+        """
+        Get the modification times and sizes of the user's shard file and
+        its WAL file without opening the shard, None if it doesn't exist.
+        Any commit changes them.
+        """
+        path = get_shard_path(self.catalog.config, user_id)
+        state = []
+        for file_path in (path, path + '-wal'):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                if file_path == path:
+                    return None
+                state.append(None)
+                continue
+            state.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(state)
+
+    def get_user_ids(self) -> list[int]:
+        user_ids = self.catalog.session.execute(
+            select(User.id).order_by(User.id)).scalars().all()
+        self.catalog.session.rollback()
+        return user_ids
+
+    def map(self, fn: Callable[[AppRegistry, int], T]) -> dict[int, T]:
+        """
+        Call fn with the registry of every user's shard and the user id,
+        one shard at a time, and return results by user id. Used for
+        queries across users. fn must commit what it writes, anything left
+        uncommitted is rolled back.
+        """
+        results = {}
+        for user_id in self.get_user_ids():
+            app = self.get_app(user_id)
+            try:
+                results[user_id] = fn(app, user_id)
+            finally:
+                app.session.rollback()
+        return results
+
+    def rollback(self) -> None:
+        """End transactions of the open shards, e.g. idle read ones."""
+        for app in self.apps.values():
+            app.session.rollback()
+
+    def close(self) -> None:
+        while self.apps:
+            _, app = self.apps.popitem()
+            self._close(app)
+
+    @staticmethod
+    def _close(app: AppRegistry) -> None:
+        app.session.close()
+        app.session.get_bind().dispose()
@@ -0,0 +1,28 @@
+-- 2023-05-20
+-- change journal for syncing databases between machines --
+CREATE TABLE changes (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  node TEXT NOT NULL,
+  node_seq INTEGER NOT NULL,
+  table_name TEXT NOT NULL,
+  row_uid TEXT NOT NULL,
+  op TEXT NOT NULL, -- upsert or delete
+  data TEXT, -- json
+  changed_at INTEGER NOT NULL,
+  UNIQUE (node, node_seq)
+);
+CREATE INDEX changes__row_uid_idx ON changes(row_uid);
+
+CREATE TABLE sync_rows (
+  table_name TEXT NOT NULL,
+  uid TEXT NOT NULL,
+  local_id INTEGER NOT NULL,
+  PRIMARY KEY (table_name, uid)
+);
+CREATE INDEX sync_rows__table_name_local_id_idx ON sync_rows(table_name, local_id);
+
+CREATE TABLE sync_peers (
+  node TEXT NOT NULL PRIMARY KEY,
+  vector TEXT NOT NULL, -- json {node: node_seq}
+  synced_at INTEGER NOT NULL
+);
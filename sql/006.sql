@@ -0,0 +1,19 @@
+-- 2023-05-27
+-- goal failures, evaluated incrementally --
+-- goal_failures of 002.sql had its primary key on a non-existent column
+DROP TABLE IF EXISTS goal_failures;
+
+CREATE TABLE goal_failures (
+  goal_id INTEGER NOT NULL,
+  failed_at TEXT NOT NULL, -- YYYY-MM-DD
+  due INTEGER NOT NULL, -- seconds
+  worked INTEGER NOT NULL, -- seconds
+  PRIMARY KEY (goal_id, failed_at),
+  FOREIGN KEY (goal_id) REFERENCES goals(id)
+);
+
+CREATE TABLE goal_evaluations (
+  goal_id INTEGER NOT NULL PRIMARY KEY,
+  evaluated_to TEXT NOT NULL, -- YYYY-MM-DD, the last evaluated day
+  FOREIGN KEY (goal_id) REFERENCES goals(id)
+);
@@ -0,0 +1,11 @@
+-- 2023-06-03
+-- ledger of mandatory-hours goals, cumulative balance per closed day --
+CREATE TABLE goal_balances (
+  goal_id INTEGER NOT NULL,
+  day TEXT NOT NULL, -- YYYY-MM-DD
+  due INTEGER NOT NULL, -- seconds
+  worked INTEGER NOT NULL, -- seconds
+  balance INTEGER NOT NULL, -- seconds worked minus due since goal creation
+  PRIMARY KEY (goal_id, day),
+  FOREIGN KEY (goal_id) REFERENCES goals(id)
+);
@@ -0,0 +1,5 @@
+-- 2023-06-10
+-- indexes of the hot timelog and commitment lookups --
+CREATE INDEX timelog__user_id_started_at_idx ON timelog(user_id, started_at);
+CREATE INDEX hoursperday__goal_id_weekday_date_from_idx
+  ON hoursperday(goal_id, weekday, date_from);
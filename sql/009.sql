@@ -0,0 +1,10 @@
+-- 2023-06-17
+-- latency histograms of shell commands per hour --
+CREATE TABLE command_latencies (
+  command TEXT NOT NULL,
+  hour INTEGER NOT NULL, -- timestamp of the hour start
+  bucket INTEGER NOT NULL, -- log-linear bucket of the latency
+  count INTEGER NOT NULL,
+  total INTEGER NOT NULL, -- microseconds
+  PRIMARY KEY (command, hour, bucket)
+);
@@ -0,0 +1,6 @@
+-- 2023-06-24
+-- indexes of subproject lookups and of eager loading of children, and of
+-- the longest record of a user --
+CREATE INDEX IF NOT EXISTS projects__parent_id_idx ON projects(parent_id);
+CREATE INDEX IF NOT EXISTS timelog__user_id_duration_idx
+  ON timelog(user_id, duration);
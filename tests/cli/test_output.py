@@ -0,0 +1,93 @@
+import io
+import os
+import sys
+import subprocess
+from cli import output
+from cli.output import BufferedOutput
+
+
+class CountingStream(io.StringIO):
+    def __init__(self, tty: bool = False):
+        super().__init__()
+        self.tty = tty
+        self.writes = 0
+
+    def isatty(self) -> bool:
+        return self.tty
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        return super().write(text)
+
+
+def test_pipe_output_is_written_in_chunks(monkeypatch) -> None:
+    monkeypatch.setattr(output, 'CHUNK_SIZE', 1000)
+    stream = CountingStream()
+    out = BufferedOutput(stream)
+    for i in range(1000):
+        out.write(f"line {i:04}")
+    assert 0 < stream.writes <= 1000 * 10 // 1000
+    out.close()
+    assert stream.getvalue() == "".join(
+        f"line {i:04}\n" for i in range(1000))
+
+
+def test_terminal_output_goes_to_pager_if_it_does_not_fit(
+    monkeypatch, tmp_path
+) -> None:
+    monkeypatch.setattr(
+        output.shutil, 'get_terminal_size',
+        lambda: os.terminal_size((80, 10)))
+    paged = tmp_path / 'paged'
+    pager = f"{sys.executable} -c 'import sys; " \
+        f"open(\"{paged}\", \"w\").write(sys.stdin.read())'"
+
+    stream = CountingStream(tty=True)
+    out = BufferedOutput(stream, pager)
+    out.write("fits\nthe screen")
+    out.close()
+    assert stream.getvalue() == "fits\nthe screen\n"
+    assert not paged.exists()
+
+    stream = CountingStream(tty=True)
+    out = BufferedOutput(stream, pager)
+    out.write("x" * 200)  # 3 screen lines
+    for i in range(10):
+        out.write(f"line {i}")
+    out.close()
+    assert stream.getvalue() == ""
+    assert paged.read_text() == "x" * 200 + "\n" + "".join(
+        f"line {i}\n" for i in range(10))
+
+
+def test_broken_pipe_stops_output() -> None:
+    # The reader quits after the first line
+    script = (
+        "from cli.output import BufferedOutput\n"
+        "import sys\n"
+        "out = BufferedOutput(sys.stdout)\n"
+        "for i in range(100000):\n"
+        "    out.write('line %d' % i)\n"
+        "out.close()\n"
+        "print('not shown')\n"
+    )
+    process = subprocess.run(
+        f"{sys.executable} -c \"{script}\" | head -1",
+        shell=True, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    assert process.stdout == "line 0\n"
+    assert process.stderr == ""
+
+
+def test_write_now_leaves_held_output(monkeypatch) -> None:
+    monkeypatch.setattr(
+        output.shutil, 'get_terminal_size',
+        lambda: os.terminal_size((80, 10)))
+    stream = CountingStream(tty=True)
+    out = BufferedOutput(stream, 'less')
+    out.write("held")
+    out.write_now("12:00: status")
+    assert stream.getvalue() == "12:00: status\n"
+    assert out.held == ["held"]
+    out.close()
+    assert stream.getvalue() == "12:00: status\nheld\n"
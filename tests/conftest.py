@@ -0,0 +1,20 @@
+import pytest
+from models import User
+from tests.template import (
+    DatabaseTemplate, populate_sample_data, SAMPLE_UNTIL
+)
+
+
+@pytest.fixture(scope='session')
+def schema_template() -> DatabaseTemplate:
+    """Empty schema with user #1 'Test User', built once per test run."""
+    def populate(app):
+        app.session.add(User(id=1, name='Test User'))
+    return DatabaseTemplate.build(populate)
+
+
+@pytest.fixture(scope='session')
+def sample_template() -> DatabaseTemplate:
+    """A year of sample data of two users, built once per test run."""
+    return DatabaseTemplate.build(
+        populate_sample_data, now=lambda: SAMPLE_UNTIL)
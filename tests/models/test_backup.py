@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog
+from models.backup import (
+    backup_database, backup_rotated, get_backup_archive_dir
+)
+
+
+def make_app(tmp_path: Path) -> AppRegistry:
+    config = Config()
+    config.database_uri = f"sqlite:///{tmp_path / 'db.sqlite3'}"
+    config.backup_dir = str(tmp_path / 'backup')
+    config.backup_keep = 2
+    config.backup_step_pages = 1
+    engine = create_engine(config.database_uri, future=True)
+    Base.metadata.create_all(engine)
+    app = AppRegistry(config, Session(engine), datetime.now)
+    app.session.add(User(id=1, name='Test User'))
+    app.session.commit()
+    for i in range(100):
+        Project.add_new(app, 1, f"Backup Project {i}")
+    return app
+
+
+def test_backup_database(tmp_path: Path) -> None:
+    app = make_app(tmp_path)
+    dest = tmp_path / 'copy.sqlite3'
+    assert backup_database(app, str(dest)) > 1
+    copy = sqlite3.connect(dest)
+    assert copy.execute("SELECT count(*) FROM projects").fetchone() == (100,)
+    assert not (tmp_path / 'copy.sqlite3.tmp').exists()
+
+
+def test_backup_rotated(tmp_path: Path) -> None:
+    app = make_app(tmp_path)
+    start = datetime(2023, 5, 1)
+    for day in range(3):
+        app.now = lambda: start + timedelta(days=day)
+        backup_rotated(app)
+    backups = sorted(path.name for path in (tmp_path / 'backup').iterdir())
+    assert backups == [
+        'db-20230502-000000.sqlite3', 'db-20230503-000000.sqlite3']
+
+
+def test_backup_archives(tmp_path: Path) -> None:
+    app = make_app(tmp_path)
+    app.config.archive_dir = str(tmp_path / 'archive')
+    Project.add_new(app, 1, "Archived Project")
+    app.now = lambda: datetime(2021, 5, 1, 9)
+    TimeLog.start_project(app, 1, "Archived Project")
+    app.now = lambda: datetime(2021, 5, 1, 10)
+    TimeLog.stop_last_record(app, 1)
+    assert TimeLog.archive_records(app, datetime(2022, 1, 1)) == {2021: 1}
+
+    start = datetime(2023, 5, 1)
+    for day in range(3):
+        app.now = lambda: start + timedelta(days=day)
+        dest = backup_rotated(app)
+    archive = sqlite3.connect(
+        Path(get_backup_archive_dir(dest)) / 'timelog_2021.sqlite3')
+    assert archive.execute("SELECT count(*) FROM timelog").fetchone() == (1,)
+    # Archive copies are rotated with their databases
+    assert sorted(path.name for path in (tmp_path / 'backup').iterdir()) == [
+        'db-20230502-000000-archive', 'db-20230502-000000.sqlite3',
+        'db-20230503-000000-archive', 'db-20230503-000000.sqlite3',
+    ]
+
+
+def test_backup_keep_zero(tmp_path: Path) -> None:
+    app = make_app(tmp_path)
+    app.config.backup_keep = 0
+    with pytest.raises(ValueError):
+        backup_rotated(app)
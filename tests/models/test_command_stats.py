@@ -0,0 +1,79 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, CommandLatency
+from models.command_stats import (
+    LatencyHistogram, get_bucket, get_bucket_upper_bound, format_prometheus
+)
+
+
+@pytest.fixture
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    engine = create_engine(config.database_uri, future=True)
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    return AppRegistry(config, session, lambda: datetime(2023, 6, 1, 12))
+
+
+def test_buckets() -> None:
+    previous = 0
+    for microseconds in range(100_000):
+        bucket = get_bucket(microseconds)
+        assert bucket >= previous
+        upper_bound = get_bucket_upper_bound(bucket)
+        assert microseconds <= upper_bound <= microseconds * 17 / 16
+        previous = bucket
+    # An hour fits in a few hundred buckets
+    assert get_bucket(3600 * 1_000_000) < 500
+
+
+def test_histogram() -> None:
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    assert histogram.count == 100
+    assert histogram.total == pytest.approx(5.05)
+    assert histogram.percentile(0.5) == pytest.approx(0.050, rel=1 / 16)
+    assert histogram.percentile(0.99) == pytest.approx(0.099, rel=1 / 16)
+    assert histogram.percentile(1) >= 0.1
+    assert histogram.count_up_to(0.011) == 10
+
+    other = LatencyHistogram()
+    other.record(5)
+    histogram.merge(other)
+    assert histogram.count == 101
+    assert histogram.percentile(1) == pytest.approx(5, rel=1 / 16)
+
+
+def test_save(app: AppRegistry) -> None:
+    start = LatencyHistogram()
+    start.record(0.010)
+    start.record(0.020)
+    old = LatencyHistogram()
+    old.record(1)
+    CommandLatency.save(app, {
+        ('start', datetime(2023, 6, 1, 12)): start,
+        ('start', datetime(2023, 5, 1, 12)): old,
+    })
+    # Saved again, e.g. by another shell
+    CommandLatency.save(app, {('start', datetime(2023, 6, 1, 12)): start})
+
+    histograms = CommandLatency.get_histograms(
+        app, datetime(2023, 6, 1, 12, 30))
+    assert list(histograms) == ['start']
+    assert histograms['start'].count == 4
+    assert histograms['start'].total == pytest.approx(0.06)
+    assert CommandLatency.get_histograms(app)['start'].count == 5
+
+    metrics = format_prometheus(CommandLatency.get_histograms(app))
+    assert 'zudilnik_command_duration_seconds_bucket' \
+        '{command="start",le="0.025"} 4\n' in metrics
+    assert 'zudilnik_command_duration_seconds_bucket' \
+        '{command="start",le="+Inf"} 5\n' in metrics
+    assert 'zudilnik_command_duration_seconds_count' \
+        '{command="start"} 5\n' in metrics
@@ -0,0 +1,89 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text, select
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog, Change
+from models.compact import TimeLogCompactor
+
+
+@pytest.fixture
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    config.compact_gap = 60
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(config, session, lambda: datetime.fromtimestamp(0))
+    app.session.add_all([User(id=1, name='User 1'), User(id=2, name='User 2')])
+    app.session.commit()
+    Project.add_new(app, 1, "Compact A")
+    Project.add_new(app, 1, "Compact B")
+    return app
+
+
+def add_records(app: AppRegistry, *records: tuple) -> None:
+    for (user_id, project_id, started_at, stoped_at, comment) in records:
+        app.session.add(TimeLog(
+            user_id=user_id, project_id=project_id, started_at=started_at,
+            stoped_at=stoped_at,
+            duration=stoped_at - started_at if stoped_at else None,
+            comment=comment))
+    app.session.commit()
+
+
+def test_compact(app: AppRegistry) -> None:
+    add_records(
+        app,
+        (1, 1, 1000, 1100, None),
+        (1, 1, 1100, 1200, 'work'),   # contiguous, comment taken
+        (1, 1, 1230, 1300, 'work'),   # within the gap
+        (1, 1, 1300, 1400, 'other'),  # incompatible comment
+        (1, 1, 1500, 1600, 'other'),  # gap is too big
+        (1, 2, 1600, 1700, None),     # another project
+        (2, 2, 1700, 1800, None),     # another user
+        (2, 2, 1800, None, None),     # running
+    )
+    result = TimeLogCompactor.run(app)
+    assert result.scanned == 8
+    assert result.merged == 1
+    assert result.deleted == 2
+
+    records = [
+        (record.user_id, record.project_id, record.started_at,
+         record.stoped_at, record.duration, record.comment)
+        for record in app.session.query(TimeLog).order_by(TimeLog.id)
+    ]
+    assert records == [
+        (1, 1, 1000, 1300, 300, 'work'),
+        (1, 1, 1300, 1400, 100, 'other'),
+        (1, 1, 1500, 1600, 100, 'other'),
+        (1, 2, 1600, 1700, 100, None),
+        (2, 2, 1700, 1800, 100, None),
+        (2, 2, 1800, None, None, None),
+    ]
+    ops = app.session.execute(
+        select(Change.op).where(Change.table_name == 'timelog')
+    ).scalars().all()
+    assert sorted(ops) == ['delete', 'delete', 'upsert']
+
+    # Nothing left to merge
+    assert TimeLogCompactor.run(app).deleted == 0
+
+
+def test_compact_range(app: AppRegistry) -> None:
+    add_records(
+        app,
+        (1, 1, 1000, 1100, None),
+        (1, 1, 1100, 1200, None),
+        (1, 1, 5000, 5100, None),
+        (1, 1, 5100, 5200, None),
+    )
+    result = TimeLogCompactor.run(
+        app, datetime.fromtimestamp(2000), datetime.fromtimestamp(6000))
+    assert result.deleted == 1
+    assert app.session.query(TimeLog).count() == 3
@@ -0,0 +1,79 @@
+from datetime import datetime, date, timedelta
+import pytest
+from app_registry import AppRegistry
+from models import Project, TimeLog, Goal, Commitment, GoalFailure, Forecast
+from tests.template import DatabaseTemplate
+
+NOW = datetime(2023, 5, 10, 12)  # Wednesday
+HOUR = 3600
+
+
+@pytest.fixture
+def app(schema_template: DatabaseTemplate) -> AppRegistry:
+    app = schema_template.clone(lambda: datetime(2023, 4, 1, 12))
+    Project.add_new(app, 1, "Forecast Project")
+    Project.add_new_subproject(
+        app, 1, "Forecast Project", "Forecast Subproject")
+    Project.add_new(app, 1, "Other Project")
+    Goal.add_new(app, 1, "Forecast Project", "Daily")
+    Goal.add_new(app, 1, "Other Project", "Idle")
+    Commitment.set_hours_per_day(app, 1, "Daily", 2)
+    subproject = Project.get_by_name(app, 1, "Forecast Subproject")
+
+    # An hour a day for four weeks, three hours a day in the last one
+    day = date(2023, 4, 12)
+    while day < NOW.date():
+        started_at = int(datetime.combine(
+            day, datetime.min.time()).timestamp()) + 10 * HOUR
+        duration = 3 * HOUR if day >= date(2023, 5, 3) else HOUR
+        app.session.add(TimeLog(
+            user_id=1, project_id=subproject.id, started_at=started_at,
+            stoped_at=started_at + duration, duration=duration))
+        day += timedelta(days=1)
+    app.session.commit()
+    # An hour today, still running
+    app.now = lambda: NOW - timedelta(hours=1)
+    TimeLog.start_project(app, 1, "Forecast Project")
+    app.now = lambda: NOW
+    return app
+
+
+def test_forecast(app: AppRegistry) -> None:
+    daily, idle = Forecast.get(app, 1)
+    assert (daily.goal.name, idle.goal.name) == ("Daily", "Idle")
+
+    assert daily.pace == {7: 3 * HOUR, 28: 1.5 * HOUR}
+    assert daily.trend > 0
+    assert daily.due_week == 7 * 2 * HOUR
+    # Monday, tuesday and today
+    assert daily.worked_week == 7 * HOUR
+    # Four days and 18 hours of today left
+    assert daily.projected_balance == {
+        7: int((7 + 3 * 4.75 - 14) * HOUR),
+        28: int((7 + 1.5 * 4.75 - 14) * HOUR),
+    }
+
+    assert idle.pace == {7: 0, 28: 0}
+    assert idle.projected_balance == {7: 0, 28: 0}
+
+    assert [f.goal.name for f in Forecast.get(app, 1, "Idle")] == ["Idle"]
+    with pytest.raises(ValueError):
+        Forecast.get(app, 1, "Missing")
+
+
+def test_forecast_agrees_with_failures(app: AppRegistry) -> None:
+    # A record over the deadline counts for the day it started on
+    started_at = int(datetime(2023, 5, 8, 23).timestamp())
+    app.session.add(TimeLog(
+        user_id=1, project_id=Project.get_by_name(
+            app, 1, "Forecast Project").id,
+        started_at=started_at, stoped_at=started_at + 2 * HOUR,
+        duration=2 * HOUR))
+    app.session.commit()
+    daily = Forecast.get(app, 1, "Daily")[0]
+    days = GoalFailure.get_due_and_worked(
+        app, 1, {daily.goal.id: (date(2023, 5, 8), NOW.date())}
+    )[daily.goal.id]
+    assert [worked for _, _, worked in days] == [5 * HOUR, 3 * HOUR, HOUR]
+    assert daily.worked_week == sum(worked for _, _, worked in days)
+    assert daily.due_week == 7 * sum(due for _, due, _ in days) // 3
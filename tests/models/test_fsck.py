@@ -0,0 +1,74 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog
+from models.fsck import (
+    TimeLogFsck, STALE_DURATION, NEGATIVE_DURATION, OVERLAP, EXTRA_OPEN
+)
+
+
+@pytest.fixture
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(config, session, lambda: datetime.fromtimestamp(0))
+    app.session.add_all([User(id=1, name='User 1'), User(id=2, name='User 2')])
+    app.session.commit()
+    Project.add_new(app, 1, "Fsck Project")
+    return app
+
+
+def add_records(app: AppRegistry, *records: tuple) -> None:
+    for (user_id, started_at, stoped_at, duration) in records:
+        app.session.add(TimeLog(
+            user_id=user_id, project_id=1, started_at=started_at,
+            stoped_at=stoped_at, duration=duration))
+    app.session.commit()
+
+
+def test_fsck_clean(app: AppRegistry) -> None:
+    add_records(app, (1, 0, 10, 10), (1, 10, None, None), (2, 5, None, None))
+    result = TimeLogFsck.run(app, fix=True)
+    assert result.checked == 3
+    assert result.counts == {}
+    assert result.fixed == 0
+
+
+def test_fsck_fix(app: AppRegistry) -> None:
+    add_records(
+        app,
+        (1, 0, 10, 7),        # stale duration
+        (1, 20, 40, 20),      # overlaps the next one
+        (1, 30, None, None),  # running, but not the last one
+        (1, 50, 45, -5),      # negative
+        (1, 60, None, None),
+        (2, 0, 30, 30),       # doesn't overlap records of user 1
+    )
+    result = TimeLogFsck.run(app)
+    assert result.counts == {
+        STALE_DURATION: 1, OVERLAP: 1, EXTRA_OPEN: 1, NEGATIVE_DURATION: 1}
+    assert result.fixed == 0
+
+    result = TimeLogFsck.run(app, fix=True)
+    assert result.fixed == 3
+    records = [
+        (record.started_at, record.stoped_at, record.duration)
+        for record in app.session.query(TimeLog).order_by(TimeLog.id)
+    ]
+    assert records == [
+        (0, 10, 10),
+        (20, 30, 10),
+        (30, 50, 20),
+        (50, 45, -5),
+        (60, None, None),
+        (0, 30, 30),
+    ]
+    assert TimeLogFsck.run(app).counts == {NEGATIVE_DURATION: 1}
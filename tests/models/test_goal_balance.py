@@ -0,0 +1,92 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text, select, func
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import (
+    Base, User, Project, TimeLog, Goal, GoalType, Commitment, GoalBalance
+)
+
+
+@pytest.fixture(scope='module')
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    config.deadline_time = '06:00:00'
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(config, session, None)
+    app.now = lambda: datetime(2023, 5, 1, 12, 0, 0)  # Monday
+    return app
+
+
+@pytest.fixture(scope='module')
+def user_id(app: AppRegistry) -> int:
+    user = User(id=1, name='Test User')
+    app.session.add(user)
+    app.session.commit()
+    Project.add_new(app, user.id, "Balance Project")
+    Goal.add_new(
+        app, user.id, "Balance Project", "Mandatory",
+        GoalType.HOURS_MANDATORY)
+    Commitment.set_hours_per_day(app, user.id, "Mandatory", 2, "1-5")
+    return user.id
+
+
+def add_record(
+    app: AppRegistry, user_id: int, started_at: datetime, duration: int
+) -> int:
+    project = Project.get_by_name(app, user_id, "Balance Project")
+    started_at = int(started_at.timestamp())
+    record = TimeLog(
+        user_id=user_id,
+        project_id=project.id,
+        started_at=started_at,
+        stoped_at=started_at + duration,
+        duration=duration,
+    )
+    app.session.add(record)
+    app.session.commit()
+    return record.id
+
+
+def count_rows(app: AppRegistry) -> int:
+    return app.session.execute(
+        select(func.count()).select_from(GoalBalance)).scalar_one()
+
+
+def test_balance(app: AppRegistry, user_id: int) -> None:
+    goal = Goal.get_by_name(app, user_id, "Mandatory")
+    monday_id = add_record(app, user_id, datetime(2023, 5, 1, 13), 7200)
+    add_record(app, user_id, datetime(2023, 5, 2, 13), 3600)
+
+    app.now = lambda: datetime(2023, 5, 8, 12, 0, 0)
+    assert GoalBalance.update(app, user_id) == 7
+    assert GoalBalance.get_balance(app, goal.id) == -7 * 3600
+    # Up to date
+    assert GoalBalance.update(app, user_id) == 0
+
+    # Changing a past record drops the ledger from its day on
+    TimeLog.delete_record(app, user_id, str(monday_id))
+    assert count_rows(app) == 0
+    assert GoalBalance.update(app, user_id) == 7
+    assert GoalBalance.get_balance(app, goal.id) == -9 * 3600
+
+    TimeLog.set_record_stop_time(app, user_id, "last", "2023-05-02 16:00")
+    assert count_rows(app) == 1
+    assert GoalBalance.update(app, user_id) == 6
+    assert GoalBalance.get_balance(app, goal.id) == -7 * 3600
+
+    # Today counts in goals info, but doesn't go to the ledger
+    add_record(app, user_id, datetime(2023, 5, 8, 9), 1800)
+    (info,) = GoalBalance.get_goals_info(app, user_id)
+    assert info.goal.id == goal.id
+    assert info.due_today == 7200
+    assert info.worked_today == 1800
+    assert info.balance == -7 * 3600 - 5400
+    assert info.deadline == datetime(2023, 5, 9, 6, 0, 0)
+    assert count_rows(app) == 7
@@ -0,0 +1,90 @@
+from datetime import datetime, date
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import (
+    Base, User, Project, TimeLog, Goal, GoalType, Commitment, GoalFailure
+)
+
+
+@pytest.fixture(scope='module')
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    config.deadline_time = '06:00:00'
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(config, session, None)
+    app.now = lambda: datetime(2023, 5, 1, 12, 0, 0)  # Monday
+    return app
+
+
+@pytest.fixture(scope='module')
+def user_id(app: AppRegistry) -> int:
+    user = User(id=1, name='Test User')
+    app.session.add(user)
+    app.session.commit()
+    Project.add_new(app, user.id, "Goal Project")
+    Project.add_new_subproject(
+        app, user.id, "Goal Project", "Goal Subproject")
+    Goal.add_new(
+        app, user.id, "Goal Project", "Mandatory", GoalType.HOURS_MANDATORY)
+    Goal.add_new(app, user.id, "Goal Project", "Light")
+    Commitment.set_hours_per_day(app, user.id, "Mandatory", 2, "1-5")
+    Commitment.set_hours_per_day(app, user.id, "Light", 2, "1-7")
+    return user.id
+
+
+def add_record(
+    app: AppRegistry, user_id: int, project_name: str,
+    started_at: datetime, duration: int
+) -> None:
+    project = Project.get_by_name(app, user_id, project_name)
+    started_at = int(started_at.timestamp())
+    app.session.add(TimeLog(
+        user_id=user_id,
+        project_id=project.id,
+        started_at=started_at,
+        stoped_at=started_at + duration,
+        duration=duration,
+    ))
+    app.session.commit()
+
+
+def test_evaluate(app: AppRegistry, user_id: int) -> None:
+    # Monday is enough, subproject time counts
+    add_record(app, user_id, "Goal Project", datetime(2023, 5, 1, 13), 3600)
+    add_record(
+        app, user_id, "Goal Subproject", datetime(2023, 5, 1, 15), 3600)
+    # Tuesday is short, the record after midnight belongs to it
+    add_record(app, user_id, "Goal Project", datetime(2023, 5, 3, 1), 3600)
+    # Nothing on Wednesday, weekend isn't due
+
+    # Monday isn't closed yet
+    assert GoalFailure.evaluate(app, user_id) == 0
+
+    app.now = lambda: datetime(2023, 5, 8, 5, 0, 0)  # before the deadline
+    assert GoalFailure.evaluate(app, user_id) == 4
+    assert GoalFailure.get_failures(app, user_id) == [
+        ("Mandatory", date(2023, 5, 2), 7200, 3600),
+        ("Mandatory", date(2023, 5, 3), 7200, 0),
+        ("Mandatory", date(2023, 5, 4), 7200, 0),
+        ("Mandatory", date(2023, 5, 5), 7200, 0),
+    ]
+
+    # Evaluated days are skipped, Monday 8th is closed after the deadline
+    assert GoalFailure.evaluate(app, user_id) == 0
+    app.now = lambda: datetime(2023, 5, 9, 7, 0, 0)
+    assert GoalFailure.evaluate(app, user_id) == 1
+
+    # Late records are taken into account by a full evaluation
+    add_record(app, user_id, "Goal Project", datetime(2023, 5, 4, 10), 7200)
+    assert GoalFailure.evaluate(app, user_id, full=True) == 4
+    assert date(2023, 5, 4) not in [
+        day for _, day, _, _ in GoalFailure.get_failures(app, user_id)
+    ]
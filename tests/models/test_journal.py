@@ -0,0 +1,136 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text, select
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog, Goal, GoalType, Change
+
+
+def make_app(node: str) -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    config.sync_node = node
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(config, session, lambda: datetime.fromtimestamp(0))
+    app.session.add(User(id=1, name='Test User'))
+    app.session.commit()
+    return app
+
+
+@pytest.fixture
+def laptop() -> AppRegistry:
+    return make_app('laptop')
+
+
+@pytest.fixture
+def desktop() -> AppRegistry:
+    return make_app('desktop')
+
+
+def sync(source: AppRegistry, target: AppRegistry) -> int:
+    changes = Change.get_changes_since(source, Change.get_vector(target))
+    return Change.apply_changes(target, changes)
+
+
+def timelog_of(app: AppRegistry) -> list[tuple]:
+    return app.session.execute(
+        select(Project.name, TimeLog.started_at, TimeLog.comment)
+        .join(Project, TimeLog.project_id == Project.id)
+        .order_by(TimeLog.started_at, Project.name)
+    ).all()
+
+
+def test_sync_merges_databases(
+    laptop: AppRegistry, desktop: AppRegistry
+) -> None:
+    Project.add_new(laptop, 1, "Work")
+    TimeLog.start_project(laptop, 1, "Work", comment="on laptop")
+    desktop.now = lambda: datetime.fromtimestamp(100)
+    Project.add_new(desktop, 1, "Work")
+    Project.add_new_subproject(desktop, 1, "Work", "Meetings")
+    TimeLog.start_project(desktop, 1, "Meetings")
+
+    assert sync(laptop, desktop) == 2
+    assert sync(desktop, laptop) == 3
+    # Only deltas are exchanged
+    assert sync(laptop, desktop) == 0
+    assert sync(desktop, laptop) == 0
+
+    assert timelog_of(laptop) == timelog_of(desktop)
+    assert len(timelog_of(laptop)) == 2
+    # Project created on both sides is merged by name
+    assert sorted(Project.find_by_name(laptop, 1, "")) == [
+        "Meetings", "Work"]
+
+
+def test_last_writer_wins(laptop: AppRegistry, desktop: AppRegistry) -> None:
+    Project.add_new(laptop, 1, "Work")
+    TimeLog.start_project(laptop, 1, "Work")
+    sync(laptop, desktop)
+
+    desktop.now = lambda: datetime.fromtimestamp(200)
+    TimeLog.comment_record(desktop, 1, "last", "newer")
+    laptop.now = lambda: datetime.fromtimestamp(100)
+    TimeLog.comment_record(laptop, 1, "last", "older")
+
+    sync(laptop, desktop)
+    sync(desktop, laptop)
+    assert TimeLog.get_record(laptop, 1, "last").comment == "newer"
+    assert TimeLog.get_record(desktop, 1, "last").comment == "newer"
+
+    laptop.now = lambda: datetime.fromtimestamp(300)
+    TimeLog.delete_record(laptop, 1, "last")
+    sync(laptop, desktop)
+    assert TimeLog.get_last_time_record(desktop, 1) is None
+
+
+def test_bootstrap(laptop: AppRegistry, desktop: AppRegistry) -> None:
+    # Rows created without journaling
+    laptop.session.add(Project(user_id=1, name="Old", created_at=0))
+    laptop.session.commit()
+    assert Change.bootstrap(laptop) == 1
+    assert Change.bootstrap(laptop) == 0
+    sync(laptop, desktop)
+    assert Project.get_by_name(desktop, 1, "Old")
+
+
+def test_bootstrap_refers_to_journaled_rows(
+    laptop: AppRegistry, desktop: AppRegistry
+) -> None:
+    Project.add_new(laptop, 1, "Journaled")
+    # A parent added after its child, and a goal, without journaling
+    parent = Project(user_id=1, name="Parent", created_at=0)
+    child = Project(user_id=1, name="Child", created_at=0)
+    laptop.session.add(child)
+    laptop.session.flush()
+    laptop.session.add(parent)
+    laptop.session.flush()
+    child.parent_id = parent.id
+    journaled = Project.get_by_name(laptop, 1, "Journaled")
+    laptop.session.add_all([
+        Goal(user_id=1, project_id=journaled.id, name="Goal", created_at=0,
+             type=GoalType.HOURS_MANDATORY),
+        TimeLog(user_id=1, project_id=child.id, started_at=0, stoped_at=60,
+                duration=60),
+    ])
+    laptop.session.commit()
+
+    assert Change.bootstrap(laptop) == 4
+    assert Change.bootstrap(laptop) == 0
+    assert sync(laptop, desktop) == 5
+    assert Project.get_by_name(desktop, 1, "Child").parent.name == "Parent"
+    goal = Goal.get_by_name(desktop, 1, "Goal")
+    assert (goal.project.name, goal.type) == (
+        "Journaled", GoalType.HOURS_MANDATORY)
+    assert timelog_of(desktop) == [("Child", 0, None)]
+
+    # Only changes past the peer's vector are read
+    assert Change.get_changes_since(laptop, Change.get_vector(desktop)) == []
+    Project.add_new(laptop, 1, "Later")
+    assert [change['op'] for change in Change.get_changes_since(
+        laptop, Change.get_vector(desktop))] == ['upsert']
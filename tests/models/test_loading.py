@@ -0,0 +1,115 @@
+"""
+Listing APIs load related objects eagerly: the number of queries of a
+listing and of walking its items' relationships doesn't grow with the
+number of items.
+"""
+import pytest
+from sqlalchemy import event
+from app_registry import AppRegistry
+from models import Project, TimeLog, Goal, GoalType, Commitment, GoalBalance
+from tests.template import DatabaseTemplate, SAMPLE_UNTIL
+
+
+class QueryCounter:
+    def __init__(self, app: AppRegistry):
+        self.count = 0
+        event.listen(
+            app.session.get_bind(), 'before_cursor_execute', self.record)
+
+    def record(self, *args) -> None:
+        self.count += 1
+
+    def measure(self, call) -> int:
+        self.count = 0
+        call()
+        return self.count
+
+
+@pytest.fixture
+def app(sample_template: DatabaseTemplate) -> AppRegistry:
+    app = sample_template.clone(lambda: SAMPLE_UNTIL)
+    for i in range(1, 10):
+        Goal.add_new(app, 1, f"project{i}", f"Goal {i}")
+        Commitment.set_hours_per_day(app, 1, f"Goal {i}", 1, "1-5")
+    for i in range(1, 5):
+        Goal.set_type_by_name(app, 1, f"Goal {i}", GoalType.HOURS_MANDATORY)
+    app.counter = QueryCounter(app)
+    app.session.expunge_all()
+    return app
+
+
+def test_relationships(app: AppRegistry) -> None:
+    project = Project.get_by_name(app, 1, "project3.1")
+    assert project.parent.name == "project3"
+    assert [child.name for child in project.parent.children] == [
+        "project3.1"]
+
+    goal = Goal.get_by_name(app, 1, "Goal 2")
+    assert goal.project.name == "project2"
+    assert [c.weekday for c in goal.commitments] == [1, 2, 3, 4, 5]
+    assert all(c.goal is goal for c in goal.commitments)
+
+    record, project = TimeLog.get_timelog(app, 1, page_size=1)[0]
+    assert record.project is project
+
+
+def test_root_projects_with_children(app: AppRegistry) -> None:
+    def walk():
+        projects = Project.get_root_projects(app, 1, with_children=True)
+        assert len(projects) == 20
+        for project in projects:
+            assert [child.name for child in project.children] == [
+                f"{project.name}.1"]
+        app.session.expunge_all()
+
+    assert app.counter.measure(walk) == 2
+
+
+def test_subprojects_with_children(app: AppRegistry) -> None:
+    def walk():
+        projects = Project.get_subprojects(
+            app, 1, "project0", with_children=True)
+        assert [project.children for project in projects] == [[]]
+        app.session.expunge_all()
+
+    assert app.counter.measure(walk) == 2
+
+
+@pytest.mark.parametrize('page_size', [1, 10, 100])
+def test_timelog(app: AppRegistry, page_size: int) -> None:
+    def walk():
+        timelog = TimeLog.get_timelog(app, 1, page_size=page_size)
+        assert len(timelog) == page_size
+        for record, project in timelog:
+            assert record.project.id == record.project_id
+            assert project.user_id == 1
+        app.session.expunge_all()
+
+    assert app.counter.measure(walk) == 1
+
+
+def test_goal_list(app: AppRegistry) -> None:
+    def walk():
+        goals = Goal.get_list(app, 1, with_commitments=True)
+        assert len(goals) == 10
+        for goal in goals:
+            assert goal.project.user_id == 1
+            assert len(goal.commitments) == 5
+        app.session.expunge_all()
+
+    assert app.counter.measure(walk) == 2
+
+
+def test_goals_info(app: AppRegistry) -> None:
+    few = app.counter.measure(lambda: GoalBalance.get_goals_info(app, 2))
+    app.session.expunge_all()
+
+    def walk():
+        infos = GoalBalance.get_goals_info(app, 1)
+        assert len(infos) == 5
+        assert [info.goal.project.name for info in infos] == [
+            "project1", "project2", "project3", "project4", "project0"]
+        app.session.expunge_all()
+
+    # User 2 has a single goal
+    assert app.counter.measure(walk) == few
@@ -0,0 +1,110 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text, select, delete
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog, SchemaVersion
+from models.migration import migrate, get_scripts
+from models.maintenance import maintain
+
+
+@pytest.fixture
+def app(tmp_path) -> AppRegistry:
+    config = Config()
+    # VACUUM and page counts need a database file
+    config.database_uri = f"sqlite:///{tmp_path / 'migration.sqlite3'}"
+    engine = create_engine(config.database_uri, future=True)
+    session = Session(engine)
+    return AppRegistry(config, session, lambda: datetime.fromtimestamp(0))
+
+
+def get_indexes(app: AppRegistry) -> set[str]:
+    return set(app.session.execute(text(
+        "SELECT name FROM sqlite_master "
+        "WHERE type = 'index' AND sql IS NOT NULL"
+    )).scalars())
+
+
+def test_migrate_empty_database(app: AppRegistry) -> None:
+    latest = max(get_scripts())
+    result = migrate(app)
+    assert (result.from_version, result.to_version) == (0, latest)
+    assert result.applied == []
+    assert result.created_indexes == []
+    assert result.extra_indexes == []
+    assert app.session.execute(
+        select(SchemaVersion.version)).scalars().all() == [latest]
+    assert 'timelog__user_id_started_at_idx' in get_indexes(app)
+    # ANALYZE ran
+    assert app.session.execute(text(
+        "SELECT count(*) FROM sqlite_stat1")).scalar_one() > 0
+
+    # Nothing to do the second time
+    result = migrate(app)
+    assert (result.from_version, result.to_version) == (latest, latest)
+    assert result.applied == []
+    assert result.created_indexes == []
+
+
+def test_migrate_hand_migrated_database(app: AppRegistry) -> None:
+    Base.metadata.create_all(app.session.get_bind())
+    with app.session.get_bind().begin() as connection:
+        # Schema of version 7 without indexes added to the models since
+        connection.exec_driver_sql("DROP TABLE schema_version")
+        connection.exec_driver_sql("DROP TABLE command_latencies")
+        connection.exec_driver_sql("DROP INDEX timelog__user_id_started_at_idx")
+        connection.exec_driver_sql(
+            "DROP INDEX hoursperday__goal_id_weekday_date_from_idx")
+        connection.exec_driver_sql("DROP INDEX projects__created_at_idx")
+        connection.exec_driver_sql("DROP INDEX projects__parent_id_idx")
+        connection.exec_driver_sql("DROP INDEX timelog__user_id_duration_idx")
+        connection.exec_driver_sql(
+            "CREATE INDEX timelog__comment_idx ON timelog(comment)")
+
+    result = migrate(app)
+    assert (result.from_version, result.to_version) == (7, 10)
+    assert result.applied == ['008.sql', '009.sql', '010.sql']
+    assert result.created_indexes == ['projects__created_at_idx']
+    assert result.extra_indexes == ['timelog__comment_idx']
+    assert app.session.execute(
+        select(SchemaVersion.version).order_by(SchemaVersion.version)
+    ).scalars().all() == [7, 8, 9, 10]
+    assert {
+        'timelog__user_id_started_at_idx',
+        'hoursperday__goal_id_weekday_date_from_idx',
+        'projects__created_at_idx',
+        'projects__parent_id_idx',
+        'timelog__user_id_duration_idx',
+    } <= get_indexes(app)
+
+
+def test_maintain(app: AppRegistry) -> None:
+    migrate(app)
+    app.session.add(User(id=1, name='User 1'))
+    app.session.commit()
+    project_id = Project.add_new(app, 1, "Maintain")
+    app.session.add_all(
+        TimeLog(
+            user_id=1, project_id=project_id, started_at=i * 60,
+            stoped_at=i * 60 + 30, duration=30, comment='x' * 200)
+        for i in range(2000)
+    )
+    app.session.commit()
+
+    report = maintain(app, full=True)
+    assert report.auto_vacuum == 'incremental'
+    assert report.freelist_count == 0
+    timelog = next(
+        table for table in report.tables if table.name == 'timelog')
+    assert timelog.pages > 10
+    assert timelog.fragmentation < 0.1
+
+    app.session.execute(delete(TimeLog))
+    app.session.commit()
+    app.config.maintain_vacuum_pages = 5
+    report = maintain(app)
+    assert report.vacuumed_pages == 5
+    report = maintain(app, max_pages=1000)
+    assert report.freelist_count == 0
+    assert report.vacuumed_pages > 0
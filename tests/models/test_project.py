@@ -1,31 +1,19 @@
 from datetime import datetime
 import pytest
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import Session
 from app_registry import AppRegistry
-from config import Config
-from models import Base, User, Project
-
-
-@pytest.fixture(scope='module')
-def app() -> AppRegistry:
-    config = Config()
-    config.database_uri = 'sqlite:///:memory:'
-    engine = create_engine(config.database_uri, future=True)
-    with engine.connect() as con:
-        con.execute(text("PRAGMA foreign_keys = ON;"))
-    Base.metadata.create_all(engine)
-    session = Session(engine)
-    now = lambda: datetime.fromtimestamp(0)  # 1970-01-01
-    return AppRegistry(config, session, now)
-
-
-@pytest.fixture(scope='module')
-def user_id(app: AppRegistry) -> int:
-    user = User(id=1, name='Test User')
-    app.session.add(user)
-    app.session.commit()
-    return user.id
+from models import Project, TimeLog
+from tests.template import DatabaseTemplate
+
+
+@pytest.fixture
+def app(schema_template: DatabaseTemplate) -> AppRegistry:
+    return schema_template.clone(
+        lambda: datetime.fromtimestamp(0))  # 1970-01-01
+
+
+@pytest.fixture
+def user_id() -> int:
+    return 1
 
 
 def test_add_new(app: AppRegistry, user_id: int) -> None:
@@ -122,3 +110,33 @@ def test_find_root_projects(app: AppRegistry, user_id: int) -> None:
     assert root_project_name1 in found_projects
     assert root_project_name2 in found_projects
     assert subproject_name not in found_projects
+
+
+def test_get_tree(app: AppRegistry, user_id: int) -> None:
+    root_id = Project.add_new(app, user_id, "Test Tree Root")
+    child_id = Project.add_new_subproject(
+        app, user_id, "Test Tree Root", "Test Tree Child")
+    grandchild_id = Project.add_new_subproject(
+        app, user_id, "Test Tree Child", "Test Tree Grandchild")
+    app.session.add_all([
+        TimeLog(user_id=user_id, project_id=root_id, started_at=0,
+                stoped_at=10, duration=10),
+        TimeLog(user_id=user_id, project_id=grandchild_id, started_at=10,
+                stoped_at=40, duration=30),
+    ])
+    app.session.commit()
+
+    (root,) = Project.get_tree(
+        app, user_id, "Test Tree Root", with_worked=True)
+    assert root.project.id == root_id
+    assert root.worked == 40
+    (child,) = root.children
+    assert child.project.id == child_id
+    assert child.worked == 30
+    assert child.children[0].project.id == grandchild_id
+
+    whole_tree = Project.get_tree(app, user_id)
+    root_names = [node.project.name for node in whole_tree]
+    assert "Test Tree Root" in root_names
+    assert "Test Tree Child" not in root_names
+    assert all(node.worked is None for node in whole_tree)
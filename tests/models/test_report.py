@@ -0,0 +1,122 @@
+from datetime import datetime, date
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog, Report
+from models.helper import get_day_regarding_deadline
+
+
+NOW = datetime(2023, 5, 10, 12, 0, 0)  # Wednesday
+
+
+@pytest.fixture(scope='module')
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    config.deadline_time = '06:00:00'
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    now = lambda: NOW
+    return AppRegistry(config, session, now)
+
+
+@pytest.fixture(scope='module')
+def user_id(app: AppRegistry) -> int:
+    user = User(id=1, name='Test User')
+    app.session.add(user)
+    app.session.commit()
+    Project.add_new(app, user.id, "Report Project")
+    Project.add_new_subproject(
+        app, user.id, "Report Project", "Report Subproject")
+    Project.add_new(app, user.id, "Other Project")
+    return user.id
+
+
+def add_record(
+    app: AppRegistry, user_id: int, project_name: str,
+    started_at: datetime, duration: int = None
+) -> None:
+    project = Project.get_by_name(app, user_id, project_name)
+    started_at = int(started_at.timestamp())
+    app.session.add(TimeLog(
+        user_id=user_id,
+        project_id=project.id,
+        started_at=started_at,
+        stoped_at=started_at + duration if duration else None,
+        duration=duration,
+    ))
+    app.session.commit()
+
+
+def test_get_day_totals_regarding_deadline(
+    app: AppRegistry, user_id: int
+) -> None:
+    # Exactly at the deadline still belongs to the previous day
+    at_deadline = datetime(2023, 5, 9, 6, 0, 0)
+    after_deadline = datetime(2023, 5, 9, 6, 0, 1)
+    add_record(app, user_id, "Report Project", at_deadline, 60)
+    add_record(app, user_id, "Report Subproject", after_deadline, 120)
+    # Running record is counted up to now
+    add_record(app, user_id, "Other Project", datetime(2023, 5, 10, 11))
+
+    totals = TimeLog.get_day_totals(
+        app, user_id, date(2023, 5, 8), date(2023, 5, 14))
+    assert sorted(totals) == sorted([
+        ("Report Project",
+         get_day_regarding_deadline(app.config, at_deadline), 60),
+        ("Report Subproject",
+         get_day_regarding_deadline(app.config, after_deadline), 120),
+        ("Other Project", date(2023, 5, 10), 3600),
+    ])
+
+    totals = TimeLog.get_day_totals(
+        app, user_id, date(2023, 5, 8), date(2023, 5, 14), "Report Project")
+    assert {name for name, day, seconds in totals} == {
+        "Report Project", "Report Subproject"}
+
+
+def test_report(app: AppRegistry, user_id: int) -> None:
+    week = Report.get(app, user_id, 'week')
+    assert week.from_day == date(2023, 5, 8)
+    assert week.to_day == date(2023, 5, 14)
+    assert len(week.columns) == 7
+    assert week.rows["Report Project"][0] == 60
+    assert week.rows["Report Subproject"][1] == 120
+    assert week.column_totals[2] == 3600
+
+    year = Report.get(app, user_id, 'year')
+    assert len(year.columns) == 12
+    assert year.column_totals[4] == 60 + 120 + 3600
+    assert year.day_totals[date(2023, 5, 10)] == 3600
+
+
+def test_report_get_many(tmp_path) -> None:
+    config = Config()
+    # Worker processes open the database file read-only
+    config.database_uri = f"sqlite:///{tmp_path / 'report.sqlite3'}"
+    config.deadline_time = '06:00:00'
+    engine = create_engine(config.database_uri, future=True)
+    Base.metadata.create_all(engine)
+    app = AppRegistry(config, Session(engine), lambda: NOW)
+    app.session.add_all([User(id=1, name='User 1'), User(id=2, name='User 2')])
+    app.session.commit()
+    for user_id in (1, 2):
+        Project.add_new(app, user_id, "Project")
+        for month in range(1, 6):
+            add_record(
+                app, user_id, "Project",
+                datetime(2023, month, 28, 23, 0), 3600 * user_id)
+    add_record(app, 2, "Project", datetime(2023, 5, 10, 11))
+
+    reports = Report.get_many(app, [1, 2], 'year', workers=2)
+    for user_id in (1, 2):
+        assert reports[user_id] == Report.get(app, user_id, 'year')
+    assert reports[1].column_totals[:5] == [3600] * 5
+    assert reports[2].day_totals[date(2023, 5, 10)] == 3600
+    assert Report.get_many(app, [1, 2], 'week', workers=1) == {
+        user_id: Report.get(app, user_id, 'week') for user_id in (1, 2)}
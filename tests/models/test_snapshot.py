@@ -0,0 +1,101 @@
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog, TimeLogSnapshot
+
+
+@pytest.fixture(scope='module')
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    now = lambda: datetime(2023, 5, 10, 12, 0, 0)
+    return AppRegistry(config, session, now)
+
+
+@pytest.fixture(scope='module')
+def user_id(app: AppRegistry) -> int:
+    user = User(id=1, name='Test User')
+    app.session.add(user)
+    app.session.commit()
+    Project.add_new(app, user.id, "Snapshot Project 1")
+    Project.add_new(app, user.id, "Snapshot Project 2")
+    return user.id
+
+
+def add_record(
+    app: AppRegistry, user_id: int, project_id: int,
+    started_at: datetime, duration: int = None
+) -> None:
+    started_at = int(started_at.timestamp())
+    app.session.add(TimeLog(
+        user_id=user_id,
+        project_id=project_id,
+        started_at=started_at,
+        stoped_at=started_at + duration if duration else None,
+        duration=duration,
+    ))
+    app.session.commit()
+
+
+def test_build_incrementally(
+    app: AppRegistry, user_id: int, tmp_path: Path
+) -> None:
+    # Monday and tuesday
+    add_record(app, user_id, 1, datetime(2023, 5, 8, 10), 100)
+    add_record(app, user_id, 1, datetime(2023, 5, 8, 12), 300)
+    add_record(app, user_id, 2, datetime(2023, 5, 9, 10), 50)
+    add_record(app, user_id, 2, datetime(2023, 5, 10, 10))  # running
+
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 3
+    snapshot = TimeLogSnapshot(str(tmp_path))
+    assert len(snapshot) == 3
+    assert isinstance(snapshot.duration, np.memmap)
+    assert snapshot.total_by_project(user_id) == {
+        "Snapshot Project 1": 400,
+        "Snapshot Project 2": 50,
+    }
+    averages = snapshot.average_session_by_weekday(user_id)
+    assert averages["Snapshot Project 1"][0] == 200
+    assert averages["Snapshot Project 2"][1] == 50
+
+    # The running record is picked up once it's finished
+    TimeLog.stop_last_record(app, user_id)
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 1
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 0
+    snapshot = TimeLogSnapshot(str(tmp_path))
+    assert len(snapshot) == 4
+    assert list(snapshot.id) == sorted(snapshot.id)
+
+
+def test_build_with_running_record_of_another_user(
+    app: AppRegistry, user_id: int, tmp_path: Path
+) -> None:
+    app.session.add(User(id=2, name='Other User'))
+    app.session.commit()
+    project_id = Project.add_new(app, 2, "Other Snapshot Project")
+    TimeLogSnapshot.build(app, str(tmp_path))
+
+    # The other user's record keeps running while this user's get closed
+    add_record(app, 2, project_id, datetime(2023, 5, 10, 9))
+    add_record(app, user_id, 1, datetime(2023, 5, 10, 10), 60)
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 1
+    add_record(app, user_id, 1, datetime(2023, 5, 10, 11), 120)
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 1
+
+    TimeLog.stop_last_record(app, 2)
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 1
+    assert TimeLogSnapshot.build(app, str(tmp_path)) == 0
+    snapshot = TimeLogSnapshot(str(tmp_path))
+    assert sorted(snapshot.id) == list(range(1, len(snapshot) + 1))
+    assert snapshot.total_by_project(2) == {
+        "Other Snapshot Project": 3 * 3600}
@@ -0,0 +1,119 @@
+from datetime import datetime, date
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog
+from models.helper import get_day_regarding_deadline
+from tests.template import DatabaseTemplate
+
+
+@pytest.fixture(scope='module')
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    now = lambda: datetime.fromtimestamp(0)  # 1970-01-01
+    return AppRegistry(config, session, now)
+
+
+@pytest.fixture(scope='module')
+def user_id(app: AppRegistry) -> int:
+    user = User(id=1, name='Test User')
+    app.session.add(user)
+    app.session.commit()
+    Project.add_new(app, user.id, "Timelog Project 1")
+    Project.add_new(app, user.id, "Timelog Project 2")
+    return user.id
+
+
+def test_start_project(app: AppRegistry, user_id: int) -> None:
+    result = TimeLog.start_project(app, user_id, "Timelog Project 1")
+    assert result.started_project.name == "Timelog Project 1"
+    assert result.stoped_record is None
+
+    result = TimeLog.start_project(app, user_id, "Timelog Project 2")
+    assert result.started_project.name == "Timelog Project 2"
+    assert result.stoped_record.stoped_at is not None
+
+
+def test_get_record(app: AppRegistry, user_id: int) -> None:
+    last = TimeLog.get_record(app, user_id, "last")
+    penult = TimeLog.get_record(app, user_id, "penult")
+    assert last.id > penult.id
+    assert TimeLog.get_record(app, user_id, "-2").id == penult.id
+    assert TimeLog.get_record(app, user_id, str(last.id)).id == last.id
+    assert TimeLog.get_last_time_record(app, user_id, 100) is None
+
+
+def test_archive_records(
+    app: AppRegistry, user_id: int, tmp_path: Path
+) -> None:
+    app.config.archive_dir = str(tmp_path)
+    day = get_day_regarding_deadline(app.config, app.now())
+    totals_before = TimeLog.get_day_totals(app, user_id, day, day)
+
+    moved = TimeLog.archive_records(app, datetime.fromtimestamp(3600))
+    year = app.now().year
+    # The running record stays in the timelog table
+    assert moved == {year: 1}
+    assert (tmp_path / f"timelog_{year}.sqlite3").exists()
+    last = TimeLog.get_last_time_record(app, user_id)
+    assert last.stoped_at is None
+    assert TimeLog.get_last_time_record(app, user_id, 2) is None
+
+    # Reports read archived records transparently
+    assert TimeLog.get_day_totals(app, user_id, day, day) == totals_before
+    assert TimeLog.archive_records(app, datetime.fromtimestamp(3600)) == {}
+
+
+def test_range_totals(schema_template: DatabaseTemplate) -> None:
+    app = schema_template.clone(lambda: datetime(2023, 5, 3, 7))
+    Project.add_new(app, 1, "Range Project 1")
+    Project.add_new(app, 1, "Range Project 2")
+    project_1 = Project.get_by_name(app, 1, "Range Project 1")
+    project_2 = Project.get_by_name(app, 1, "Range Project 2")
+
+    def add_record(project, started_at, stoped_at=None):
+        started_at = int(started_at.timestamp())
+        if stoped_at is not None:
+            stoped_at = int(stoped_at.timestamp())
+        app.session.add(TimeLog(
+            user_id=1, project_id=project.id, started_at=started_at,
+            stoped_at=stoped_at,
+            duration=stoped_at - started_at if stoped_at else None))
+
+    # Started long before the range
+    add_record(project_2, datetime(2023, 4, 20, 12), datetime(2023, 5, 1, 10))
+    # Crosses the 06:00 deadline
+    add_record(project_1, datetime(2023, 5, 1, 22), datetime(2023, 5, 2, 8))
+    # Running since before the deadline
+    add_record(project_2, datetime(2023, 5, 3, 5))
+    app.session.commit()
+
+    hour = 3600
+    first, second, third = date(2023, 5, 1), date(2023, 5, 2), date(2023, 5, 3)
+    assert TimeLog.range_totals(app, 1, first, third) == {
+        first: 12 * hour, second: 3 * hour, third: hour}
+    assert TimeLog.range_totals(app, 1, first, third, 'project') == {
+        "Range Project 1": 10 * hour, "Range Project 2": 6 * hour}
+    assert TimeLog.range_totals(app, 1, first, third, 'project_day') == {
+        ("Range Project 1", first): 8 * hour,
+        ("Range Project 1", second): 2 * hour,
+        ("Range Project 2", first): 4 * hour,
+        ("Range Project 2", second): hour,
+        ("Range Project 2", third): hour,
+    }
+    assert TimeLog.range_totals(
+        app, 1, second, second, project_name="Range Project 1"
+    ) == {second: 2 * hour}
+    assert TimeLog.range_totals(app, 1, date(2023, 6, 1), date(2023, 6, 30)) \
+        == {}
+    with pytest.raises(ValueError):
+        TimeLog.range_totals(app, 1, first, third, 'week')
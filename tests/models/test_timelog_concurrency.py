@@ -0,0 +1,66 @@
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog
+
+
+PROCESSES = 8
+OPERATIONS = 25
+
+
+def make_app(database_uri: str) -> AppRegistry:
+    config = Config()
+    config.database_uri = database_uri
+    config.busy_retries = 20
+    engine = create_engine(config.database_uri, future=True)
+    session = Session(engine)
+    return AppRegistry(config, session, datetime.now)
+
+
+def hammer(database_uri: str, worker: int) -> None:
+    app = make_app(database_uri)
+    for i in range(OPERATIONS):
+        if i % 5 == 4:
+            TimeLog.stop_last_record(app, 1)
+        else:
+            TimeLog.start_project(
+                app, 1, f"project{(worker + i) % 3}", restart_anyway=True)
+    # Leave the timelog with one running project in any case
+    TimeLog.start_project(
+        app, 1, f"project{worker % 3}", restart_anyway=True)
+
+
+def test_concurrent_start_stop(tmp_path: Path) -> None:
+    database_uri = f"sqlite:///{tmp_path / 'db.sqlite3'}"
+    app = make_app(database_uri)
+    Base.metadata.create_all(app.session.get_bind())
+    app.session.add(User(id=1, name='Test User'))
+    app.session.commit()
+    for i in range(3):
+        Project.add_new(app, 1, f"project{i}")
+
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=hammer, args=(database_uri, worker))
+        for worker in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # No worker failed with SQLITE_BUSY
+    assert all(process.exitcode == 0 for process in processes)
+
+    open_records = app.session.execute(
+        select(func.count()).where(TimeLog.stoped_at.is_(None))
+    ).scalar_one()
+    assert open_records == 1
+    # Every start added its record, none was lost
+    records = app.session.execute(
+        select(func.count()).select_from(TimeLog)).scalar_one()
+    assert records == PROCESSES * (OPERATIONS - OPERATIONS // 5 + 1)
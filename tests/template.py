@@ -0,0 +1,163 @@
+"""
+Template databases for tests and benchmarks: a database is built and
+populated once, kept as the bytes of sqlite3's serialize(), and cloned into
+new in-memory connections with deserialize() in milliseconds.
+"""
+import copy
+import random
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Callable
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from config import Config
+from models import Base, User, Project, TimeLog, Goal, GoalType, Commitment
+from app_registry import AppRegistry
+
+
+# Sample data ends at that time by default
+SAMPLE_UNTIL = datetime(2023, 6, 1)
+
+
+def create_memory_app(
+    config: Config,
+    connection: sqlite3.Connection,
+    now: Callable[[], datetime],
+) -> AppRegistry:
+    """Create a registry of an engine always using the given connection."""
+    engine = create_engine(
+        'sqlite://',
+        creator=lambda: connection,
+        poolclass=StaticPool,
+        future=True,
+        query_cache_size=config.query_cache_size,
+    )
+    return AppRegistry(config, Session(engine), now)
+
+
+class DatabaseTemplate:
+    """
+    Example:
+    template = DatabaseTemplate.build(
+        lambda app: populate_sample_data(app, users=3))
+    app = template.clone()  # a fresh copy for every test
+    ...
+    template.restore(app)  # back to the template between iterations
+    """
+
+    def __init__(self, data: bytes, config: Config = None):
+        self.data = data
+        self.config = config or Config()
+
+    @classmethod
+    def build(
+        cls,
+        populate: Callable[[AppRegistry], None] = None,
+        config: Config = None,
+        now: Callable[[], datetime] = datetime.now,
+    ) -> 'DatabaseTemplate':
+        """
+        Create the schema of the models and populate it. The config is
+        copied, the given one is left as it is.
+        """
+        config = copy.copy(config) if config else Config()
+        config.database_uri = 'sqlite://'
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        app = create_memory_app(config, connection, now)
+        Base.metadata.create_all(app.session.get_bind())
+        if populate is not None:
+            populate(app)
+        app.session.commit()
+        app.session.close()
+        return cls(connection.serialize(), config)
+
+    def clone(
+        self,
+        now: Callable[[], datetime] = datetime.now,
+        foreign_keys: bool = True,
+    ) -> AppRegistry:
+        """Get a registry of a new in-memory copy of the template."""
+        connection = sqlite3.connect(':memory:', check_same_thread=False)
+        connection.deserialize(self.data)
+        if foreign_keys:
+            connection.execute("PRAGMA foreign_keys = ON")
+        return create_memory_app(self.config, connection, now)
+
+    def restore(self, app: AppRegistry) -> None:
+        """
+        Bring a clone back to the state of the template. The engine and the
+        session are kept, so are their caches of compiled statements.
+        """
+        app.session.rollback()
+        app.session.expunge_all()
+        connection = app.session.connection().connection.driver_connection
+        app.session.rollback()
+        connection.deserialize(self.data)
+
+
+def populate_sample_data(
+    app: AppRegistry,
+    users: int = 2,
+    projects: int = 20,
+    days: int = 365,
+    records_per_day: int = 8,
+    until: datetime = SAMPLE_UNTIL,
+    seed: int = 1,
+) -> None:
+    """
+    Add users with root projects and a subproject of each, a goal with
+    weekday commitments, and days of finished records before until
+    (records_per_day spread over 8:00-20:00). Deterministic by seed.
+    Goals are created at app.now(), build the template with now=until.
+    """
+    rng = random.Random(seed)
+    start = until - timedelta(days=days)
+    created_at = int(start.timestamp())
+    project_id = 0
+    user_projects = {}
+    project_rows = []
+    app.session.execute(insert(User.__table__), [
+        {'id': user_id, 'name': f"user{user_id}"}
+        for user_id in range(1, users + 1)
+    ])
+    for user_id in range(1, users + 1):
+        for i in range(projects):
+            project_id += 1
+            parent_id = project_id
+            project_rows.append({
+                'id': project_id, 'user_id': user_id, 'parent_id': None,
+                'name': f"project{i}", 'created_at': created_at,
+            })
+            project_id += 1
+            project_rows.append({
+                'id': project_id, 'user_id': user_id, 'parent_id': parent_id,
+                'name': f"project{i}.1", 'created_at': created_at,
+            })
+            user_projects.setdefault(user_id, []).extend(
+                [parent_id, project_id])
+    app.session.execute(insert(Project.__table__), project_rows)
+
+    slot = 12 * 3600 // records_per_day
+    timelog_rows = []
+    for user_id, project_ids in user_projects.items():
+        for day in range(days):
+            day_start = start + timedelta(days=day, hours=8)
+            for i in range(records_per_day):
+                started_at = int(day_start.timestamp()) + i * slot
+                duration = rng.randrange(slot // 4, slot)
+                timelog_rows.append({
+                    'user_id': user_id,
+                    'project_id': rng.choice(project_ids),
+                    'started_at': started_at,
+                    'stoped_at': started_at + duration,
+                    'duration': duration,
+                    'comment': None,
+                })
+    app.session.execute(insert(TimeLog.__table__), timelog_rows)
+    app.session.commit()
+
+    for user_id in user_projects:
+        Goal.add_new(
+            app, user_id, "project0", "Mandatory", GoalType.HOURS_MANDATORY)
+        Commitment.set_hours_per_day(app, user_id, "Mandatory", 4, "1-5")
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app_registry import AppRegistry, create_app
+from config import Config
+from models import Base, User, Project, TimeLog
+
+
+@pytest.fixture
+def app(tmp_path) -> AppRegistry:
+    config = Config()
+    config.database_uri = f"sqlite:///{tmp_path / 'db.sqlite3'}"
+    config.journal_mode = 'wal'
+    config.read_pool_size = 2
+    config.busy_retries = 0
+    app = create_app(config)
+    Base.metadata.create_all(app.session.get_bind())
+    app.session.add(User(id=1, name='Test User'))
+    app.session.commit()
+    Project.add_new(app, 1, "Registry Project")
+    yield app
+    app.reader.session.close()
+    app.session.close()
+
+
+def test_reader(app: AppRegistry) -> None:
+    reader = app.for_reading()
+    assert reader is app.reader
+    assert app.session.execute(
+        text("PRAGMA journal_mode")).scalar_one() == 'wal'
+    assert Project.find_by_name(reader, 1, "Reg") == ["Registry Project"]
+    reader.session.add(Project(
+        user_id=1, name="Read-only Project", created_at=0))
+    with pytest.raises(OperationalError, match="readonly"):
+        reader.session.commit()
+    reader.session.rollback()
+
+
+def test_reader_doesnt_block_writer(app: AppRegistry) -> None:
+    reader = app.for_reading()
+    # A long read transaction holds its snapshot, the writer commits anyway
+    reader.session.execute(text("BEGIN"))
+    assert TimeLog.get_timelog(reader, 1) == []
+    TimeLog.start_project(app, 1, "Registry Project")
+    TimeLog.stop_last_record(app, 1)
+    assert TimeLog.get_timelog(reader, 1) == []
+    reader.session.execute(text("COMMIT"))
+
+    # The next read sees the commits
+    reader.session.close()
+    assert len(TimeLog.get_timelog(reader, 1)) == 1
+
+
+def test_no_reader() -> None:
+    config = Config()
+    config.database_uri = 'sqlite://'
+    app = create_app(config)
+    assert app.reader is None
+    assert app.for_reading() is app
+
+    config.database_uri = 'sqlite:///db.sqlite3'
+    config.journal_mode = 'fast'
+    with pytest.raises(ValueError):
+        create_app(config)
@@ -0,0 +1,80 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import (
+    Base, User, Project, TimeLog, Goal, GoalType, Commitment, GoalFailure
+)
+from scheduler import Scheduler, DEADLINE, MUST_START, RUNNING_TOO_LONG
+
+
+@pytest.fixture
+def app() -> AppRegistry:
+    config = Config()
+    config.database_uri = 'sqlite:///:memory:'
+    config.deadline_time = '06:00:00'
+    config.alert_lead = 900
+    config.running_alert_after = 7200
+    engine = create_engine(config.database_uri, future=True)
+    with engine.connect() as con:
+        con.execute(text("PRAGMA foreign_keys = ON;"))
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(config, session, None)
+    app.now = lambda: datetime(2023, 5, 1, 12, 0, 0)  # Monday
+    app.session.add(User(id=1, name='Test User'))
+    app.session.commit()
+    Project.add_new(app, 1, "Scheduled Project")
+    Goal.add_new(
+        app, 1, "Scheduled Project", "Mandatory", GoalType.HOURS_MANDATORY)
+    Commitment.set_hours_per_day(app, 1, "Mandatory", 2, "1-5")
+    return app
+
+
+def live_events(scheduler: Scheduler) -> list[tuple]:
+    return [
+        (event.kind, event.at) for event in sorted(scheduler.heap)
+        if not scheduler.is_stale(event)
+    ]
+
+
+def test_scheduler(app: AppRegistry) -> None:
+    alerts = []
+    scheduler = Scheduler(app, alert=alerts.append)
+    assert scheduler.run_pending() == app.config.scheduler_poll
+    assert live_events(scheduler) == [
+        (MUST_START, datetime(2023, 5, 2, 3, 45)),
+        (DEADLINE, datetime(2023, 5, 2, 6, 0, 1)),
+    ]
+
+    app.now = lambda: datetime(2023, 5, 2, 3, 50)
+    scheduler.run_pending()
+    scheduler.run_pending()
+    assert alerts == [
+        "Start working on 'Mandatory' by 04:00: 2:00 due before 06:00"]
+
+    # Only the changed user is recomputed, the goal is being worked on
+    app.now = lambda: datetime(2023, 5, 2, 3, 55)
+    TimeLog.start_project(app, 1, "Scheduled Project")
+    scheduler.run_pending()
+    assert live_events(scheduler) == [
+        (RUNNING_TOO_LONG, datetime(2023, 5, 2, 5, 55)),
+        (DEADLINE, datetime(2023, 5, 2, 6, 0, 1)),
+    ]
+
+    # The rollover evaluates the closed day and schedules the next one
+    app.now = lambda: datetime(2023, 5, 2, 6, 0, 5)
+    assert scheduler.run_pending() == app.config.scheduler_poll
+    assert alerts[1] == "'Scheduled Project' is running for more than 2:00"
+    assert (DEADLINE, datetime(2023, 5, 3, 6, 0, 1)) in live_events(scheduler)
+    assert GoalFailure.get_failures(app, 1) == []
+
+    # The alert of the running record is kept until it's stopped
+    assert (1, (RUNNING_TOO_LONG, 1)) in scheduler.alerted
+    app.now = lambda: datetime(2023, 5, 2, 7)
+    TimeLog.stop_last_record(app, 1)
+    scheduler.run_pending()
+    assert not any(
+        key[0] == RUNNING_TOO_LONG for _, key in scheduler.alerted)
@@ -0,0 +1,121 @@
+import os
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app_registry import AppRegistry
+from config import Config
+from models import Base, User, Project, TimeLog, SchemaVersion
+from models.helper import begin_immediate
+from scheduler import Scheduler
+from shards import ShardPool, get_shard_path
+
+
+@pytest.fixture
+def app(tmp_path) -> AppRegistry:
+    config = Config()
+    config.database_uri = f"sqlite:///{tmp_path / 'catalog.sqlite3'}"
+    config.shard_dir = str(tmp_path / 'shards')
+    config.shard_pool_size = 2
+    engine = create_engine(config.database_uri, future=True)
+    Base.metadata.create_all(engine)
+    session = Session(engine)
+    app = AppRegistry(
+        config, session, lambda: datetime(2023, 5, 1, 12, 0, 0))
+    app.shards = ShardPool(app)
+    app.session.add_all([
+        User(id=1, name='User 1'),
+        User(id=2, name='User 2'),
+        User(id=3, name='User 3'),
+    ])
+    app.session.commit()
+    yield app
+    app.shards.close()
+
+
+def test_for_user(app: AppRegistry) -> None:
+    user_app = app.for_user(1)
+    assert os.path.exists(get_shard_path(app.config, 1))
+    assert user_app.session.get(User, 1).name == 'User 1'
+    assert user_app.session.execute(
+        select(SchemaVersion.version)).scalars().all() != []
+    Project.add_new(user_app, 1, "User 1 Project")
+    TimeLog.start_project(user_app, 1, "User 1 Project")
+    assert app.for_user(1) is user_app
+
+    # Rows of other users aren't there
+    other_app = app.for_user(2)
+    assert other_app.session.execute(select(Project)).all() == []
+    assert app.session.execute(select(Project)).all() == []
+
+    # The least recently used shard is closed when the pool is full
+    app.for_user(3)
+    assert list(app.shards.apps) == [2, 3]
+    reopened_app = app.for_user(1)
+    assert reopened_app is not user_app
+    assert TimeLog.get_last_time_record(reopened_app, 1).stoped_at is None
+
+    with pytest.raises(ValueError):
+        app.for_user(4)
+
+    # Without sharding every user is in the same database
+    shards, app.shards = app.shards, None
+    assert app.for_user(1) is app
+    app.shards = shards
+
+
+def test_parallel_writers(app: AppRegistry) -> None:
+    app_1 = app.for_user(1)
+    app_2 = app.for_user(2)
+    Project.add_new(app_2, 2, "User 2 Project")
+    # User 1's write lock doesn't keep user 2 waiting
+    begin_immediate(app_1)
+    app.config.busy_retries = 0
+    TimeLog.start_project(app_2, 2, "User 2 Project")
+    app_1.session.rollback()
+
+
+def test_map(app: AppRegistry) -> None:
+    for user_id in (1, 2, 3):
+        user_app = app.for_user(user_id)
+        Project.add_new(user_app, user_id, f"Project {user_id}")
+        Project.add_new(user_app, user_id, f"Project {user_id}.2")
+
+    assert app.shards.map(
+        lambda user_app, user_id: [
+            project.name for project in Project.get_root_projects(
+                user_app, user_id)
+        ]
+    ) == {
+        1: ["Project 1", "Project 1.2"],
+        2: ["Project 2", "Project 2.2"],
+        3: ["Project 3", "Project 3.2"],
+    }
+
+
+def test_scheduler_follows_shard_journals(app: AppRegistry) -> None:
+    scheduler = Scheduler(app, alert=lambda message: None)
+    assert scheduler.get_changed_users() == {1, 2, 3}
+    assert scheduler.get_changed_users() == set()
+    Project.add_new(app.for_user(2), 2, "Scheduled Project")
+    assert scheduler.get_changed_users() == {2}
+    scheduler.run_pending()
+    assert scheduler.get_changed_users() == set()
+
+
+def test_scheduler_opens_only_changed_shards(
+    app: AppRegistry, monkeypatch
+) -> None:
+    scheduler = Scheduler(app, alert=lambda message: None)
+    assert scheduler.get_changed_users() == {1, 2, 3}
+    opened = []
+    get_app = app.shards.get_app
+    monkeypatch.setattr(
+        app.shards, 'get_app',
+        lambda user_id: opened.append(user_id) or get_app(user_id))
+
+    assert scheduler.get_changed_users() == set()
+    assert opened == []
+    Project.add_new(get_app(1), 1, "Changed Project")
+    assert scheduler.get_changed_users() == {1}
+    assert opened == [1]
@@ -0,0 +1,49 @@
+from sqlalchemy import select, delete, func, text
+from app_registry import AppRegistry
+from config import Config
+from models import Project, TimeLog, Goal, Report
+from tests.template import DatabaseTemplate, SAMPLE_UNTIL
+
+
+def count_records(app: AppRegistry) -> int:
+    return app.session.execute(
+        select(func.count()).select_from(TimeLog)).scalar_one()
+
+
+def test_clones_are_independent(sample_template: DatabaseTemplate) -> None:
+    app = sample_template.clone(lambda: SAMPLE_UNTIL)
+    other_app = sample_template.clone(lambda: SAMPLE_UNTIL)
+    assert count_records(app) == 2 * 365 * 8
+    assert app.session.execute(text("PRAGMA foreign_keys")).scalar() == 1
+
+    app.session.execute(delete(TimeLog).where(TimeLog.user_id == 1))
+    app.session.commit()
+    assert count_records(app) == 365 * 8
+    assert count_records(other_app) == 2 * 365 * 8
+
+
+def test_restore(sample_template: DatabaseTemplate) -> None:
+    app = sample_template.clone(lambda: SAMPLE_UNTIL)
+    Project.add_new(app, 1, "Restored Project")
+    TimeLog.start_project(app, 1, "Restored Project")
+    sample_template.restore(app)
+    assert count_records(app) == 2 * 365 * 8
+    assert Project.find_by_name(app, 1, "Restored") == []
+    assert app.session.execute(select(Goal.name)).scalars().all() == [
+        "Mandatory", "Mandatory"]
+
+
+def test_sample_data(sample_template: DatabaseTemplate) -> None:
+    app = sample_template.clone(lambda: SAMPLE_UNTIL)
+    year = Report.get(app, 2, 'year')
+    assert len(year.rows) == 40
+    assert sum(year.column_totals[:5]) > 0
+    assert year.column_totals[6:] == [0] * 6
+
+
+def test_build_keeps_config() -> None:
+    config = Config()
+    config.database_uri = 'sqlite:///db.sqlite3'
+    template = DatabaseTemplate.build(config=config)
+    assert config.database_uri == 'sqlite:///db.sqlite3'
+    assert template.config.database_uri == 'sqlite://'